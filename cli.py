@@ -0,0 +1,188 @@
+# Command line entry point for evaluations
+#
+#   python cli.py eval --experiment "ZeroTheta Eval" --set STOP_LOSS=1.5 --set TAKE_PROFIT=3
+#   python cli.py by-day --date 2025-01-08 --set START_TIME=15:00
+#   python cli.py by-month --year 2025 --month 1
+#   python cli.py sweep --experiment "ZeroTheta Spread Width" --widths 50 100 150
+#   python cli.py serve    # keeps days in memory for 'by-day --remote', see eval_server.py
+#
+# Heavy dependencies (mlflow, plotly, polygon, the evaluation modules) are imported only by the
+# subcommand that needs them, so e.g. a one-day check does not pay for mlflow.
+import ast
+import sys
+import time
+import argparse
+from datetime import datetime
+
+START = time.perf_counter()
+
+
+def parse_overrides(overrides):
+    """
+    Parses '--set KEY=VALUE' overrides of eval_config. Values are read as python literals
+    (e.g. 1.5, True, "15:00"), anything else is kept as a string.
+
+    Returns:
+        Dictionary, eval_config attribute -> value
+    """
+    values = {}
+    for override in overrides:
+        key, separator, value = override.partition("=")
+        if not separator or not key.strip():
+            raise ValueError(f"Invalid override '{override}', expected KEY=VALUE.")
+        try:
+            values[key.strip()] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            values[key.strip()] = value
+    return values
+
+
+def apply_overrides(config, values):
+    """
+    Sets the overrides on the eval_config module. 'STRATEGY' is given as the name of a strategy class
+    in strategies/strategies.py.
+    """
+    for key, value in values.items():
+        if not hasattr(config, key):
+            raise ValueError(f"Unknown eval_config setting '{key}'.")
+        if key == "STRATEGY":
+            import strategies.strategies as strategies
+            value = getattr(strategies, value)()
+        setattr(config, key, value)
+
+
+def report_startup():
+    """Prints the time from the start of the cli to the start of the command, including its imports."""
+    print(f"Startup: {time.perf_counter() - START:.2f}s")
+
+
+def run_eval(args):
+    from eval_functions import run_total_eval
+    report_startup()
+    run_name = args.run_name or f"run_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}"
+    metrics = run_total_eval(experiment_name=args.experiment, run_name=run_name, quicktest=args.quicktest, offline=args.offline,
+                             processes=args.processes, checkpoint_path=args.checkpoints, robustness_resamples=args.robustness)
+    print(metrics)
+
+
+def run_by_day(args):
+    if args.remote:
+        from eval_server import request
+        report_startup()
+        response = request({"date": args.date, "params": args.override_values}, socket_path=args.socket)
+        print(response["report_metrics"])
+        for trade in response["trades"]:
+            print(f"Trade profit: {trade['profit']}")
+        print(f"Total combined profit: {response['total_profit']}")
+        print("Server timings: " + ", ".join(f"{name} {seconds * 1000:.1f}ms" for name, seconds in response["timings"].items()))
+        return
+
+    from eval_by_day import eval_by_day
+    report_startup()
+    target_date = datetime.strptime(args.date, "%Y-%m-%d").date() if args.date else None
+    eval_by_day(target_date, plot=args.plot)
+
+
+def run_by_month(args):
+    from eval_by_month import eval_by_month
+    report_startup()
+    eval_by_month(args.year, args.month, experiment_name=args.experiment, offline=args.offline)
+
+
+def run_sweep(args):
+    from eval_functions import run_spread_width_sweep
+    report_startup()
+    run_name = args.run_name or f"spread_widths_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}"
+    results = run_spread_width_sweep(args.experiment, args.widths, run_name=run_name, quicktest=args.quicktest, offline=args.offline,
+                                     processes=args.processes, checkpoint_path=args.checkpoints)
+    for width, metrics in results.items():
+        print(f"Spread width {width}: {metrics}")
+
+
+def run_serve(args):
+    from eval_server import serve
+    report_startup()
+    serve(args.socket, args.cached_days)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Evaluate strategies with the settings of eval_config.")
+    config = argparse.ArgumentParser(add_help=False)
+    config.add_argument("--set", dest="overrides", action="append", default=[], metavar="KEY=VALUE",
+                        help="override a setting of eval_config, e.g. --set STOP_LOSS=1.5 (repeatable)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("eval", parents=[config], help="evaluate on all monthly index files and log to mlflow")
+    command.add_argument("--experiment", default="ZeroTheta Eval")
+    command.add_argument("--run-name")
+    command.add_argument("--quicktest", action="store_true")
+    command.add_argument("--offline", action="store_true", default=None, help="log to the local file store 'mlruns'")
+    command.add_argument("--processes", type=int, help="evaluate the months in parallel, with the data in shared memory")
+    command.add_argument("--checkpoints", metavar="PATH", help="checkpoint database, unchanged months are not evaluated again")
+    command.add_argument("--robustness", type=int, metavar="N", help="log bootstrap confidence intervals from N resamples")
+    command.set_defaults(run=run_eval)
+
+    command = commands.add_parser("by-day", parents=[config], help="evaluate a single day and print the trades")
+    command.add_argument("--date", help="YYYY-MM-DD, defaults to YEAR, MONTH, DAY of eval_config")
+    command.add_argument("--plot", action="store_true", help="plot the entry signals")
+    command.add_argument("--remote", action="store_true", help="evaluate on a running evaluation server (see 'serve')")
+    command.add_argument("--socket", default=None, help="socket of the evaluation server")
+    command.set_defaults(run=run_by_day)
+
+    command = commands.add_parser("by-month", parents=[config], help="evaluate a single month and log to mlflow")
+    command.add_argument("--year", type=int)
+    command.add_argument("--month", type=int)
+    command.add_argument("--experiment", default="ZeroTheta Eval By Month")
+    command.add_argument("--offline", action="store_true", default=None)
+    command.set_defaults(run=run_by_month)
+
+    command = commands.add_parser("sweep", parents=[config], help="evaluate several spread widths in one pass over the data")
+    command.add_argument("--experiment", default="ZeroTheta Spread Width")
+    command.add_argument("--widths", type=int, nargs="+", required=True, help="spread widths in the scale of the data")
+    command.add_argument("--run-name")
+    command.add_argument("--quicktest", action="store_true")
+    command.add_argument("--offline", action="store_true", default=None)
+    command.add_argument("--processes", type=int, help="evaluate the months in parallel, with the data in shared memory")
+    command.add_argument("--checkpoints", metavar="PATH", help="checkpoint database, unchanged months are not evaluated again")
+    command.set_defaults(run=run_sweep)
+
+    command = commands.add_parser("serve", parents=[config], help="run the evaluation server for 'by-day --remote'")
+    command.add_argument("--socket", default=None, help="socket path of the server")
+    command.add_argument("--cached-days", type=int, default=32, help="number of days kept in memory")
+    command.set_defaults(run=run_serve)
+
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    try:
+        args.override_values = parse_overrides(args.overrides)
+    except ValueError as e:
+        parser.error(str(e))
+    if getattr(args, "socket", "") is None:
+        from eval_server import SOCKET_PATH
+        args.socket = SOCKET_PATH
+    if getattr(args, "remote", False):
+        # the settings are applied by the server
+        args.run(args)
+        return
+
+    # overrides are applied before the evaluation modules are imported, since their default
+    # arguments are read from eval_config at import time
+    import eval_config
+    try:
+        apply_overrides(eval_config, args.override_values)
+    except (ValueError, AttributeError) as e:
+        parser.error(str(e))
+    if getattr(args, "offline", False) is None:
+        args.offline = eval_config.MLFLOW_OFFLINE
+
+    args.run(args)
+    print(f"Finished '{args.command}' in {time.perf_counter() - START:.2f}s")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
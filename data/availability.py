@@ -0,0 +1,180 @@
+# Per day index of which 0dte contracts have bars, built at ingest
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from utils.options_helper import OPTIONS_DIR, UNDERLYING_PRICE_SCALE, get_options_file_path, calculate_spread_strike_prices
+from utils.contract_codec import decode_contracts, STRIKE_BITS, RIGHT_SHIFT
+
+NO_BARS = -1
+
+
+def get_availability_path(date, underlying, options_dir=OPTIONS_DIR):
+    """Returns the path of the availability file of a day, next to the underlying's partition file."""
+    return get_options_file_path(date, underlying, options_dir).with_suffix(".availability.npz")
+
+
+class DayAvailability:
+    """
+    Which 0dte contracts of a day have bars and when: for the listed strikes (sorted, in cents) one bit
+    per right (row 0 puts, row 1 calls) and the first and last minute with a bar (UTC nanoseconds).
+    Answers "can this leg be priced in this time window" in O(log n) without touching option data.
+    """
+    def __init__(self, strike_cents, has_bars, first_minute, last_minute):
+        self.strike_cents = np.asarray(strike_cents, dtype=np.int64)
+        self.has_bars = np.asarray(has_bars, dtype=bool).reshape(2, -1)
+        self.first_minute = np.asarray(first_minute, dtype=np.int64).reshape(2, -1)
+        self.last_minute = np.asarray(last_minute, dtype=np.int64).reshape(2, -1)
+
+    def available(self, option_type, strike_price, price_scale=1, start_ns=None, end_ns=None):
+        """
+        Returns True if the contract has bars within [start_ns, end_ns] (the whole day by default),
+        judged by its first and last bar. False means that the contract certainly has no data in the window.
+
+        Params:
+            option_type: 'C' / 'Bear Call' or 'P' / 'Bull Put'
+            strike_price: strike price in the scale of the data (see UNDERLYING_PRICE_SCALE)
+        """
+        right = 1 if option_type in ("C", "Bear Call") else 0
+        strike = round(strike_price / price_scale * 100)
+        position = np.searchsorted(self.strike_cents, strike)
+        if position >= len(self.strike_cents) or self.strike_cents[position] != strike or not self.has_bars[right, position]:
+            return False
+        if start_ns is not None and self.last_minute[right, position] < start_ns:
+            return False
+        if end_ns is not None and self.first_minute[right, position] > end_ns:
+            return False
+        return True
+
+    def summary(self):
+        """Number of listed strikes per right, strike range and first / last bar of the day."""
+        listed = self.strike_cents[self.has_bars.any(axis=0)]
+        first = self.first_minute[self.has_bars]
+        last = self.last_minute[self.has_bars]
+        return {
+            "puts": int(self.has_bars[0].sum()),
+            "calls": int(self.has_bars[1].sum()),
+            "min_strike": listed.min() / 100 if len(listed) else np.nan,
+            "max_strike": listed.max() / 100 if len(listed) else np.nan,
+            "first_bar": pd.Timestamp(first.min(), tz="UTC") if len(first) else pd.NaT,
+            "last_bar": pd.Timestamp(last.max(), tz="UTC") if len(last) else pd.NaT
+        }
+
+    def save(self, path):
+        np.savez_compressed(path, strike_cents=self.strike_cents, bits=np.packbits(self.has_bars, axis=1),
+                            first_minute=self.first_minute, last_minute=self.last_minute)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            strike_cents = data["strike_cents"]
+            has_bars = np.unpackbits(data["bits"], axis=1, count=len(strike_cents)).astype(bool)
+            return cls(strike_cents, has_bars, data["first_minute"], data["last_minute"])
+
+
+class AvailabilityBuilder:
+    """
+    Collects the first and last minute of every 0dte contract chunk by chunk (see 'ingest_day_file').
+
+    Params:
+        date: day of the data, only contracts that expire on this day are recorded
+    """
+    def __init__(self, date):
+        self.expiry = np.datetime64(pd.Timestamp(date).date(), "D")
+        self.first = {}  # contract key -> first minute
+        self.last = {}
+
+    def update(self, contracts, minutes):
+        """
+        Params:
+            contracts: contract keys of the rows
+            minutes: bar times of the rows as UTC nanoseconds
+        """
+        bars = pd.DataFrame({"contract": contracts, "minute": minutes}).groupby("contract")["minute"].agg(["min", "max"])
+        is_0dte = (decode_contracts(bars.index.to_numpy())["expiry"] == self.expiry).to_numpy()
+        for contract, first, last in zip(bars.index[is_0dte], bars["min"][is_0dte], bars["max"][is_0dte]):
+            self.first[contract] = min(first, self.first.get(contract, first))
+            self.last[contract] = max(last, self.last.get(contract, last))
+
+    def build(self):
+        contracts = np.fromiter(self.first.keys(), dtype=np.int64, count=len(self.first))
+        strikes = contracts & ((1 << STRIKE_BITS) - 1)
+        rights = (contracts >> RIGHT_SHIFT) & 1
+
+        strike_cents = np.unique(strikes)
+        columns = np.searchsorted(strike_cents, strikes)
+        has_bars = np.zeros((2, len(strike_cents)), dtype=bool)
+        first_minute = np.full((2, len(strike_cents)), NO_BARS, dtype=np.int64)
+        last_minute = np.full((2, len(strike_cents)), NO_BARS, dtype=np.int64)
+
+        has_bars[rights, columns] = True
+        first_minute[rights, columns] = [self.first[c] for c in contracts]
+        last_minute[rights, columns] = [self.last[c] for c in contracts]
+        return DayAvailability(strike_cents, has_bars, first_minute, last_minute)
+
+
+def availability_from_options(date, options_df):
+    """
+    Builds the availability of a day from loaded options data (format of 'load_options_from_file').
+    """
+    builder = AvailabilityBuilder(date)
+    builder.update(options_df["contract"].to_numpy(), options_df["Datetime"].to_numpy(dtype="datetime64[ns]").astype(np.int64))
+    return builder.build()
+
+
+def load_availability(date, underlying, options_dir=OPTIONS_DIR):
+    """Returns the 'DayAvailability' of a day, or None if it has not been built."""
+    path = get_availability_path(date, underlying, options_dir)
+    if not path.exists():
+        return None
+    return DayAvailability.load(path)
+
+
+def availability_report(year, month, underlying="SPY", index_df=None, spread_width=20, options_dir=OPTIONS_DIR,
+                        enforce_ITM=False, middle_ITM=False, enforce_OTM=True):
+    """
+    Reports the availability of 0dte options per day of a month from the availability files only,
+    without loading option data or running the simulation.
+
+    Params:
+        index_df: optional index data of the month ('Datetime', 'Close'). If given, the share of index
+            bars for which both legs of the bull put and bear call spread (see 'calculate_spread_strike_prices')
+            have bars at or after that minute is reported as well.
+
+    Returns:
+        DataFrame with one row per day that has an availability file
+    """
+    month_dir = Path(options_dir) / f"{year}-{month:02d}" / underlying
+    price_scale = UNDERLYING_PRICE_SCALE.get(underlying, 1)
+    if index_df is not None:
+        index_times = pd.to_datetime(index_df["Datetime"], utc=True)
+        index_df = index_df.assign(day=index_df["Datetime"].astype(str).str[:10], minute=index_times.astype("int64").to_numpy())
+
+    rows = []
+    for path in sorted(month_dir.glob("*.availability.npz")):
+        day = path.name.split(".")[0]
+        availability = DayAvailability.load(path)
+        row = {"date": day, **availability.summary()}
+
+        if index_df is not None:
+            bars = index_df[index_df["day"] == day]
+            for spread_type, option_type in (("Bull Put", "P"), ("Bear Call", "C")):
+                available = [
+                    all(availability.available(option_type, strike, price_scale, start_ns=minute)
+                        for strike in calculate_spread_strike_prices(close, spread_type, spread_width, enforce_ITM, middle_ITM, enforce_OTM))
+                    for close, minute in zip(bars["Close"], bars["minute"])
+                ]
+                row[f"{spread_type.lower().replace(' ', '_')}_availability"] = np.mean(available) if available else np.nan
+        rows.append(row)
+
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    # build the availability files of days that were ingested before availability files existed
+    from data.sources import FileSource
+    source = FileSource()
+    for path in sorted(Path(OPTIONS_DIR).glob("*/*/*.csv")):
+        date, underlying = pd.Timestamp(path.stem).date(), path.parent.name
+        df = source.load_options(date, [underlying])[underlying]
+        availability_from_options(date, df).save(get_availability_path(date, underlying))
+        print("saved: ", get_availability_path(date, underlying))
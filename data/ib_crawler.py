@@ -1,13 +1,186 @@
+import os
 import json
+import math
+import time
+import asyncio
+import pandas as pd
+from collections import deque
+from contextlib import asynccontextmanager
 from ib_insync import IB, Future, Index, util
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+
+"""Root directory of the backfilled bars, '<IB_STORE_DIR>/<name>/<bar size>/<YYYY-MM>.csv'."""
+IB_STORE_DIR = "dev/data/ib"
+
+"""
+Longest duration (in days) that is requested at once per bar size. Longer date ranges are split
+into chunks of this length.
+"""
+MAX_CHUNK_DAYS = {
+    "1 min": 7,
+    "2 mins": 14,
+    "3 mins": 14,
+    "5 mins": 30,
+    "15 mins": 30,
+    "30 mins": 30,
+    "1 hour": 30,
+    "1 day": 365
+}
+
+
+class PacingLimiter:
+    """
+    Schedules historical data requests under the pacing limits of the TWS API:
+        - at most 'max_requests' requests in any 'period' seconds (60 per 10 minutes)
+        - at most 'max_per_contract' requests for the same contract in 'contract_period' seconds
+          (six or more within two seconds are a violation)
+        - no identical request within 'identical_period' seconds
+        - at most 'max_concurrent' requests open at the same time
+    Requests wait (asyncio.sleep) until they can be sent without a violation.
+    """
+    def __init__(self, max_requests=60, period=600, max_per_contract=5, contract_period=2,
+                 identical_period=15, max_concurrent=50, clock=time.monotonic):
+        self.max_requests = max_requests
+        self.period = period
+        self.max_per_contract = max_per_contract
+        self.contract_period = contract_period
+        self.identical_period = identical_period
+        self.clock = clock
+        self.max_concurrent = max_concurrent
+        self.semaphore = None  # created in the event loop of the requests
+        self.loop = None
+        self.sent = deque()  # send times of all requests
+        self.sent_per_contract = {}  # contract key -> deque of send times
+        self.last_identical = {}  # request key -> last send time
+
+    def _wait_time(self, contract_key, request_key):
+        now = self.clock()
+        while self.sent and self.sent[0] <= now - self.period:
+            self.sent.popleft()
+        per_contract = self.sent_per_contract.setdefault(contract_key, deque())
+        while per_contract and per_contract[0] <= now - self.contract_period:
+            per_contract.popleft()
+
+        wait = 0.0
+        if len(self.sent) >= self.max_requests:
+            wait = max(wait, self.sent[0] + self.period - now)
+        if len(per_contract) >= self.max_per_contract:
+            wait = max(wait, per_contract[0] + self.contract_period - now)
+        if request_key in self.last_identical:
+            wait = max(wait, self.last_identical[request_key] + self.identical_period - now)
+        return wait
+
+    @asynccontextmanager
+    async def request(self, contract_key, request_key=None):
+        """
+        Async context manager around one request, e.g.
+            async with limiter.request("SPX", ("SPX", end, duration)):
+                bars = await ib.reqHistoricalDataAsync(...)
+        """
+        if self.loop is not asyncio.get_running_loop():
+            self.loop = asyncio.get_running_loop()
+            self.semaphore = asyncio.Semaphore(self.max_concurrent)
+        async with self.semaphore:
+            wait = self._wait_time(contract_key, request_key)
+            while wait > 0:
+                await asyncio.sleep(wait)
+                wait = self._wait_time(contract_key, request_key)
+
+            # check and record without an await in between, so concurrent requests see each other
+            now = self.clock()
+            self.sent.append(now)
+            self.sent_per_contract[contract_key].append(now)
+            if request_key is not None:
+                self.last_identical[request_key] = now
+            yield
+
+
+def chunk_date_range(start, end, bar_size):
+    """
+    Splits [start, end) into chunks of at most MAX_CHUNK_DAYS[bar_size] days. Chunk boundaries lie on a
+    fixed grid of midnights (UTC), so the same chunks are produced for overlapping ranges and completed
+    chunks can be recognized in later runs.
+
+    Returns:
+        List of (chunk_start, chunk_end) tuples of tz-aware UTC datetimes, oldest first
+    """
+    days = MAX_CHUNK_DAYS.get(bar_size, 1)
+    epoch = datetime(1970, 1, 1, tzinfo=timezone.utc)
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    start = (start.tz_localize("UTC") if start.tzinfo is None else start.tz_convert("UTC")).to_pydatetime()
+    end = (end.tz_localize("UTC") if end.tzinfo is None else end.tz_convert("UTC")).to_pydatetime()
+
+    first = (start - epoch).days // days
+    last = math.ceil((end - epoch) / timedelta(days=days))
+    return [(epoch + timedelta(days=i * days), epoch + timedelta(days=(i + 1) * days)) for i in range(first, last)]
+
+
+def normalize_bars(bars):
+    """
+    Converts ib_insync bars to the format of the index data files: 'Datetime' (tz-aware UTC), 'Open',
+    'High', 'Low', 'Close'.
+    """
+    df = pd.DataFrame({
+        "Datetime": pd.to_datetime([bar.date for bar in bars], utc=True),
+        "Open": [bar.open for bar in bars],
+        "High": [bar.high for bar in bars],
+        "Low": [bar.low for bar in bars],
+        "Close": [bar.close for bar in bars]
+    })
+    return df
+
+
+def append_to_store(df, store_dir):
+    """
+    Merges bars into the monthly files '<store_dir>/<YYYY-MM>.csv'. Existing bars with the same
+    timestamp are replaced, so appending the same data twice (e.g. after a retry) is harmless.
+
+    Returns:
+        Number of new rows
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    new_rows = 0
+    for month, month_df in df.groupby(df["Datetime"].dt.strftime("%Y-%m")):
+        path = os.path.join(store_dir, f"{month}.csv")
+        if os.path.exists(path):
+            stored = pd.read_csv(path)
+            stored["Datetime"] = pd.to_datetime(stored["Datetime"], utc=True)
+            before = len(stored)
+            month_df = pd.concat([stored, month_df])
+        else:
+            before = 0
+        month_df = month_df.drop_duplicates("Datetime", keep="last").sort_values("Datetime")
+        month_df.to_csv(path, index=False)
+        new_rows += len(month_df) - before
+    return new_rows
+
+
+def make_contract(contract_details):
+    """
+    Creates a contract from a config entry with 'type', 'symbol', 'exchange' and 'currency'.
+    Returns None for unsupported types.
+    """
+    contract_type = contract_details.get('type')
+    symbol = contract_details.get('symbol')
+    exchange = contract_details.get('exchange')
+    currency = contract_details.get('currency')
+
+    if contract_type == 'Future':
+        return Future(symbol=symbol, exchange=exchange, currency=currency)
+    if contract_type == 'Index':
+        return Index(symbol=symbol, exchange=exchange, currency=currency)
+    print(f"Unsupported contract type: {contract_type}")
+    return None
+
 
 class IBClient:
-    def __init__(self, config, host='127.0.0.1', port=7497, client_id=1):
+    def __init__(self, config, host='127.0.0.1', port=7497, client_id=1, ib=None):
         """
         Initializes the IBClient and connects to TWS API. Loads config from config file.
+        'ib' can be used to pass another client with the same interface as ib_insync.IB (e.g. a fake
+        gateway in tests).
         """
-        self.ib = IB()
+        self.ib = ib if ib is not None else IB()
         self.host = host
         self.port = port
         self.client_id = client_id
@@ -85,19 +258,9 @@ class IBClient:
 
         for name, contract_details in contracts_config.items():
             try:
-                contract_type = contract_details.get('type')
-                symbol = contract_details.get('symbol')
-                exchange = contract_details.get('exchange')
-                currency = contract_details.get('currency')
-
                 # Dynamically create the contract based on type
-                contract = None
-                if contract_type == 'Future':
-                    contract = Future(symbol=symbol, exchange=exchange, currency=currency)
-                elif contract_type == 'Index':
-                    contract = Index(symbol=symbol, exchange=exchange, currency=currency)
-                else:
-                    print(f"Unsupported contract type: {contract_type}")
+                contract = make_contract(contract_details)
+                if contract is None:
                     continue
 
                 self.ib.qualifyContracts(contract)
@@ -118,4 +281,122 @@ class IBClient:
                 df.to_csv(filename, index=False)
                 print(f"Saved {name} data to {filename}")
             except Exception as e:
-                print(f"Failed to download data for {name}: {e}")
\ No newline at end of file
+                print(f"Failed to download data for {name}: {e}")
+
+    def backfill(self, start, end=None, bar_size=None, **kwargs):
+        """
+        Blocking wrapper of 'backfill_async', runs it on the event loop of ib_insync.
+        """
+        return util.run(self.backfill_async(start, end, bar_size, **kwargs))
+
+    async def backfill_async(self, start, end=None, bar_size=None, names=None, what_to_show='TRADES', use_rth=True,
+                             store_dir=IB_STORE_DIR, limiter=None, max_retries=3, retry_delay=15, timeout=60):
+        """
+        Downloads the bars of all configured contracts between start and end and appends them to the
+        store ('<store_dir>/<name>/<bar size>/<YYYY-MM>.csv', see 'append_to_store').
+
+        The date range is split into chunks (see 'chunk_date_range'). Chunks of all contracts are
+        requested concurrently, scheduled by a 'PacingLimiter'. Every chunk is written as soon as it
+        arrives and recorded in 'backfill_manifest.json' next to the data, so an interrupted backfill
+        continues where it stopped. Chunks that fail (exception, timeout, pacing violation) are retried
+        up to 'max_retries' times with exponential backoff.
+
+        Params:
+            start, end: date range, naive datetimes are UTC. 'end' defaults to now.
+            bar_size: e.g. '1 min' or '5 mins', defaults to 'default_bar_size' of the config
+            names: names of the contracts in the config, defaults to all
+
+        Returns:
+            Dictionary, name -> {'chunks', 'skipped', 'failed', 'rows'}
+        """
+        if not self.ib or not self.config:
+            print("IB connection or configuration is not established. Cannot backfill historical data.")
+            return None
+
+        bar_size = bar_size or self.config.get('default_bar_size', '5 mins')
+        end = end or datetime.now(timezone.utc)
+        limiter = limiter or PacingLimiter()
+        contracts_config = self.config.get('contracts', {})
+        names = names or list(contracts_config)
+
+        # error messages of the gateway per request id, to tell "no data" apart from failures
+        errors = {}
+
+        def on_error(req_id, error_code, error_string, contract):
+            errors[req_id] = (error_code, error_string)
+
+        self.ib.errorEvent += on_error
+        try:
+            results = await asyncio.gather(*(
+                self._backfill_contract(name, contracts_config[name], start, end, bar_size, what_to_show, use_rth,
+                                        store_dir, limiter, errors, max_retries, retry_delay, timeout)
+                for name in names
+            ))
+        finally:
+            self.ib.errorEvent -= on_error
+        return dict(zip(names, results))
+
+    async def _backfill_contract(self, name, contract_details, start, end, bar_size, what_to_show, use_rth,
+                                 store_dir, limiter, errors, max_retries, retry_delay, timeout):
+        stats = {"chunks": 0, "skipped": 0, "failed": 0, "rows": 0}
+        contract = make_contract(contract_details)
+        if contract is None:
+            return stats
+        await self.ib.qualifyContractsAsync(contract)
+
+        contract_dir = os.path.join(store_dir, name, bar_size.replace(" ", "_"))
+        manifest_path = os.path.join(contract_dir, "backfill_manifest.json")
+        done = set()
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r') as file:
+                done = set(json.load(file))
+
+        start = pd.Timestamp(start, tz="UTC") if pd.Timestamp(start).tzinfo is None else pd.Timestamp(start)
+        end = pd.Timestamp(end, tz="UTC") if pd.Timestamp(end).tzinfo is None else pd.Timestamp(end)
+        requested_at = datetime.now(timezone.utc)
+
+        async def fetch(chunk_start, chunk_end):
+            chunk_key = f"{chunk_start.isoformat()}/{chunk_end.isoformat()}"
+            if chunk_key in done:
+                stats["skipped"] += 1
+                return
+            duration = f"{(chunk_end - chunk_start).days} D"
+
+            for attempt in range(max_retries + 1):
+                if attempt > 0:
+                    await asyncio.sleep(retry_delay * 2 ** (attempt - 1))
+                try:
+                    async with limiter.request(name, (name, chunk_end, duration)):
+                        bars = await self.ib.reqHistoricalDataAsync(
+                            contract, endDateTime=chunk_end, durationStr=duration, barSizeSetting=bar_size,
+                            whatToShow=what_to_show, useRTH=use_rth, formatDate=2, timeout=timeout)
+                except Exception as e:
+                    print(f"Request failed for {name} {chunk_key} (attempt {attempt + 1}): {e}")
+                    continue
+
+                # an empty result is either "no data" (weekends, holidays) or a failure (pacing violation, timeout)
+                error = errors.pop(getattr(bars, "reqId", None), None)
+                if not bars and not (error and "no data" in error[1].lower()):
+                    print(f"No bars for {name} {chunk_key} (attempt {attempt + 1}): {error}")
+                    continue
+
+                if bars:
+                    df = normalize_bars(bars)
+                    df = df[(df["Datetime"] >= max(start, chunk_start)) & (df["Datetime"] < min(end, chunk_end))]
+                    stats["rows"] += append_to_store(df, contract_dir)
+                stats["chunks"] += 1
+
+                # only chunks that lie completely in the past are final
+                if chunk_end <= requested_at:
+                    done.add(chunk_key)
+                    os.makedirs(contract_dir, exist_ok=True)
+                    with open(manifest_path, 'w') as file:
+                        json.dump(sorted(done), file)
+                return
+
+            stats["failed"] += 1
+            print(f"Giving up on {name} {chunk_key} after {max_retries + 1} attempts")
+
+        await asyncio.gather(*(fetch(chunk_start, chunk_end) for chunk_start, chunk_end in chunk_date_range(start, end, bar_size)))
+        print(f"Backfill of {name} finished: {stats}")
+        return stats
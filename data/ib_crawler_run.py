@@ -1,55 +1,42 @@
-import os
-import pandas as pd
-from datetime import datetime
-from ib_insync import *
+import argparse
+from datetime import datetime, timedelta, timezone
+from ib_crawler import IBClient, IB_STORE_DIR
 
-def download_historical_data(duration='30 D', bar_size='5 mins'):
-    """
-    Downloads historical S&P 500 (SPX) data from Interactive Brokers TWS API and saves it as a CSV file.
-    
-    :param duration: Duration of historical data (e.g., '30 D' for 30 days).
-    :param bar_size: Bar size (e.g., '5 mins', '1 min', '1 hour').
-    """
-    # Connect to IB TWS or Gateway
-    ib = IB()
-    try:
-        ib.connect('127.0.0.1', 7497, clientId=1)  # Port 7496 for live, 7497 for paper trading
-        
-        # Define S&P 500 index contract
-        contract = Index(symbol='SPX', exchange='CBOE')
-        ib.qualifyContracts(contract)
-
-        # Request historical data
-        bars = ib.reqHistoricalData(
-            contract,
-            endDateTime='',
-            durationStr=duration,
-            barSizeSetting=bar_size,
-            whatToShow='TRADES',
-            useRTH=True,
-            formatDate=1
-        )
 
-        # Convert data to DataFrame
-        df = pd.DataFrame(bars)
-        df['date'] = df['date'].astype(str)  # Ensure date is string
+def backfill(symbol='SPX', exchange='CBOE', start=None, end=None, bar_size='5 mins', store_dir=IB_STORE_DIR):
+    """
+    Backfills historical index data from Interactive Brokers TWS API into the store
+    ('<store_dir>/<symbol>/<bar size>/<YYYY-MM>.csv'). Long date ranges are split into chunks that are
+    requested under the pacing limits of the API, bars that are already stored are not requested again.
 
-        # Ensure data_files directory exists
-        os.makedirs("data_files", exist_ok=True)
+    :param symbol: Index symbol (e.g. 'SPX', 'NDX').
+    :param start: Start of the date range (e.g. '2025-01-01'), defaults to 30 days before end.
+    :param end: End of the date range, defaults to now.
+    :param bar_size: Bar size (e.g. '5 mins', '1 min', '1 hour').
+    """
+    config = {
+        "contracts": {symbol: {"type": "Index", "symbol": symbol, "exchange": exchange, "currency": "USD"}},
+        "default_bar_size": bar_size
+    }
+    end = datetime.fromisoformat(end) if end else datetime.now(timezone.utc)
+    start = datetime.fromisoformat(start) if start else end - timedelta(days=30)
 
-        # Generate a fitting filename
-        current_date = datetime.today().strftime('%Y-%m-%d')  # Format: YYYY-MM-DD
-        filename = f"data_files/SPX_{duration.replace(' ', '')}_{bar_size.replace(' ', '')}_{current_date}.csv"
-        
-        # Save to CSV
-        df.to_csv(filename, index=False)
-        print(f"Data saved to {filename}")
-    
-    except Exception as e:
-        print(f"Error: {e}")
-    
+    client = IBClient(config)  # Port 7496 for live, 7497 for paper trading
+    try:
+        stats = client.backfill(start, end, bar_size, store_dir=store_dir)
+        print(f"Data saved to {store_dir}: {stats}")
     finally:
-        ib.disconnect()
+        client.disconnect()
+
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill historical index data from the TWS API")
+    parser.add_argument("--symbol", default="SPX")
+    parser.add_argument("--exchange", default="CBOE")
+    parser.add_argument("--start", help="start date, e.g. 2025-01-01 (default: 30 days before end)")
+    parser.add_argument("--end", help="end date (default: now)")
+    parser.add_argument("--bar-size", default="5 mins")
+    parser.add_argument("--store-dir", default=IB_STORE_DIR)
+    args = parser.parse_args()
 
-download_historical_data('30 D', '5 mins')
+    backfill(args.symbol, args.exchange, args.start, args.end, args.bar_size, args.store_dir)
@@ -0,0 +1,225 @@
+# Concurrent, resumable download of aggregate bars from the polygon REST api
+import os
+import csv
+import json
+import time
+import threading
+import requests
+import pandas as pd
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+POLYGON_BASE_URL = "https://api.polygon.io"
+
+"""Root directory of the downloaded bars, '<POLYGON_STORE_DIR>/<ticker>/<date>.csv'."""
+POLYGON_STORE_DIR = "dev/data/polygon/aggregates"
+
+"""
+Columns of the stored files, the same as in the polygon flat files, so the files can be preprocessed
+like flat files (see polygon_options_preprocessing.py). 'window_start' is in nanoseconds.
+"""
+COLUMNS = ["ticker", "volume", "open", "close", "high", "low", "window_start", "transactions"]
+
+"""Status codes of responses that are retried."""
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+"""Time zone of the exchange, days are complete after they ended there."""
+EXCHANGE_TIMEZONE = "America/New_York"
+
+
+def exchange_today():
+    """Returns the current date at the exchange."""
+    return pd.Timestamp.now(tz=EXCHANGE_TIMEZONE).date()
+
+
+def get_api_key():
+    """
+    Returns the polygon api key from the environment variable 'POLYGON_API_KEY'.
+    """
+    api_key = os.environ.get("POLYGON_API_KEY")
+    if not api_key:
+        raise ValueError("Set the environment variable 'POLYGON_API_KEY' to your polygon api key.")
+    return api_key
+
+
+class RateLimiter:
+    """
+    Spaces out calls from any number of threads to at most 'calls' per 'period' seconds. Every call
+    reserves the next free slot, so waiting threads are served in order.
+    """
+    def __init__(self, calls, period=60.0):
+        self.interval = period / calls
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class PolygonCrawler:
+    """
+    Downloads minute (or other) aggregates per ticker and day with a pooled HTTP session and a thread
+    pool. Requests are spaced by a rate limiter, responses are paginated through 'next_url', and
+    failed requests (connection errors, 429, 5xx) are retried with exponential backoff.
+
+    Every (ticker, day) is streamed page by page into '<store_dir>/<ticker>/<date>.csv.part', which is
+    renamed to '<date>.csv' when complete. Completed days are appended to 'manifest.jsonl' in the store,
+    so an interrupted backfill continues with the missing days. Only days before the current day at the
+    exchange are recorded, the current and future days are downloaded again by the next crawl.
+
+    Params:
+        api_key: polygon api key, defaults to the environment variable 'POLYGON_API_KEY'
+        requests_per_minute: limit of the polygon plan (5 for the free plan), None for no limit
+        max_workers: number of concurrent downloads
+    """
+    def __init__(self, api_key=None, store_dir=POLYGON_STORE_DIR, base_url=POLYGON_BASE_URL, requests_per_minute=None,
+                 max_workers=8, max_retries=5, backoff=1.0, timeout=30):
+        self.store_dir = store_dir
+        self.base_url = base_url.rstrip("/")
+        self.limiter = RateLimiter(requests_per_minute) if requests_per_minute else None
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = f"Bearer {api_key or get_api_key()}"
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.manifest_path = os.path.join(store_dir, "manifest.jsonl")
+        self.manifest_lock = threading.Lock()
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def get(self, url, params=None):
+        """
+        GET request with rate limiting and retries. Returns the decoded json response.
+        """
+        for attempt in range(self.max_retries + 1):
+            if self.limiter is not None:
+                self.limiter.wait()
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            except requests.RequestException as e:
+                error, retry_after = e, None
+            else:
+                if response.status_code not in RETRY_STATUS:
+                    response.raise_for_status()
+                    return response.json()
+                error, retry_after = f"status {response.status_code}", response.headers.get("Retry-After")
+
+            if attempt < self.max_retries:
+                delay = float(retry_after) if retry_after is not None else self.backoff * 2 ** attempt
+                print(f"Request failed ({error}), retry in {delay:.1f}s: {url}")
+                time.sleep(delay)
+
+        raise RuntimeError(f"Request failed after {self.max_retries + 1} attempts ({error}): {url}")
+
+    def iter_aggs(self, ticker, start, end, multiplier=1, timespan="minute"):
+        """
+        Yields the pages of aggregates of a ticker between start and end (dates, inclusive), following
+        'next_url' until all pages are read.
+        """
+        url = f"{self.base_url}/v2/aggs/ticker/{ticker}/range/{multiplier}/{timespan}/{start}/{end}"
+        params = {"adjusted": "true", "sort": "asc", "limit": 50000}
+        while url:
+            data = self.get(url, params)
+            yield data.get("results", [])
+            # the next url already contains all query parameters
+            url, params = data.get("next_url"), None
+
+    def day_path(self, ticker, date):
+        return os.path.join(self.store_dir, ticker.replace(":", "_"), f"{date}.csv")
+
+    def download_day(self, ticker, date, multiplier=1, timespan="minute"):
+        """
+        Downloads the aggregates of one ticker and day and streams them into the store.
+
+        Returns:
+            Number of rows written
+        """
+        path = self.day_path(ticker, date)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        rows = 0
+        with open(path + ".part", "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(COLUMNS)
+            for page in self.iter_aggs(ticker, date, date, multiplier, timespan):
+                writer.writerows(
+                    (ticker, bar.get("v"), bar.get("o"), bar.get("c"), bar.get("h"), bar.get("l"), bar["t"] * 1_000_000, bar.get("n"))
+                    for bar in page
+                )
+                rows += len(page)
+        os.replace(path + ".part", path)
+
+        # the current day is still incomplete and future days have no bars yet
+        if pd.Timestamp(date).date() < exchange_today():
+            self._record(ticker, date, multiplier, timespan, rows)
+        return rows
+
+    def completed(self):
+        """
+        Returns the set of completed (ticker, date, multiplier, timespan) entries of the manifest.
+        """
+        if not os.path.exists(self.manifest_path):
+            return set()
+        with open(self.manifest_path, "r") as file:
+            entries = [json.loads(line) for line in file if line.strip()]
+        return {(e["ticker"], e["date"], e["multiplier"], e["timespan"]) for e in entries}
+
+    def _record(self, ticker, date, multiplier, timespan, rows):
+        entry = {"ticker": ticker, "date": date, "multiplier": multiplier, "timespan": timespan, "rows": rows}
+        with self.manifest_lock:
+            os.makedirs(self.store_dir, exist_ok=True)
+            with open(self.manifest_path, "a") as file:
+                file.write(json.dumps(entry) + "\n")
+
+    def crawl(self, tickers, start, end, multiplier=1, timespan="minute"):
+        """
+        Downloads all tickers for every weekday between start and end (inclusive) concurrently. Days
+        that are already in the manifest are skipped.
+
+        Returns:
+            Dictionary with the number of 'downloaded', 'skipped' and 'failed' days and the 'rows' written
+        """
+        days = [day.strftime("%Y-%m-%d") for day in pd.bdate_range(start, end)]
+        done = self.completed()
+        todo = [(ticker, day) for ticker in tickers for day in days if (ticker, day, multiplier, timespan) not in done]
+        stats = {"downloaded": 0, "skipped": len(tickers) * len(days) - len(todo), "failed": 0, "rows": 0}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.download_day, ticker, day, multiplier, timespan): (ticker, day) for ticker, day in todo}
+            for future in as_completed(futures):
+                try:
+                    stats["rows"] += future.result()
+                    stats["downloaded"] += 1
+                except Exception as e:
+                    stats["failed"] += 1
+                    print(f"Failed to download {futures[future]}: {e}")
+
+        return stats
+
+    def load_days(self, ticker, start, end):
+        """
+        Reads the stored days of a ticker between start and end into one DataFrame.
+        """
+        paths = [self.day_path(ticker, day.strftime("%Y-%m-%d")) for day in pd.bdate_range(start, end)]
+        frames = [pd.read_csv(path) for path in paths if os.path.exists(path)]
+        if not frames:
+            return pd.DataFrame(columns=COLUMNS)
+        return pd.concat(frames, ignore_index=True)
@@ -1,72 +1,45 @@
 import os
-import requests
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import pandas as pd
+from polygon_crawler import PolygonCrawler
 
-def plot_candle_chart(df, title="Candlestick Chart with Signals"):
-    """
-    Plots any chart data, independent of the time frame, in a regular candle chart plot.
-    Params: 
-        df: Should include at least 'Datetime', 'Open', 'High', 'Low', 'Close'.
-    """
-    fig = go.Figure(data=go.Ohlc(x=df['Datetime'],
-                        open=df['Open'],
-                        high=df['High'],
-                        low=df['Low'],
-                        close=df['Close']))
-    
-    fig.update_layout(title=title, xaxis_title="Time", yaxis_title="Price")
-    fig.show()
-
-API_KEY = "YOUR-POLYGON-API-KEY"  # api key from polygon dashboard
 TICKER = "SPY"
-TIMEFRAME = "15"  # minutes
-YEAR = "2025"
-MONTH = "03"
-START_DATE = f"{YEAR}-{MONTH}-01"  # year-month-day
-END_DATE = f"{YEAR}-{MONTH}-31"
-
-url = f"https://api.polygon.io/v2/aggs/ticker/{TICKER}/range/{TIMEFRAME}/minute/{START_DATE}/{END_DATE}"
-params = {
-    "adjusted": "true",
-    "sort": "asc",
-    "limit": 100000,
-    "apiKey": API_KEY
-}
-
-# Request data from Polygon.io
-response = requests.get(url, params=params)
-data = response.json()
-
-# check if data is returned
-if "results" in data:
-    df = pd.DataFrame(data["results"])
-    
-    df["Datetime"] = pd.to_datetime(df["t"], unit="ms")
-    df.rename(columns={"o": "Open", "h": "High", "l": "Low", "c": "Close", "v": "volume"}, inplace=True)
-    df = df[["Datetime", "Open", "High", "Low", "Close", "volume"]]
-
-    # save to CSV
-    csv_filename = f"{YEAR}-{MONTH}.csv"
-    csv_filepath = os.path.join("dev/data/polygon/index_flat_files/15_min_aggregates", csv_filename)
-
-    # Preprocessing
-    # Rename columns
-    df.rename(columns={
-        "open": "Open",
-        "close": "Close",
-        "high": "High",
-        "low": "Low",
-        "window_start": "Datetime"
-    }, inplace=True)
-
-    # scale values
-    df[["Open", "High", "Low", "Close"]] *= 10
-    df.to_csv(csv_filepath, index=False)
-
-
-    print(f"Data saved to {csv_filepath}")
-
-else:
-    print("No data found. Check your API key, ticker, and date range.")
+TIMEFRAME = 15  # minutes
+START_DATE = "2025-03-01"  # year-month-day
+END_DATE = "2025-03-31"
+OUTPUT_DIR = f"dev/data/polygon/index_flat_files/{TIMEFRAME}_min_aggregates"
+
+"""Requests per minute of the polygon plan (5 for the free plan), None for no limit."""
+REQUESTS_PER_MINUTE = 5
+
+
+if __name__ == "__main__":
+    # Download per day (api key from the environment variable 'POLYGON_API_KEY'), days that have
+    # already been downloaded are skipped
+    with PolygonCrawler(requests_per_minute=REQUESTS_PER_MINUTE) as crawler:
+        stats = crawler.crawl([TICKER], START_DATE, END_DATE, multiplier=TIMEFRAME)
+        print(stats)
+        df = crawler.load_days(TICKER, START_DATE, END_DATE)
+
+    if df.empty:
+        print("No data found. Check your API key, ticker, and date range.")
+    else:
+        # Preprocessing
+        # Rename columns
+        df.rename(columns={
+            "open": "Open",
+            "close": "Close",
+            "high": "High",
+            "low": "Low",
+            "window_start": "Datetime"
+        }, inplace=True)
+        df["Datetime"] = pd.to_datetime(df["Datetime"], unit="ns")
+
+        # scale values
+        df[["Open", "High", "Low", "Close"]] *= 10
+
+        # save one CSV per month
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        for month, month_df in df.groupby(df["Datetime"].dt.strftime("%Y-%m")):
+            csv_filepath = os.path.join(OUTPUT_DIR, f"{month}.csv")
+            month_df[["Datetime", "Open", "High", "Low", "Close", "volume"]].to_csv(csv_filepath, index=False)
+            print(f"Data saved to {csv_filepath}")
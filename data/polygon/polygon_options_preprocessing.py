@@ -1,26 +1,151 @@
 import os
+import time
+import numpy as np
 import pandas as pd
 from pathlib import Path
+from utils.options_helper import UNDERLYING_PRICE_SCALE, rescale_legacy_prices
+from utils.contract_codec import encode_tickers, decode_contracts
+from data.availability import AvailabilityBuilder
 
 DIRECTORY_PATH = Path("dev/data/polygon/options_flat_files/2024-02")
 
-for file_path in DIRECTORY_PATH.glob("*.csv"):
-    df = pd.read_csv(file_path)
+"""Underlyings that are kept. Each one is written to its own partition '<month>/<underlying>/<date>.csv'."""
+UNDERLYINGS = ["SPY", "SPXW", "QQQ"]
 
-    # Rename columns
-    df.rename(columns={
-        "open": "Open",
-        "close": "Close",
-        "high": "High",
-        "low": "Low",
-        "window_start": "Datetime"
-    }, inplace=True)
+"""Rows of a flat file that are parsed at once. Bounds the memory of an ingest, independent of the file size."""
+CHUNK_SIZE = 500_000
 
-    # Filter tickers 
-    df = df[df["ticker"].str.contains("SPY|SPXW", na=False, regex=True)]
 
-    # scale values
-    df[["Open", "High", "Low", "Close"]] *= 10
+def ingest_day_file(file_path, underlyings=UNDERLYINGS, only_0dte=True, remove_source=False, chunksize=CHUNK_SIZE):
+    """
+    Streams a raw polygon options day file (csv or gzip compressed csv, e.g. '2024-02/2024-02-01.csv.gz')
+    into the partitions of the underlyings ('2024-02/SPY/2024-02-01.csv', ...). The file is
+    decompressed and parsed in chunks of 'chunksize' rows. Rows of other underlyings and, with
+    'only_0dte', of contracts that do not expire on the day of the file are dropped per chunk (the
+    tickers are parsed once per distinct ticker, see utils/contract_codec.py), the remaining rows are
+    appended to the partition files right away. Memory use does not depend on the size of the file.
 
-    df.to_csv(file_path, index=False)
-    print("saved: ", file_path)
+    Partition files are written as '<date>.csv.part' and renamed when the file is complete. For every
+    partition, the availability of the 0dte contracts is written to '<date>.availability.npz'
+    (see data/availability.py). Underlyings without rows get an empty partition (header only), so the
+    day counts as ingested and the raw file is never read in its place. Day files that were preprocessed
+    before (columns 'Open', ..., 'Datetime', every root scaled by 10) are split and rescaled per root.
+
+    Params:
+        file_path: path of the raw day file
+        underlyings: root symbols to keep
+        only_0dte: If True, only contracts that expire on the day of the file are kept.
+        remove_source: If True, the raw day file is deleted after ingesting.
+
+    Returns:
+        Dictionary with 'mb' (size of the source file), 'seconds', 'mb_per_s', 'rows_kept', 'rows_dropped'
+        and 'rows' (underlying -> number of rows written)
+    """
+    file_path = Path(file_path)
+    file_name = file_path.name.removesuffix(".gz").removesuffix(".csv")
+    expiry = np.datetime64(pd.Timestamp(file_name).date(), "D")
+    start = time.perf_counter()
+
+    parts = {}  # underlying -> open partition file
+    availability = {}  # underlying -> AvailabilityBuilder
+    rows = {}
+    rows_dropped = 0
+    columns = None
+    try:
+        for chunk in pd.read_csv(file_path, chunksize=chunksize, compression="infer"):
+            # filter by root symbol and expiry, evaluated once per distinct ticker
+            codes, tickers = pd.factorize(chunk["ticker"])
+            keys = encode_tickers(tickers)
+            contracts = decode_contracts(keys)
+            keep = contracts["root"].isin(underlyings).to_numpy()
+            if only_0dte:
+                keep &= (contracts["expiry"] == expiry).to_numpy()
+            chunk_roots = contracts["root"].to_numpy()[codes]
+            kept = keep[codes] & (codes >= 0)
+            rows_dropped += int((~kept).sum())
+
+            chunk = chunk[kept]
+            chunk_roots = chunk_roots[kept]
+            chunk_keys = keys[codes[kept]]
+
+            # day files of the old pipeline are already renamed, their prices are scaled by LEGACY_PRICE_SCALE
+            preprocessed = "Datetime" in chunk.columns
+
+            # Rename columns
+            chunk = chunk.rename(columns={
+                "open": "Open",
+                "close": "Close",
+                "high": "High",
+                "low": "Low",
+                "window_start": "Datetime"
+            })
+            columns = chunk.columns
+
+            for underlying in np.unique(chunk_roots):
+                in_partition = chunk_roots == underlying
+                partition = chunk[in_partition].copy()
+                availability.setdefault(underlying, AvailabilityBuilder(expiry)).update(
+                    chunk_keys[in_partition], partition["Datetime"].to_numpy(dtype=np.int64))
+
+                # scale values
+                if preprocessed:
+                    partition = rescale_legacy_prices(partition, underlying)
+                else:
+                    partition[["Open", "High", "Low", "Close"]] *= UNDERLYING_PRICE_SCALE.get(underlying, 1)
+
+                if underlying not in parts:
+                    output_dir = file_path.parent / underlying
+                    os.makedirs(output_dir, exist_ok=True)
+                    parts[underlying] = open(output_dir / f"{file_name}.csv.part", "w", newline="")
+                    partition.to_csv(parts[underlying], index=False)
+                else:
+                    partition.to_csv(parts[underlying], index=False, header=False)
+                rows[underlying] = rows.get(underlying, 0) + len(partition)
+        for underlying in underlyings:
+            if underlying not in parts:
+                output_dir = file_path.parent / underlying
+                os.makedirs(output_dir, exist_ok=True)
+                parts[underlying] = open(output_dir / f"{file_name}.csv.part", "w", newline="")
+                pd.DataFrame(columns=columns).to_csv(parts[underlying], index=False)
+                rows[underlying] = 0
+    finally:
+        for file in parts.values():
+            file.close()
+
+    for underlying in parts:
+        availability.setdefault(underlying, AvailabilityBuilder(expiry))
+        part_path = file_path.parent / underlying / f"{file_name}.csv.part"
+        availability[underlying].build().save(file_path.parent / underlying / f"{file_name}.availability.npz")
+        os.replace(part_path, part_path.with_suffix(""))
+
+    seconds = time.perf_counter() - start
+    mb = file_path.stat().st_size / 1e6
+    if remove_source:
+        file_path.unlink()
+
+    return {
+        "mb": mb,
+        "seconds": seconds,
+        "mb_per_s": mb / seconds if seconds > 0 else float("inf"),
+        "rows_kept": sum(rows.values()),
+        "rows_dropped": rows_dropped,
+        "rows": rows
+    }
+
+
+def split_day_file(file_path, underlyings=UNDERLYINGS, remove_source=False):
+    """
+    Splits a raw polygon options day file into the partitions of the underlyings, keeping contracts
+    of all expiries (see 'ingest_day_file').
+
+    Returns:
+        Dictionary, underlying -> number of rows written
+    """
+    return ingest_day_file(file_path, underlyings, only_0dte=False, remove_source=remove_source)["rows"]
+
+
+if __name__ == "__main__":
+    for file_path in sorted([*DIRECTORY_PATH.glob("*.csv"), *DIRECTORY_PATH.glob("*.csv.gz")]):
+        stats = ingest_day_file(file_path)
+        print(f"saved: {file_path} | {stats['mb']:.1f} MB in {stats['seconds']:.1f}s ({stats['mb_per_s']:.1f} MB/s) | "
+              f"kept {stats['rows_kept']} rows, dropped {stats['rows_dropped']} | {stats['rows']}")
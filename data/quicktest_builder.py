@@ -0,0 +1,234 @@
+# Builds the quicktest dataset: a stratified sample of trading days of the full data, with their index and
+# options data and a manifest, so quicktests run in seconds and stay close to the full history
+#
+#   python -m data.quicktest_builder --days-per-month 3
+#
+# Evaluate on it with quicktest=True (index data), or with DATA_SOURCE = "quicktest" in eval_config.py to
+# read the options data from the dataset as well (e.g. on machines without the full data).
+import os
+import json
+import glob
+import argparse
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from data.sources import QUICKTEST_DIR, QUICKTEST_INDEX_FILE_DIRS, get_data_source
+from data.availability import availability_from_options, get_availability_path
+from utils.options_helper import get_options_file_path
+
+"""Efficiency (net move / range of the day) from which a day counts as a trend day."""
+TREND_THRESHOLD = 0.5
+
+"""Names of the volatility regimes, by terciles of the realized volatility of all days."""
+REGIMES = ["low", "mid", "high"]
+
+
+def day_features(index_df):
+    """
+    Returns the features of every day of 1 minute index data, one row per day: 'date', 'month',
+    'realized_vol' (square root of the sum of squared 1 minute log returns), 'efficiency' (absolute net
+    move of the day divided by its range, close to 1 on trend days and to 0 on range days) and 'return'.
+    """
+    df = pd.DataFrame({"day": index_df["Datetime"].astype(str).str[:10].to_numpy(),
+                       "Open": index_df["Open"].to_numpy(dtype=float), "High": index_df["High"].to_numpy(dtype=float),
+                       "Low": index_df["Low"].to_numpy(dtype=float), "Close": index_df["Close"].to_numpy(dtype=float)})
+    log_close = np.log(df["Close"])
+    # squared returns within the day, the first bar of a day has no return
+    df["squared_return"] = log_close.groupby(df["day"]).diff().pow(2)
+
+    days = df.groupby("day", sort=True).agg(open=("Open", "first"), close=("Close", "last"), high=("High", "max"),
+                                            low=("Low", "min"), squared_return=("squared_return", "sum"))
+    day_range = (days["high"] - days["low"]).to_numpy()
+    net_move = (days["close"] - days["open"]).to_numpy()
+    features = pd.DataFrame({
+        "date": pd.to_datetime(days.index).date,
+        "month": days.index.str[:7],
+        "realized_vol": np.sqrt(days["squared_return"].to_numpy()),
+        "efficiency": np.divide(np.abs(net_move), day_range, out=np.zeros_like(day_range), where=day_range > 0),
+        "return": net_move / days["open"].to_numpy()
+    })
+    return features
+
+
+def add_strata(features, has_options, trend_threshold=TREND_THRESHOLD):
+    """
+    Adds the strata of every day: 'regime' (volatility tercile of all days), 'day_type' ('trend' or
+    'range'), 'has_options' and 'stratum' (month / regime / day type / options).
+
+    Params:
+        has_options: boolean array, True for the days with options data
+    """
+    features = features.copy()
+    bounds = np.quantile(features["realized_vol"], [1 / 3, 2 / 3]) if len(features) else [0, 0]
+    features["regime"] = np.array(REGIMES)[np.searchsorted(bounds, features["realized_vol"], side="right")]
+    features["day_type"] = np.where(features["efficiency"] >= trend_threshold, "trend", "range")
+    features["has_options"] = np.asarray(has_options, dtype=bool)
+    features["stratum"] = (features["month"] + "/" + features["regime"] + "/" + features["day_type"] + "/"
+                           + np.where(features["has_options"], "options", "no options"))
+    return features
+
+
+def allocate(sizes, n):
+    """
+    Splits n samples over strata proportionally to their sizes (largest remainder method), no stratum
+    gets more samples than it has days.
+
+    Params:
+        sizes: dictionary, stratum -> number of days
+
+    Returns:
+        Dictionary, stratum -> number of samples
+    """
+    total = sum(sizes.values())
+    n = min(n, total)
+    if total == 0:
+        return {stratum: 0 for stratum in sizes}
+    quotas = {stratum: n * size / total for stratum, size in sizes.items()}
+    counts = {stratum: int(quota) for stratum, quota in quotas.items()}
+    # the remaining samples go to the strata with the largest remainders (ties: larger strata first)
+    order = sorted(sizes, key=lambda stratum: (quotas[stratum] - counts[stratum], sizes[stratum]), reverse=True)
+    for stratum in order[:n - sum(counts.values())]:
+        counts[stratum] += 1
+    return counts
+
+
+def select_days(features, days_per_month=3, seed=0):
+    """
+    Draws a stratified sample of days (see 'add_strata'): every month gets 'days_per_month' days, split
+    over the strata of the month in proportion to their sizes. Within a stratum, days are drawn at random.
+
+    Returns:
+        The features of the selected days, sorted by date
+    """
+    rng = np.random.default_rng(seed)
+    selected = []
+    for _, month in features.groupby("month", sort=True):
+        sizes = month["stratum"].value_counts().to_dict()
+        for stratum, count in sorted(allocate(sizes, days_per_month).items()):
+            if count > 0:
+                days = month[month["stratum"] == stratum]
+                selected.append(days.iloc[np.sort(rng.choice(len(days), size=count, replace=False))])
+    if not selected:
+        return features.iloc[:0]
+    return pd.concat(selected).sort_values("date").reset_index(drop=True)
+
+
+def compare_sample(features, selected):
+    """
+    Returns the shares of the regimes, trend days and options days and the mean realized volatility of
+    all days and of the selected days, one row per statistic.
+    """
+    def statistics(df):
+        shares = {f"share/{regime}": (df["regime"] == regime).mean() for regime in REGIMES}
+        return {**shares, "share/trend": (df["day_type"] == "trend").mean(), "share/options": df["has_options"].mean(),
+                "mean/realized_vol": df["realized_vol"].mean(), "mean/abs_return": df["return"].abs().mean()}
+    full, sample = statistics(features), statistics(selected)
+    return pd.DataFrame({"full": full, "sample": sample})
+
+
+def write_dataset(source, selected, out_dir=QUICKTEST_DIR, underlyings=("SPY",), timeframes=("1min", "5min")):
+    """
+    Writes the index data of the selected days (monthly files per timeframe) and their options data
+    (one partition file per underlying, with its availability index) to out_dir. Index and options files
+    of a previous build are removed first.
+
+    Returns:
+        Number of written (index files, options files)
+    """
+    days = {day.isoformat() for day in selected["date"]}
+    months = sorted({day[:7] for day in days})
+    index_files = 0
+    for timeframe in timeframes:
+        index_dir = os.path.join(out_dir, os.path.basename(QUICKTEST_INDEX_FILE_DIRS[timeframe]))
+        os.makedirs(index_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(index_dir, "*.csv")):
+            os.remove(path)
+        for month in months:
+            df = source.load_index(timeframe, f"{month}.csv")
+            if df is None:
+                continue
+            df = df[df["Datetime"].astype(str).str[:10].isin(days)]
+            df.to_csv(os.path.join(index_dir, f"{month}.csv"), index=False)
+            index_files += 1
+
+    options_dir = os.path.join(out_dir, "options_flat_files")
+    for path in glob.glob(os.path.join(options_dir, "*", "*", "*.csv")) + glob.glob(os.path.join(options_dir, "*", "*", "*.npz")):
+        os.remove(path)
+    options_files = 0
+    for day in selected.loc[selected["has_options"], "date"]:
+        for underlying, df in source.load_options(day, list(underlyings)).items():
+            if df is None or df.empty:
+                continue
+            path = get_options_file_path(day, underlying, options_dir)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # back to the format of the flat files: nanosecond timestamps, tickers instead of contract keys
+            df.drop(columns=["contract"]).assign(Datetime=df["Datetime"].dt.round("s").astype("int64")).to_csv(path, index=False)
+            availability_from_options(day, df).save(get_availability_path(day, underlying, options_dir))
+            options_files += 1
+    return index_files, options_files
+
+
+def has_options_data(source, day, underlying):
+    """
+    Returns True if the source has options data of the day. For csv files only the first row of the
+    partition file is read, days without files are skipped without reading anything.
+    """
+    if hasattr(source, "options_dir"):
+        partition = get_options_file_path(day, underlying, source.options_dir)
+        if partition.exists():
+            return not pd.read_csv(partition, nrows=1).empty
+        if not get_options_file_path(day, options_dir=source.options_dir).exists():
+            return False
+    return source.has_options(day, underlying)
+
+
+def build_quicktest(days_per_month=3, out_dir=QUICKTEST_DIR, underlyings=("SPY",), seed=0, trend_threshold=TREND_THRESHOLD,
+                    source=None):
+    """
+    Builds the quicktest dataset from the full data of a data source (the current one by default): the
+    features of every day are computed from the 1 minute index data, days are sampled per month and
+    stratum (volatility regime, trend / range day, options data available), and the index and options
+    data of the sampled days are written to out_dir with a manifest ('manifest.json') that lists the
+    days, their strata and how close the sample is to the full data.
+
+    Returns:
+        The manifest
+    """
+    source = source or get_data_source()
+    underlying = underlyings[0]
+    features = pd.concat([day_features(source.load_index("1min", file_name)) for file_name in source.index_files("1min")],
+                         ignore_index=True)
+    has_options = [has_options_data(source, day, underlying) for day in features["date"]]
+    features = add_strata(features, has_options, trend_threshold)
+    selected = select_days(features, days_per_month, seed)
+    index_files, options_files = write_dataset(source, selected, out_dir, underlyings)
+
+    comparison = compare_sample(features, selected)
+    print(f"Selected {len(selected)} of {len(features)} days ({index_files} index files, {options_files} options files)")
+    print(comparison)
+
+    manifest = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "source": source.__class__.__name__,
+        "settings": {"days_per_month": days_per_month, "underlyings": list(underlyings), "seed": seed,
+                     "trend_threshold": trend_threshold,
+                     "volatility_bounds": np.quantile(features["realized_vol"], [1 / 3, 2 / 3]).tolist()},
+        "days": json.loads(selected.assign(date=selected["date"].astype(str)).to_json(orient="records")),
+        "strata": {"full": features["stratum"].value_counts().sort_index().to_dict(),
+                   "sample": selected["stratum"].value_counts().sort_index().to_dict()},
+        "comparison": comparison.to_dict()
+    }
+    with open(os.path.join(out_dir, "manifest.json"), "w") as file:
+        json.dump(manifest, file, indent=2, default=str)
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the quicktest dataset from a stratified sample of days.")
+    parser.add_argument("--days-per-month", type=int, default=3)
+    parser.add_argument("--out", default=QUICKTEST_DIR)
+    parser.add_argument("--underlyings", nargs="+", default=["SPY"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trend-threshold", type=float, default=TREND_THRESHOLD)
+    args = parser.parse_args()
+    build_quicktest(args.days_per_month, args.out, args.underlyings, args.seed, args.trend_threshold)
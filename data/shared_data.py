@@ -0,0 +1,328 @@
+# Shared memory data plane: data is loaded once by the parent process and read by all workers
+import sys
+import numpy as np
+import pandas as pd
+from multiprocessing import shared_memory, resource_tracker
+from data.sources import DataSource
+from utils.options_helper import get_option, index_contracts
+
+"""Columns are stored at offsets that are multiples of this, so every column is aligned for numpy."""
+ALIGNMENT = 64
+
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _encode_column(series):
+    """
+    Splits a column into a numpy array that is stored in shared memory and the metadata to restore it.
+    Datetimes are stored as int64 nanoseconds, strings as categorical codes (the categories, e.g. the
+    distinct tickers of a day, are part of the metadata).
+    """
+    if isinstance(series.dtype, pd.DatetimeTZDtype):
+        return series.dt.tz_convert("UTC").dt.tz_localize(None).to_numpy().view(np.int64), {"kind": "datetime", "tz": str(series.dt.tz)}
+    if pd.api.types.is_datetime64_dtype(series.dtype):
+        return series.to_numpy(dtype="datetime64[ns]").view(np.int64), {"kind": "datetime", "tz": None}
+    if pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_bool_dtype(series.dtype):
+        return np.ascontiguousarray(series.to_numpy()), {"kind": "array"}
+    codes, categories = pd.factorize(series)
+    return codes.astype(np.int32), {"kind": "categorical", "categories": list(categories)}
+
+
+def _decode_column(array, meta):
+    if meta["kind"] == "datetime":
+        values = array.view("datetime64[ns]")
+        if meta["tz"] is None:
+            return values
+        return pd.DatetimeIndex(values).tz_localize("UTC").tz_convert(meta["tz"])
+    if meta["kind"] == "categorical":
+        return pd.Categorical.from_codes(array, categories=meta["categories"])
+    return array
+
+
+class SharedDataPlane:
+    """
+    Owner of the shared memory segments. Every DataFrame put into the plane is copied once into its
+    own segment (one aligned array per column). The 'manifest' describes all frames by key and is
+    passed to the workers, which attach read-only numpy views of the same memory (see 'SharedSource'),
+    so N workers use about the memory of one copy of the data.
+
+    The segments are removed by 'close' (or when the plane is garbage collected). Workers that are
+    still attached keep their mapping until they detach, so closing the plane is always safe.
+    """
+    def __init__(self):
+        self.segments = {}  # key -> SharedMemory
+        self.entries = {}  # key -> description of the frame, see 'put'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+    def put(self, key, df):
+        """
+        Copies a DataFrame into a new shared memory segment.
+
+        Params:
+            key: hashable key of the frame, e.g. ("options", "2025-01-08", "SPY")
+        """
+        if key in self.segments:
+            raise ValueError(f"Frame '{key}' is already in the data plane.")
+        columns = []
+        size = 0
+        for name in df.columns:
+            array, meta = _encode_column(df[name])
+            columns.append((name, array, meta))
+            size = _aligned(size) + array.nbytes
+
+        segment = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        entry = {"segment": segment.name, "rows": len(df), "columns": []}
+        offset = 0
+        for name, array, meta in columns:
+            offset = _aligned(offset)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf, offset=offset)[:] = array
+            entry["columns"].append({"name": name, "dtype": array.dtype.str, "offset": offset, **meta})
+            offset += array.nbytes
+
+        self.segments[key] = segment
+        self.entries[key] = entry
+        return entry
+
+    def manifest(self):
+        """Returns the description of all frames, key -> entry. Can be pickled and sent to workers."""
+        return dict(self.entries)
+
+    def nbytes(self):
+        return sum(segment.size for segment in self.segments.values())
+
+    def close(self):
+        for segment in self.segments.values():
+            segment.close()
+            try:
+                segment.unlink()
+            except FileNotFoundError:
+                pass
+        self.segments = {}
+        self.entries = {}
+
+
+def _open_segment(name):
+    """Attaches an existing segment without registering it with the resource tracker of this process."""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    # before Python 3.13, attaching registers the segment as if this process had created it, so it would
+    # be removed when this process exits (or unregistered for the owner, if the tracker is shared)
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args, **kwargs: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+"""Segments attached by this process, segment name -> [SharedMemory, reference count]."""
+_attached = {}
+
+
+def attach_frame(entry):
+    """
+    Returns a DataFrame of read-only numpy views of a frame in shared memory (no data is copied, except
+    for the categories of string columns). Every call increments the reference count of the segment,
+    'release_frame' decrements it and detaches the segment when it drops to zero.
+    """
+    name = entry["segment"]
+    if name in _attached:
+        _attached[name][1] += 1
+    else:
+        _attached[name] = [_open_segment(name), 1]
+    buffer = _attached[name][0].buf
+
+    data = {}
+    for column in entry["columns"]:
+        array = np.ndarray((entry["rows"],), dtype=np.dtype(column["dtype"]), buffer=buffer, offset=column["offset"])
+        array.flags.writeable = False
+        data[column["name"]] = _decode_column(array, column)
+    return pd.DataFrame(data, copy=False)
+
+
+def release_frame(entry):
+    """Decrements the reference count of the segment of a frame, see 'attach_frame'."""
+    name = entry["segment"]
+    if name not in _attached:
+        return
+    _attached[name][1] -= 1
+    if _attached[name][1] <= 0:
+        segment, _ = _attached.pop(name)
+        try:
+            segment.close()
+        except BufferError:
+            # views of the segment are still in use, it is unmapped when they are garbage collected
+            pass
+
+
+def attached_segments():
+    """Returns the reference counts of the segments attached by this process."""
+    return {name: count for name, (_, count) in _attached.items()}
+
+
+def options_key(date, underlying):
+    return ("options", date.isoformat(), underlying)
+
+
+def index_key(timeframe, file_name, quicktest=False):
+    return ("index", timeframe, "quicktest" if quicktest else "full", file_name)
+
+
+def publish_source(plane, source, timeframes, quicktest=False, underlyings=("SPY",), options=True, file_names=None):
+    """
+    Loads the monthly index files of the given timeframes and the options data of every day that appears
+    in them from a data source (see data/sources.py) into a shared data plane. To bound the memory, publish
+    a few months at a time (see 'map_in_batches').
+
+    Params:
+        file_names: Optional names of the monthly files to load, all files by default
+
+    Returns:
+        The manifest of the plane
+    """
+    days = set()
+    for timeframe in timeframes:
+        for file_name in source.index_files(timeframe, quicktest):
+            if file_names is not None and file_name not in file_names:
+                continue
+            df = source.load_index(timeframe, file_name, quicktest)
+            if df is None:
+                continue
+            plane.put(index_key(timeframe, file_name, quicktest), df)
+            days.update(pd.to_datetime(df["Datetime"].astype(str).str[:10]).dt.date)
+
+    if options:
+        for day in sorted(days):
+            for underlying, df in source.load_options(day, list(underlyings)).items():
+                if df is not None:
+                    plane.put(options_key(day, underlying), df)
+
+    print(f"Published {len(plane.segments)} frames to shared memory ({plane.nbytes() / 1e6:.1f} MB)")
+    return plane.manifest()
+
+
+class SharedSource(DataSource):
+    """
+    Data source of a worker process that reads the frames of a 'SharedDataPlane' from shared memory.
+    Frames are attached on first use and kept until 'close'. The source is pinned, so code of the worker
+    that calls 'use_data_source' (e.g. 'run_eval_months') keeps reading from shared memory.
+
+    Params:
+        manifest: manifest of the data plane (see 'SharedDataPlane.manifest')
+    """
+    pinned = True
+
+    def __init__(self, manifest):
+        self.manifest = manifest
+        self._frames = {}  # key -> attached DataFrame
+        self._contract_rows = {}
+
+    def _frame(self, key):
+        if key not in self.manifest:
+            return None
+        if key not in self._frames:
+            self._frames[key] = attach_frame(self.manifest[key])
+        return self._frames[key]
+
+    def close(self):
+        for key in self._frames:
+            release_frame(self.manifest[key])
+        self._frames = {}
+        self._contract_rows = {}
+
+    def load_options(self, date, underlyings):
+        return {underlying: self._frame(options_key(date, underlying)) for underlying in underlyings}
+
+    def has_options(self, date, underlying):
+        return options_key(date, underlying) in self.manifest
+
+    def get_option(self, date, contract, start_time="00:00", end_time="23:59", underlying="SPY"):
+        key = options_key(date, underlying)
+        df = self._frame(key)
+        if df is None:
+            return None
+        if key not in self._contract_rows:
+            self._contract_rows[key] = index_contracts(df)
+        return get_option(df, contract, start_time, end_time, self._contract_rows[key])
+
+    def index_files(self, timeframe, quicktest=False):
+        dataset = "quicktest" if quicktest else "full"
+        return sorted(key[3] for key in self.manifest if key[:3] == ("index", timeframe, dataset))
+
+    def load_index(self, timeframe, file_name, quicktest=False, date=None):
+        df = self._frame(index_key(timeframe, file_name, quicktest))
+        if df is None or date is None:
+            return df
+        # the date as written in the file (local time of the exchange)
+        return df[df["Datetime"].astype(str).str[:10] == date.isoformat()]
+
+
+def init_worker(manifest):
+    """
+    Initializer of worker processes (e.g. 'multiprocessing.Pool(initializer=init_worker, initargs=(manifest,))'):
+    the pipeline of the worker reads its data from the shared data plane.
+    """
+    from data.sources import set_data_source
+    set_data_source(SharedSource(manifest))
+
+
+def _run_batch_task(job):
+    """
+    Runs a task of 'map_in_batches' in a worker. The worker switches to the frames of the job's batch
+    and releases the frames of the previous batch, so it never keeps more than one batch attached.
+    """
+    from data.sources import get_data_source, set_data_source
+    manifest, function, position, task, file_names = job
+    source = get_data_source()
+    if not (isinstance(source, SharedSource) and source.manifest == manifest):
+        if isinstance(source, SharedSource):
+            source.close()
+        set_data_source(SharedSource(manifest))
+    return position, function((task, file_names))
+
+
+def map_in_batches(pool, function, tasks, source, timeframes, quicktest=False, underlyings=("SPY",), batch_months=1):
+    """
+    Evaluates tasks that each cover some monthly files in the workers of a pool, with the data of a data
+    source in shared memory. Instead of the whole history, only 'batch_months' months are published at a
+    time: every task runs on the months of the batch it needs, and the batch is released as soon as all
+    its tasks are done, so the shared memory is bounded by the size of one batch.
+
+    Params:
+        pool: process pool (spawn context), without initializer. None runs the tasks in this process with
+            the current data source, batch by batch as well, so the tasks evaluate the same days one after
+            the other and share per-day caches (e.g. 'ConditionEvaluator.for_day')
+        function: function ((task, file_names)) -> list of results, runs in the workers
+        tasks: list of (task, file_names)
+        batch_months: number of monthly files that are published at a time (at least the number of
+            worker processes if every task covers a single month)
+
+    Returns:
+        Generator of (position of the task in tasks, list of results) for every batch of every task, in
+        the order in which they are done
+    """
+    months = []
+    for _, file_names in tasks:
+        months += [file_name for file_name in file_names if file_name not in months]
+
+    for start in range(0, len(months), batch_months):
+        batch = set(months[start:start + batch_months])
+        jobs = [(position, task, [file_name for file_name in file_names if file_name in batch])
+                for position, (task, file_names) in enumerate(tasks)]
+        if pool is None:
+            yield from ((position, function((task, file_names))) for position, task, file_names in jobs if file_names)
+            continue
+        with SharedDataPlane() as plane:
+            manifest = publish_source(plane, source, timeframes, quicktest, underlyings, file_names=batch)
+            yield from pool.imap_unordered(_run_batch_task, [(manifest, function, position, task, file_names)
+                                                             for position, task, file_names in jobs if file_names])
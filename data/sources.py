@@ -0,0 +1,389 @@
+# Pluggable sources of option and index data: csv files or an indexed SQLite database
+import os
+import glob
+import sqlite3
+from abc import ABC, abstractmethod
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from utils.options_helper import (OPTIONS_DIR, get_options_file_path, get_option_roots, get_option, index_contracts,
+                                  to_utc_ns, rescale_legacy_prices)
+from utils.contract_codec import encode_tickers, decode_contracts
+from data.availability import load_availability
+
+"""Directories of the monthly index files per timeframe, for the full data and the quicktest data."""
+INDEX_FILE_DIRS = {
+    "1min": "dev/data/polygon/index_flat_files/1_min_aggregates",
+    "5min": "dev/data/polygon/index_flat_files/5_min_aggregates"
+}
+QUICKTEST_DIR = "dev/data/polygon/quick_test_files"
+QUICKTEST_INDEX_FILE_DIRS = {
+    "1min": f"{QUICKTEST_DIR}/1_min",
+    "5min": f"{QUICKTEST_DIR}/5_min"
+}
+
+"""Options data of the days of the quicktest dataset (see data/quicktest_builder.py)."""
+QUICKTEST_OPTIONS_DIR = f"{QUICKTEST_DIR}/options_flat_files"
+
+"""Default location of the SQLite database (see 'SQLiteSource')."""
+SQLITE_PATH = "dev/data/market_data.sqlite"
+
+
+def time_window_ns(date, start_time, end_time):
+    """Returns the time window of a day as (start, end) in UTC nanoseconds, both inclusive."""
+    day = pd.Timestamp(date)
+    return (day + pd.Timedelta(f"{start_time}:00")).value, (day + pd.Timedelta(f"{end_time}:00")).value
+
+
+class DataSource(ABC):
+    """
+    Interface of the data sources. Option data is returned in the format of 'load_options_for_underlyings'
+    (naive UTC 'Datetime' column and integer 'contract' column), index data in the format of the monthly
+    index files.
+    """
+    # sources that a parent process hands to its workers are not replaced by 'use_data_source'
+    pinned = False
+
+    @abstractmethod
+    def load_options(self, date, underlyings):
+        """Returns a dictionary, underlying -> options data of the day (None if not available)."""
+        pass
+
+    @abstractmethod
+    def has_options(self, date, underlying):
+        """Returns True if options data of the underlying is available for the day."""
+        pass
+
+    def load_day_options(self, date, underlying):
+        """
+        Returns the options data of one underlying for the day (None if not available). Sources that keep
+        loaded days return the kept data instead of reading the day again.
+        """
+        return self.load_options(date, [underlying])[underlying]
+
+    def load_availability(self, date, underlying):
+        """Returns the 'DayAvailability' of the day (see data/availability.py), None if the source has none."""
+        return None
+
+    @abstractmethod
+    def get_option(self, date, contract, start_time="00:00", end_time="23:59", underlying="SPY"):
+        """
+        Returns the bars of one contract (key, see utils/contract_codec.py) within the time window of the day.
+        None if the source has no options data of the underlying for the day.
+        """
+        pass
+
+    @abstractmethod
+    def index_files(self, timeframe, quicktest=False):
+        """Returns the sorted names of the monthly index files of a timeframe, e.g. ['2025-01.csv', ...]."""
+        pass
+
+    @abstractmethod
+    def load_index(self, timeframe, file_name, quicktest=False, date=None):
+        """
+        Returns the index data of a monthly file, or only of one day of it. None if the month is not available.
+        """
+        pass
+
+
+class FileSource(DataSource):
+    """
+    Reads the csv files, as the pipeline always did: a whole day of options data is read and filtered in
+    memory. The last 'cached_days' loaded days are kept, so the contracts of a day are looked up without
+    reading the file again.
+    """
+    def __init__(self, options_dir=OPTIONS_DIR, index_file_dirs=INDEX_FILE_DIRS, quicktest_index_file_dirs=QUICKTEST_INDEX_FILE_DIRS,
+                 cached_days=1):
+        self.options_dir = options_dir
+        self.index_file_dirs = index_file_dirs
+        self.quicktest_index_file_dirs = quicktest_index_file_dirs
+        self.cached_days = cached_days
+        self._days = OrderedDict()  # (date, underlying) -> (options data, contract rows), least recently used first
+
+    def load_options(self, date, underlyings):
+        result = {}
+        missing = []
+        for underlying in underlyings:
+            filepath = get_options_file_path(date, underlying, self.options_dir)
+            if filepath.exists():
+                df = pd.read_csv(filepath)
+                # ingested days without rows of the underlying have an empty partition
+                result[underlying] = None if df.empty else df
+            else:
+                missing.append(underlying)
+
+        if missing:
+            filepath = get_options_file_path(date, options_dir=self.options_dir)
+            df = None
+            if not filepath.exists():
+                print("Path does not exist: ", filepath)
+            elif "Datetime" not in pd.read_csv(filepath, nrows=0).columns:
+                # a raw polygon flat file, it is only read through the partitions of 'ingest_day_file'
+                print("Options file is not preprocessed: ", filepath)
+            else:
+                df = pd.read_csv(filepath)
+                roots = get_option_roots(df["ticker"])
+
+            # a combined day file of the old pipeline, its prices are rescaled per root
+            for underlying in missing:
+                result[underlying] = None if df is None else rescale_legacy_prices(df[roots == underlying], underlying)
+
+        for underlying, df in result.items():
+            if df is not None:
+                df = df.copy()
+                df['Datetime'] = pd.to_datetime(df['Datetime'] / 1e9, unit='s')
+                df['contract'] = encode_tickers(df['ticker'])
+                result[underlying] = df
+
+        return result
+
+    def _load_day(self, date, underlying):
+        key = (date, underlying)
+        if key in self._days:
+            self._days.move_to_end(key)
+        else:
+            df = self.load_options(date, [underlying])[underlying]
+            self._days[key] = (df, None if df is None else index_contracts(df))
+            while len(self._days) > self.cached_days:
+                self._days.popitem(last=False)
+        return self._days[key]
+
+    def has_options(self, date, underlying):
+        return self._load_day(date, underlying)[0] is not None
+
+    def load_day_options(self, date, underlying):
+        return self._load_day(date, underlying)[0]
+
+    def load_availability(self, date, underlying):
+        return load_availability(date, underlying, self.options_dir)
+
+    def get_option(self, date, contract, start_time="00:00", end_time="23:59", underlying="SPY"):
+        df, contract_rows = self._load_day(date, underlying)
+        if df is None:
+            return None
+        return get_option(df, contract, start_time, end_time, contract_rows)
+
+    def _index_dirs(self, quicktest):
+        return self.quicktest_index_file_dirs if quicktest else self.index_file_dirs
+
+    def index_files(self, timeframe, quicktest=False):
+        return sorted(os.path.basename(path) for path in glob.glob(os.path.join(self._index_dirs(quicktest)[timeframe], "*.csv")))
+
+    def load_index(self, timeframe, file_name, quicktest=False, date=None):
+        path = os.path.join(self._index_dirs(quicktest)[timeframe], file_name)
+        if not os.path.exists(path):
+            return None
+        df = pd.read_csv(path)
+        if date is not None:
+            # the date as written in the file (local time of the exchange)
+            df = df[df["Datetime"].astype(str).str[:10] == date.isoformat()]
+        return df
+
+
+class SQLiteSource(DataSource):
+    """
+    Options and index data in one SQLite file. Options bars are indexed by (date, underlying, expiry,
+    right, strike, minute) and index bars by (timeframe, dataset, month, minute), so contract, time
+    window and day filters are answered from the index instead of reading whole files.
+
+    Fill the database from the csv files with 'import_files' (or 'import_options' / 'import_index').
+
+    Params:
+        path: path of the database file
+    """
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        self._connection = None
+        self._pid = None
+
+    @property
+    def connection(self):
+        # one connection per process, sqlite connections must not be shared with forked processes
+        if self._connection is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._pid = os.getpid()
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _table_exists(self, table):
+        return self.connection.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone() is not None
+
+    def import_options(self, date, underlying, df):
+        """
+        Stores the options data of a day (format of 'FileSource.load_options'). Existing data of the day
+        and underlying is replaced.
+        """
+        fields = decode_contracts(df["contract"].to_numpy())
+        rows = df.drop(columns=["Datetime", "contract"]).assign(
+            date=date.isoformat(),
+            underlying=underlying,
+            expiry=fields["expiry"].dt.strftime("%Y-%m-%d").to_numpy(),
+            is_call=fields["is_call"].astype(int).to_numpy(),
+            strike_cents=fields["strike_cents"].to_numpy(),
+            minute=to_utc_ns(df["Datetime"]),
+            contract=df["contract"].to_numpy()
+        )
+        with self.connection:
+            if self._table_exists("options"):
+                self.connection.execute("DELETE FROM options WHERE date = ? AND underlying = ?", (date.isoformat(), underlying))
+            rows.to_sql("options", self.connection, if_exists="append", index=False)
+            self.connection.execute("CREATE INDEX IF NOT EXISTS options_contract ON options "
+                                    "(date, underlying, expiry, is_call, strike_cents, minute)")
+
+    def import_index(self, timeframe, file_name, df, quicktest=False):
+        """
+        Stores a monthly index file. Existing data of the month is replaced. All columns of the file are kept.
+        """
+        month = file_name.removesuffix(".csv")
+        dataset = "quicktest" if quicktest else "full"
+        rows = df.assign(timeframe=timeframe, dataset=dataset, month=month,
+                         day=df["Datetime"].astype(str).str[:10].to_numpy(),
+                         minute=to_utc_ns(pd.to_datetime(df["Datetime"], utc=True)))
+        with self.connection:
+            if self._table_exists("index_bars"):
+                self.connection.execute("DELETE FROM index_bars WHERE timeframe = ? AND dataset = ? AND month = ?",
+                                        (timeframe, dataset, month))
+            rows.to_sql("index_bars", self.connection, if_exists="append", index=False)
+            self.connection.execute("CREATE INDEX IF NOT EXISTS index_bars_month ON index_bars (timeframe, dataset, month, minute)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS index_bars_day ON index_bars (timeframe, dataset, day, minute)")
+
+    def import_files(self, underlyings=("SPY",), file_source=None):
+        """
+        Imports all options days of the underlyings and all index files (full and quicktest) of a
+        'FileSource' (defaults to the default file locations).
+        """
+        file_source = file_source or FileSource()
+        dates = set()
+        for path in glob.glob(os.path.join(file_source.options_dir, "*", "*.csv")) + glob.glob(os.path.join(file_source.options_dir, "*", "*", "*.csv")):
+            try:
+                dates.add(pd.Timestamp(os.path.basename(path).removesuffix(".csv")).date())
+            except ValueError:
+                continue
+        for date in sorted(dates):
+            for underlying, df in file_source.load_options(date, list(underlyings)).items():
+                if df is not None and not df.empty:
+                    self.import_options(date, underlying, df)
+            print("imported options: ", date)
+
+        for quicktest in (False, True):
+            for timeframe in file_source._index_dirs(quicktest):
+                for file_name in file_source.index_files(timeframe, quicktest):
+                    self.import_index(timeframe, file_name, file_source.load_index(timeframe, file_name, quicktest), quicktest)
+                    print("imported index: ", timeframe, file_name, "(quicktest)" if quicktest else "")
+
+    def _options_frame(self, rows):
+        if rows.empty:
+            return rows
+        rows = rows.copy()
+        rows["Datetime"] = pd.to_datetime(rows["minute"], unit="ns")
+        return rows.drop(columns=["date", "underlying", "expiry", "is_call", "strike_cents", "minute"])
+
+    def load_options(self, date, underlyings):
+        result = {}
+        for underlying in underlyings:
+            if not self._table_exists("options"):
+                result[underlying] = None
+                continue
+            rows = pd.read_sql_query("SELECT * FROM options WHERE date = ? AND underlying = ? ORDER BY minute",
+                                     self.connection, params=(date.isoformat(), underlying))
+            result[underlying] = None if rows.empty else self._options_frame(rows)
+        return result
+
+    def has_options(self, date, underlying):
+        if not self._table_exists("options"):
+            return False
+        return self.connection.execute("SELECT 1 FROM options WHERE date = ? AND underlying = ? LIMIT 1",
+                                       (date.isoformat(), underlying)).fetchone() is not None
+
+    def get_option(self, date, contract, start_time="00:00", end_time="23:59", underlying="SPY"):
+        if not self.has_options(date, underlying):
+            return None
+        fields = decode_contracts(np.array([contract]))
+        if fields["root"][0] is None:
+            return self._options_frame(pd.DataFrame())
+        start, end = time_window_ns(date, start_time, end_time)
+        rows = pd.read_sql_query(
+            "SELECT * FROM options WHERE date = ? AND underlying = ? AND expiry = ? AND is_call = ? AND strike_cents = ? "
+            "AND minute BETWEEN ? AND ? ORDER BY minute",
+            self.connection,
+            params=(date.isoformat(), underlying, fields["expiry"][0].strftime("%Y-%m-%d"), int(fields["is_call"][0]),
+                    int(fields["strike_cents"][0]), start, end))
+        return self._options_frame(rows)
+
+    def index_files(self, timeframe, quicktest=False):
+        if not self._table_exists("index_bars"):
+            return []
+        months = self.connection.execute("SELECT DISTINCT month FROM index_bars WHERE timeframe = ? AND dataset = ? ORDER BY month",
+                                         (timeframe, "quicktest" if quicktest else "full")).fetchall()
+        return [f"{month}.csv" for (month,) in months]
+
+    def load_index(self, timeframe, file_name, quicktest=False, date=None):
+        if not self._table_exists("index_bars"):
+            return None
+        dataset = "quicktest" if quicktest else "full"
+        if date is None:
+            query, params = "month = ?", (file_name.removesuffix(".csv"),)
+        else:
+            query, params = "day = ?", (date.isoformat(),)
+        rows = pd.read_sql_query(f"SELECT * FROM index_bars WHERE timeframe = ? AND dataset = ? AND {query} ORDER BY minute",
+                                 self.connection, params=(timeframe, dataset, *params))
+        if rows.empty:
+            return None
+        return rows.drop(columns=["timeframe", "dataset", "month", "day", "minute"])
+
+
+"""Data source used by the pipeline, see 'use_data_source'."""
+_data_source = FileSource()
+
+
+def create_data_source(kind="file", path=SQLITE_PATH):
+    """
+    Creates a data source by name: 'file' (csv files), 'sqlite' (database at path) or 'quicktest' (the csv
+    files of the quicktest dataset only, index and options data, see data/quicktest_builder.py).
+    """
+    if kind == "file":
+        return FileSource()
+    if kind == "sqlite":
+        return SQLiteSource(path)
+    if kind == "quicktest":
+        return FileSource(options_dir=QUICKTEST_OPTIONS_DIR, index_file_dirs=QUICKTEST_INDEX_FILE_DIRS)
+    raise ValueError(f"Unknown data source '{kind}'. Use 'file', 'sqlite' or 'quicktest'.")
+
+
+def get_data_source():
+    return _data_source
+
+
+def set_data_source(source):
+    global _data_source
+    _data_source = source
+
+
+def use_data_source(kind="file", path=SQLITE_PATH):
+    """
+    Sets the data source of the pipeline (e.g. from eval_config.DATA_SOURCE), keeping the current one
+    if it already matches or was pinned by a parent process (see data/shared_data.py).
+    """
+    current = get_data_source()
+    if current.pinned:
+        return current
+    if kind == "file" and isinstance(current, FileSource) and current.options_dir != QUICKTEST_OPTIONS_DIR:
+        return current
+    if kind == "quicktest" and isinstance(current, FileSource) and current.options_dir == QUICKTEST_OPTIONS_DIR:
+        return current
+    if kind == "sqlite" and isinstance(current, SQLiteSource) and current.path == path:
+        return current
+    set_data_source(create_data_source(kind, path))
+    return get_data_source()
+
+
+if __name__ == "__main__":
+    # build the database from the csv files
+    source = SQLiteSource()
+    source.import_files(underlyings=["SPY", "SPXW", "QQQ"])
+    print("saved: ", source.path)
@@ -1,4 +1,4 @@
-from eval_functions import run_total_eval
+from eval_functions import run_total_eval, run_spread_width_sweep
 from strategies.strategies import *
 
 def mm_tuning(quicktest=False, experiment_name="MM Tuning"):
@@ -65,6 +65,18 @@ def time_window_tuning(quicktest=False):
 
 #run_total_eval(experiment_name="Exit SL/TP stops", exit_w_mm=True)
 
+# the same grid as 'mm_tuning', evaluated by workers on any number of hosts (see tuning/distributed_sweep.py),
+# start workers with 'python -m tuning.distributed_sweep work' and collect with 'aggregate_sweep("Exit SL/TP grid")'
+#from tuning.distributed_sweep import submit_sweep, aggregate_sweep, grid
+#submit_sweep("Exit SL/TP grid", grid(stop_loss=[1, 1.5, 2], take_profit=[1.5, 2, 2.5, 3, 3.5, 4]), experiment_name="MM Tuning")
+
+# SL/TP and spread modes searched with successive halving: most configs only see a few months (see tuning/successive_halving.py)
+#from tuning.successive_halving import run_search
+#run_search("MM Tuning", {"stop_loss": [1, 1.5, 2], "take_profit": [1.5, 2, 2.5, 3, 3.5, 4], "spread_mode": ["OTM", "ITM", "Middle ITM"]}, processes=8)
+
+# spread widths of 5 to 25 points (SPY strikes * 10), evaluated in one pass over the data
+#run_spread_width_sweep(experiment_name="ZeroTheta Spread Width", spread_widths=[50, 100, 150, 200, 250])
+
 run_total_eval(experiment_name="ZeroTheta Spread Calculation Strat", run_name="Enforce OTM", enforce_ITM=False, middle_ITM=False, enforce_OTM=True)
 run_total_eval(experiment_name="ZeroTheta Spread Calculation Strat", run_name="Enforce ITM", enforce_ITM=True, middle_ITM=False, enforce_OTM=False)
 run_total_eval(experiment_name="ZeroTheta Spread Calculation Strat", run_name="Middle ITM", enforce_ITM=False, middle_ITM=True, enforce_OTM=False)
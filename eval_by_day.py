@@ -4,84 +4,129 @@ import pandas as pd
 from datetime import date
 from strategies.conditions import Conditions
 from strategies.strategies import DeHighInLowSimple, LHLFormation
+from strategies.registry import get_strategy_spec
+from strategies.expressions import ConditionEvaluator
 #from strategies.strat_lhl_formation import LHLFormation
 from data.data_processing import Preprocessor
-from utils.chart_visualization import *
+from data.sources import use_data_source
 from utils.options_helper import *
 from utils.report_utils import *
 import eval_config
 
 
-target_date = date(eval_config.YEAR, eval_config.MONTH, eval_config.DAY)
-
-# 1. load test data files for target date
-month_str = target_date.strftime("%Y-%m")
-index_file_paths = [  # has to include all files necessary for the test a strategy
-    f"dev/data/polygon/index_flat_files/1_min_aggregates/{month_str}.csv",
-    f"dev/data/polygon/index_flat_files/5_min_aggregates/{month_str}.csv"
-]
-data = []
-for file_path in index_file_paths:
-    file = pd.read_csv(file_path)
-    data.append(file)
-    
-
-# 2. Pre-process data: split data per day, extract target date, calculate indicators, and filter data for time window
-
-# group dataframe by day (maintain order of the days)
-data = [Preprocessor.split_by_day(df) for df in data]
-
-# extract target date from each file
-data_ = []
-if target_date is not None:
-    for file in data:
-        day = file[target_date] # Throws exception if target date is not available
-        data_.append(day)
-
-# calculate indicators
-data_ = [Conditions.get_all(df) for df in data_]
-
-# get relevant time window
-data_ = [Preprocessor.get_time_window_data(df, start_time=eval_config.START_TIME, end_time=eval_config.END_TIME) for df in data_]
-
-
-# 3. Apply strategy, to get entry signals
-strategy = DeHighInLowSimple()
-
-# DeHighInLow
-if not strategy.__class__.__name__ == "LHLFormation":
-    entry_signals = strategy.generate_entries(data_[0], data_[1], 
-                                        use_trend_line=eval_config.USE_TREND_LINE, 
-                                        use_stoch_rsi=eval_config.USE_STOCH_RSI)
-
-# LHLFormation
-if strategy.__class__.__name__ == "LHLFormation":
-    entry_signals = strategy.generate_entries(df_1min_index=data_[0], date=target_date,
-                                        start_time=eval_config.START_TIME,
-                                        end_time=eval_config.END_TIME,
-                                        enforce_ITM=eval_config.ENFORCE_ITM,
-                                        middle_ITM=eval_config.MIDDLE_ITM)
-
-
-# 4. Get spread charts and apply strategy again, to get exit signals
-spreads = get_spreads(entry_signals, target_date, eval_config.START_TIME, eval_config.END_TIME, enforce_ITM=eval_config.ENFORCE_ITM, middle_ITM=eval_config.MIDDLE_ITM, enforce_OTM=eval_config.ENFORCE_OTM)
-trades, report_metrics = strategy.generate_trades(entry_signals, spreads, eval_config.STOP_LOSS, eval_config.TAKE_PROFIT, eval_config.EXIT_W_OPEN, eval_config.EXIT_W_MM, money_management=(eval_config.MM_TYPE, eval_config.EXIT_BASED_ON_CLOSE))
-
-# 5. Evaluation
-print(report_metrics)
-total_profit = 0
-for trade in trades:
-    individual_profit = trade['profit']
-    total_profit += individual_profit
-    print(f"Trade profit: {individual_profit}")
-
-print(f"Total combined profit: {total_profit}")
-
-#print_signals(entry_signals)
-
-# visualization of strategy signals
-chart_title = f"{target_date} || Confirm with 5 min: {eval_config.CONFIRM_WITH_5MIN} || Use trend line: {eval_config.USE_TREND_LINE} || Use stoch RSI: {eval_config.USE_STOCH_RSI}"
-
-#plot_candle_chart_with_markers(entry_signals, title=chart_title, signal_column_1="entry_bull_put", signal_column_2="entry_bear_call")
-#plot_candle_chart_with_markers(entry_signals, title=chart_title, signal_column_1="lhl_formation", signal_column_2="lhl_first_low", signal_column_3="lhl_high")
-#plot_candle_chart_with_markers(signals, title=chart_title, signal_column_1="bp_trend_line_signal", signal_column_2="bc_trend_line_signal")
+def load_index_day(source, timeframe, target_date):
+    """
+    Returns the index data of one day (only the target day is read if the data source supports it).
+    Throws an exception if the target date is not available.
+    """
+    file_name = f"{target_date.strftime('%Y-%m')}.csv"
+    df = source.load_index(timeframe, file_name, date=target_date)
+    # group dataframe by day (maintain order of the days) and extract the target date
+    return Preprocessor.split_by_day(df)[target_date]
+
+
+def prepare_index_day(df, indicators, start_time, end_time):
+    """
+    Calculates the indicators of one day of index data.
+
+    Returns:
+        (whole day with indicators, data of the time window)
+    """
+    df = Conditions.get_all(df, indicators=indicators)
+    return df, Preprocessor.get_time_window_data(df, start_time=start_time, end_time=end_time)
+
+
+def evaluate_day(strategy, target_date, frames, config=eval_config, days=None):
+    """
+    Applies a strategy to one day of prepared index data (see 'prepare_index_day') and simulates the trades.
+
+    Params:
+        frames: dictionary, timeframe -> prepared index data of the time window
+        config: settings, eval_config or an object with the same attributes
+        days: dictionary, timeframe -> whole day with indicators, condition expressions are evaluated
+            on it so indicators have their warm-up (defaults to frames)
+
+    Returns:
+        (entry signals, trades, report metrics)
+    """
+    spec = get_strategy_spec(strategy)
+
+    # apply strategy, to get entry signals
+    values = {
+        "date": target_date,
+        "start_time": config.START_TIME,
+        "end_time": config.END_TIME,
+        "use_trend_line": config.USE_TREND_LINE,
+        "use_stoch_rsi": config.USE_STOCH_RSI,
+        "enforce_ITM": config.ENFORCE_ITM,
+        "middle_ITM": config.MIDDLE_ITM,
+        "enforce_OTM": config.ENFORCE_OTM,
+        "evaluator": ConditionEvaluator.for_day((days or frames)[spec.timeframes[0]])
+    }
+    args, kwargs = spec.entry_arguments(frames, values)
+    entry_signals = strategy.generate_entries(*args, **kwargs)
+
+    # get spread charts and apply strategy again, to get exit signals
+    spreads = get_spreads(entry_signals, target_date, config.START_TIME, config.END_TIME, enforce_ITM=config.ENFORCE_ITM, middle_ITM=config.MIDDLE_ITM, enforce_OTM=config.ENFORCE_OTM,
+                          select_by_premium=config.SELECT_BY_PREMIUM, target_premium=config.TARGET_PREMIUM, select_nearest_listed=config.SELECT_NEAREST_LISTED,
+                          underlying=config.UNDERLYING, spread_width=config.SPREAD_WIDTH)
+    trades, report_metrics = strategy.generate_trades(entry_signals, spreads, config.STOP_LOSS, config.TAKE_PROFIT, config.EXIT_W_OPEN, config.EXIT_W_MM, money_management=(config.MM_TYPE, config.EXIT_BASED_ON_CLOSE))
+    return entry_signals, trades, report_metrics
+
+
+def eval_by_day(target_date=None, strategy=None, plot=False):
+    """
+    Evaluates a strategy on a single day with the settings of eval_config and prints the trades.
+    For repeated evaluations of the same days, see eval_server.py.
+
+    Params:
+        target_date: day to evaluate, defaults to YEAR, MONTH, DAY of eval_config
+        strategy: strategy instance, defaults to DeHighInLowSimple
+        plot: If True, the entry signals are plotted (imports plotly)
+
+    Returns:
+        (entry signals, trades, report metrics)
+    """
+    if target_date is None:
+        target_date = date(eval_config.YEAR, eval_config.MONTH, eval_config.DAY)
+    if strategy is None:
+        strategy = DeHighInLowSimple()
+    spec = get_strategy_spec(strategy)
+
+    # 1. load test data for target date (only the timeframes the strategy depends on)
+    source = use_data_source(eval_config.DATA_SOURCE, eval_config.DATA_SOURCE_PATH)
+    data = {timeframe: load_index_day(source, timeframe, target_date) for timeframe in spec.timeframes}
+
+    # 2. Pre-process data: calculate indicators, and filter data for time window
+    prepared = {timeframe: prepare_index_day(df, spec.indicators, eval_config.START_TIME, eval_config.END_TIME) for timeframe, df in data.items()}
+    days = {timeframe: day for timeframe, (day, _) in prepared.items()}
+    data = {timeframe: window for timeframe, (_, window) in prepared.items()}
+
+    # 3. Apply strategy, to get entry signals, 4. get spread charts and apply strategy again, to get exit signals
+    entry_signals, trades, report_metrics = evaluate_day(strategy, target_date, data, days=days)
+
+    # 5. Evaluation
+    print(report_metrics)
+    total_profit = 0
+    for trade in trades:
+        individual_profit = trade['profit']
+        total_profit += individual_profit
+        print(f"Trade profit: {individual_profit}")
+
+    print(f"Total combined profit: {total_profit}")
+
+    #print_signals(entry_signals)
+
+    # visualization of strategy signals
+    if plot:
+        from utils.chart_visualization import plot_candle_chart_with_markers  # imported here, plotly is slow to import
+        chart_title = f"{target_date} || Confirm with 5 min: {eval_config.CONFIRM_WITH_5MIN} || Use trend line: {eval_config.USE_TREND_LINE} || Use stoch RSI: {eval_config.USE_STOCH_RSI}"
+        plot_candle_chart_with_markers(entry_signals, title=chart_title, signal_column_1="entry_bull_put", signal_column_2="entry_bear_call")
+        #plot_candle_chart_with_markers(entry_signals, title=chart_title, signal_column_1="lhl_formation", signal_column_2="lhl_first_low", signal_column_3="lhl_high")
+        #plot_candle_chart_with_markers(signals, title=chart_title, signal_column_1="bp_trend_line_signal", signal_column_2="bc_trend_line_signal")
+
+    return entry_signals, trades, report_metrics
+
+
+if __name__ == "__main__":
+    eval_by_day()
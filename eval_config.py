@@ -6,6 +6,13 @@ MONTH = 1
 DAY = 8
 
 
+"""
+Root symbol of the traded options, e.g. 'SPY', 'SPXW' or 'QQQ' (see UNDERLYING_PRICE_SCALE in
+utils/options_helper.py for the price scale of each underlying).
+"""
+UNDERLYING = "SPY"
+
+
 #--------------------------------------------------------------------------------------------------
 # STRATEGY AND PARAMETERS
 #--------------------------------------------------------------------------------------------------
@@ -71,6 +78,25 @@ ENFORCE_ITM = False
 MIDDLE_ITM = False
 ENFORCE_OTM = True
 
+"""
+Difference between the strike prices of the sold and the bought option, in the scale of the data (SPY
+strikes * 10, so 20 means a $2 wide SPY spread). Several widths can be compared in one pass over the data
+with 'run_spread_width_sweep' in eval_functions.py.
+"""
+SPREAD_WIDTH = 20
+
+"""
+Strike selection from the option chain at signal time (see 'utils/chain_snapshot.py'). If one of these
+options is True, it replaces the ITM / OTM options above.
+
+SELECT_BY_PREMIUM: sell the option whose last price is closest to TARGET_PREMIUM. Prices are in the
+scale of the options data (SPY prices * 10), so TARGET_PREMIUM = 10 means a credit of about $1.00.
+SELECT_NEAREST_LISTED: sell the listed strike closest to the index price.
+"""
+SELECT_BY_PREMIUM = False
+TARGET_PREMIUM = 10
+SELECT_NEAREST_LISTED = False
+
 
 #--------------------------------------------------------------------------------------------------
 # CALCULATION OF EXITS OPTIONS
@@ -106,3 +132,29 @@ limit triggered the exit of a trade, the profit of that trade equals TAKE_PROFIT
 """
 EXIT_W_MM = False
 
+
+
+#--------------------------------------------------------------------------------------------------
+# DATA SOURCE OPTIONS
+#--------------------------------------------------------------------------------------------------
+
+"""
+Where index and options data are read from (see data/sources.py). Options: 'file' reads the csv files,
+'sqlite' queries the database at DATA_SOURCE_PATH, which only reads the bars that are needed (e.g. one
+contract in the time window instead of a whole day). Build the database with 'python -m data.sources'.
+'quicktest' reads only the self-contained quicktest dataset (index and options data of a stratified sample
+of days), build it with 'python -m data.quicktest_builder'.
+"""
+DATA_SOURCE = "file"
+DATA_SOURCE_PATH = "dev/data/market_data.sqlite"
+
+
+#--------------------------------------------------------------------------------------------------
+# EXPERIMENT TRACKING OPTIONS
+#--------------------------------------------------------------------------------------------------
+
+"""
+If 'MLFLOW_OFFLINE' is True, runs are logged to a local file store in the folder 'mlruns' instead of
+the mlflow tracking server. View them with 'mlflow ui --backend-store-uri mlruns'.
+"""
+MLFLOW_OFFLINE = False
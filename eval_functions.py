@@ -2,18 +2,20 @@ import os
 import glob
 import pandas as pd
 import numpy as np
-import mlflow
 import datetime
 from collections import OrderedDict
+from contextlib import nullcontext
 from data.data_processing import Preprocessor
 from strategies.conditions import Conditions
 from strategies.strategies import *
+from strategies.expressions import ConditionEvaluator
+from strategies.registry import get_strategy_spec
 from utils.report_utils import *
-from utils.chart_visualization import *
 from utils.options_helper import *
+from data.sources import use_data_source, get_data_source
 import eval_config
 
-def run_eval_month(df_1_min, df_5_min, file_name,
+def run_eval_month(index_data, file_name,
                start_time=eval_config.START_TIME, 
                end_time=eval_config.END_TIME,
                strategy = eval_config.STRATEGY,
@@ -22,6 +24,12 @@ def run_eval_month(df_1_min, df_5_min, file_name,
                enforce_ITM=eval_config.ENFORCE_ITM,
                middle_ITM=eval_config.MIDDLE_ITM,
                enforce_OTM=eval_config.ENFORCE_OTM,
+               select_by_premium=eval_config.SELECT_BY_PREMIUM,
+               target_premium=eval_config.TARGET_PREMIUM,
+               select_nearest_listed=eval_config.SELECT_NEAREST_LISTED,
+               underlying=eval_config.UNDERLYING,
+               spread_width=eval_config.SPREAD_WIDTH,
+               spread_widths=None,
                stop_loss=eval_config.STOP_LOSS,
                take_profit=eval_config.TAKE_PROFIT, 
                exit_w_open=eval_config.EXIT_W_OPEN,
@@ -29,8 +37,22 @@ def run_eval_month(df_1_min, df_5_min, file_name,
                exit_w_midpoint=eval_config.EXIT_W_MIDPOINT,
                mm_type=eval_config.MM_TYPE,
                exit_based_on_close=eval_config.EXIT_BASED_ON_CLOSE):
+    """
+    Evaluates a strategy on one month of index data.
+
+    Params:
+        index_data: dictionary, timeframe -> index data of the month. Has to contain every
+            timeframe declared for the strategy in 'strategies/registry.py'.
+        file_name: name of the monthly file, e.g. '2025-01.csv'
+        spread_widths: Optional list of spread widths. If given, the signals are generated once and the
+            trades of all widths are evaluated from a single load of each day's options data.
+
+    Returns:
+        (signal_stats, trade_stats), or with 'spread_widths' a dictionary spread width -> (signal_stats, trade_stats)
+    """
     # 1. load test data files for target date
-    data = [df_1_min, df_5_min]
+    spec = get_strategy_spec(strategy)
+    data = [index_data[timeframe] for timeframe in spec.timeframes]
 
     # 2. Pre-process data: calculate indicators and split data per day
     # 2.1 group dataframe by day (maintain order of the days) and filter for dates
@@ -39,17 +61,20 @@ def run_eval_month(df_1_min, df_5_min, file_name,
    
     year, month = map(int, file_name.removesuffix(".csv").split("-"))
     common_dates = {
-        date for date in (set(data[0].keys()) & set(data[1].keys()))
+        date for date in set.intersection(*(set(d.keys()) for d in data))
         if date.year == year and date.month == month
     }
     data = [OrderedDict((key, value) for key, value in d.items() if key in common_dates) for d in data]
 
-    # 2.2 calculate indicators
+    # 2.2 calculate indicators (only the ones the strategy depends on)
     data = [
-        OrderedDict((key, Conditions.get_all(df)) for key, df in file.items())
+        OrderedDict((key, Conditions.get_all(df, indicators=spec.indicators)) for key, df in file.items())
         for file in data
     ]
 
+    # whole days with indicators, condition expressions are evaluated on them (indicator warm-up)
+    days = data
+
     # 2.3 get relevant time window
     data = [
         OrderedDict((key, Preprocessor.get_time_window_data(df, start_time=start_time, end_time=end_time)) for key, df in file.items())
@@ -62,33 +87,47 @@ def run_eval_month(df_1_min, df_5_min, file_name,
 
     # apply 'generate_signals' once for each date and store results in ordered dict
     for date in common_dates:
-        df_1min_index = data[0][date]
-        df_5min_index = data[1][date]
-
-        signals = {}
-        if strategy.__class__.__name__ == "DeHighInLowSimple":
-            signals = strategy.generate_entries(df_1min_index, df_5min_index, use_trend_line=use_trend_line, use_stoch_rsi=use_stoch_rsi)
-        if strategy.__class__.__name__ == "LHLFormation":
-            signals = strategy.generate_entries(df_1min_index=df_1min_index, date=date, start_time=start_time, end_time=end_time, enforce_ITM=enforce_ITM, middle_ITM=middle_ITM)
+        frames = {timeframe: file[date] for timeframe, file in zip(spec.timeframes, data)}
+        values = {
+            "date": date,
+            "start_time": start_time,
+            "end_time": end_time,
+            "use_trend_line": use_trend_line,
+            "use_stoch_rsi": use_stoch_rsi,
+            "enforce_ITM": enforce_ITM,
+            "middle_ITM": middle_ITM,
+            "enforce_OTM": enforce_OTM,
+            # sub-expressions of condition expressions are computed once per day and shared with
+            # the other configs of a sweep that evaluate the same day in this process
+            "evaluator": ConditionEvaluator.for_day(days[0][date])
+        }
+        args, kwargs = spec.entry_arguments(frames, values)
+        signals = strategy.generate_entries(*args, **kwargs)
 
         if signals is not None:                                        
             signals_dict[date] = signals
 
 
-    # 4. Get spread charts and generate trades
-    trades_dict = OrderedDict()
+    # 4. Get spread charts and generate trades (the options data of a day is loaded once for all widths)
+    widths = [spread_width] if spread_widths is None else list(spread_widths)
+    trades_dicts = {width: OrderedDict() for width in widths}
     for date, signals in signals_dict.items():
-        spreads = get_spreads(signals=signals, date=date, start_time=start_time, end_time=end_time, enforce_ITM=enforce_ITM, middle_ITM=middle_ITM, enforce_OTM=enforce_OTM)
-        trades, report_metrics = strategy.generate_trades(df=signals, spreads=spreads, stop_loss=stop_loss, take_profit=take_profit, exit_w_open=exit_w_open, exit_w_mm=exit_w_mm, money_management=(mm_type, exit_based_on_close))
-
-        res = {
-            "trades": trades,
-            "spreads": spreads,
-            "spread_availability": report_metrics["spread_availability"],
-            "wins": report_metrics["wins"],
-            "losses": report_metrics["losses"]
-        }
-        trades_dict[date] = res
+        spreads_by_width = get_spreads_for_widths(signals=signals, date=date, start_time=start_time, end_time=end_time, spread_widths=widths,
+                                                  enforce_ITM=enforce_ITM, middle_ITM=middle_ITM, enforce_OTM=enforce_OTM,
+                                                  select_by_premium=select_by_premium, target_premium=target_premium,
+                                                  select_nearest_listed=select_nearest_listed, underlying=underlying)
+        for width in widths:
+            spreads = None if spreads_by_width is None else spreads_by_width[width]
+            trades, report_metrics = strategy.generate_trades(df=signals, spreads=spreads, stop_loss=stop_loss, take_profit=take_profit, exit_w_open=exit_w_open, exit_w_mm=exit_w_mm, money_management=(mm_type, exit_based_on_close))
+
+            res = {
+                "trades": trades,
+                "spreads": spreads,
+                "spread_availability": report_metrics["spread_availability"],
+                "wins": report_metrics["wins"],
+                "losses": report_metrics["losses"]
+            }
+            trades_dicts[width][date] = res
 
     # 5. Calculate evaluation metrics, print and log results to ml flow
     print("----------------------------------------------")
@@ -98,17 +137,294 @@ def run_eval_month(df_1_min, df_5_min, file_name,
     print(signal_stats)
     print(signal_stats_per_day)
 
-    print("----------------------------------------------")
-    print("TRADE AND PROFIT RESULTS ", file_name)
-    print("----------------------------------------------")
-    trade_stats, trade_stats_per_day = summarize_trades(trades_dict)
-    print(trade_stats)
-    print(trade_stats_per_day)
+    results = {}
+    for width, trades_dict in trades_dicts.items():
+        print("----------------------------------------------")
+        print("TRADE AND PROFIT RESULTS ", file_name, "" if spread_widths is None else f"(spread width {width})")
+        print("----------------------------------------------")
+        trade_stats, trade_stats_per_day = summarize_trades(trades_dict)
+        print(trade_stats)
+        print(trade_stats_per_day)
+        results[width] = (signal_stats, trade_stats)
 
     print("----------------------------------------------")
     print("----------------------------------------------")
 
-    return signal_stats, trade_stats
+    if spread_widths is None:
+        return results[spread_width]
+    return results
+
+
+def eval_settings(**overrides):
+    """
+    Returns the keyword arguments of 'run_eval_month' with their values from eval_config, updated with
+    'overrides'. Read at call time, so changes of eval_config after the import are respected.
+    """
+    settings = {
+        "start_time": eval_config.START_TIME,
+        "end_time": eval_config.END_TIME,
+        "strategy": eval_config.STRATEGY,
+        "use_trend_line": eval_config.USE_TREND_LINE,
+        "use_stoch_rsi": eval_config.USE_STOCH_RSI,
+        "enforce_ITM": eval_config.ENFORCE_ITM,
+        "middle_ITM": eval_config.MIDDLE_ITM,
+        "enforce_OTM": eval_config.ENFORCE_OTM,
+        "select_by_premium": eval_config.SELECT_BY_PREMIUM,
+        "target_premium": eval_config.TARGET_PREMIUM,
+        "select_nearest_listed": eval_config.SELECT_NEAREST_LISTED,
+        "underlying": eval_config.UNDERLYING,
+        "spread_width": eval_config.SPREAD_WIDTH,
+        "stop_loss": eval_config.STOP_LOSS,
+        "take_profit": eval_config.TAKE_PROFIT,
+        "exit_w_open": eval_config.EXIT_W_OPEN,
+        "exit_w_mm": eval_config.EXIT_W_MM,
+        "exit_w_midpoint": eval_config.EXIT_W_MIDPOINT,
+        "mm_type": eval_config.MM_TYPE,
+        "exit_based_on_close": eval_config.EXIT_BASED_ON_CLOSE
+    }
+    settings.update(overrides)
+    return settings
+
+
+def log_eval_params(run, settings, confirm_with_5min=eval_config.CONFIRM_WITH_5MIN):
+    """
+    Logs the evaluation settings (see 'eval_settings') as params of a run.
+    """
+    run.log_params({
+        "strategy/CONFIRM_WITH_5MIN": confirm_with_5min,
+        "strategy/USE_TREND_LINE": settings["use_trend_line"],
+        "strategy/USE_STOCH_RSI": settings["use_stoch_rsi"],
+        "__START_TIME": settings["start_time"],
+        "__END_TIME": settings["end_time"],
+        "mm/STOP_LOSS": settings["stop_loss"],
+        "mm/TAKE_PROFIT": settings["take_profit"],
+        "mm/MM_TYPE": settings["mm_type"],
+        "mm/EXIT_BASED_ON_CLOSE": settings["exit_based_on_close"],
+        "exit/EXIT_W_OPEN": settings["exit_w_open"],
+        "exit/EXIT_W_MIDPOINT": settings["exit_w_midpoint"],
+        "exit/EXIT_W_MM": settings["exit_w_mm"],
+        "spread_calc/ENFORCE_ITM": settings["enforce_ITM"],
+        "spread_calc/MIDDLE_ITM": settings["middle_ITM"],
+        "spread_calc/SELECT_BY_PREMIUM": settings["select_by_premium"],
+        "spread_calc/TARGET_PREMIUM": settings["target_premium"],
+        "spread_calc/SELECT_NEAREST_LISTED": settings["select_nearest_listed"],
+        "spread_calc/SPREAD_WIDTH": settings["spread_width"],
+        "strategy/STRATEGY": settings["strategy"].__class__.__name__,
+        "UNDERLYING": settings["underlying"]
+    })
+
+
+def run_eval_months(settings, quicktest=False, spread_widths=None, processes=None, checkpoint_path=None, file_names=None):
+    """
+    Runs 'run_eval_month' for all monthly index files.
+
+    Params:
+        settings: keyword arguments of 'run_eval_month' (see 'eval_settings')
+        spread_widths: Optional list of spread widths that are evaluated in one pass. Defaults to
+            the spread width of the settings.
+        processes: Optional number of worker processes. If given, the index and options data is loaded
+            into shared memory (see data/shared_data.py) in batches of 'processes' months, the months of
+            a batch are evaluated in parallel.
+        checkpoint_path: Optional path of a checkpoint database (see tuning/checkpoints.py). The result of
+            every month is stored as soon as it is done, months whose config and input files did not
+            change since are read from the checkpoints instead of being evaluated again.
+        file_names: Optional list of monthly files to evaluate (e.g. ['2025-01.csv']), all files by default.
+
+    Returns:
+        Dictionary, spread width -> list of (file_name, signal_stats, trade_stats), one entry per month
+    """
+    # index and options data are read from the configured data source (csv files or database)
+    source = use_data_source(eval_config.DATA_SOURCE, eval_config.DATA_SOURCE_PATH)
+
+    # only the timeframes the strategy depends on are loaded
+    timeframes = get_strategy_spec(settings["strategy"]).timeframes
+
+    widths = [settings["spread_width"]] if spread_widths is None else list(spread_widths)
+    file_names = [file_name for file_name in source.index_files("1min", quicktest) if file_names is None or file_name in file_names]
+    month_results = {}  # file name -> results per spread width
+
+    checkpoints = None
+    if checkpoint_path is not None:
+        from tuning.checkpoints import CheckpointStore, config_hash, code_hash, month_input_files
+        checkpoints = CheckpointStore(checkpoint_path)
+        code = code_hash()
+        configs = {width: config_hash({**settings, "spread_width": width}, quicktest, code) for width in widths}
+        inputs = {file_name: checkpoints.inputs_hash(month_input_files(source, file_name, timeframes, quicktest, settings["underlying"]))
+                  for file_name in file_names}
+        for file_name in file_names:
+            cached = {width: checkpoints.get(configs[width], file_name, inputs[file_name]) for width in widths}
+            if all(result is not None for result in cached.values()):
+                month_results[file_name] = cached
+        print(f"Checkpoints: {len(month_results)} of {len(file_names)} months are up to date")
+
+    settings = {**settings, "spread_widths": widths}
+    tasks = [(file_name, timeframes, quicktest, settings) for file_name in file_names if file_name not in month_results]
+
+    def collect(results):
+        for file_name, month_result in results:
+            month_results[file_name] = month_result
+            if checkpoints is not None and month_result is not None:
+                for width, (signal_stats, trade_stats) in month_result.items():
+                    checkpoints.put(configs[width], file_name, inputs[file_name], signal_stats, trade_stats)
+
+    try:
+        if processes is None or not tasks:
+            collect(map(eval_month_task, tasks))
+        else:
+            import multiprocessing
+            from data.shared_data import map_in_batches
+            with multiprocessing.get_context("spawn").Pool(processes) as pool:
+                batches = map_in_batches(pool, eval_months_task, [(task[1:], [task[0]]) for task in tasks], source, timeframes,
+                                         quicktest, underlyings=[settings["underlying"]], batch_months=processes)
+                collect(result for _, results in batches for result in results)
+    finally:
+        if checkpoints is not None:
+            checkpoints.close()
+
+    results = {width: [] for width in widths}
+    for file_name in file_names:
+        if month_results.get(file_name) is None:
+            continue
+        for width, (signal_stats, trade_stats) in month_results[file_name].items():
+            results[width].append((file_name, signal_stats, trade_stats))
+
+    return results
+
+
+def eval_month_task(task):
+    """
+    Evaluates one month with the data of the current data source, see 'run_eval_months'.
+
+    Params:
+        task: (file_name, timeframes, quicktest, settings)
+
+    Returns:
+        (file_name, results per spread width), the results are None if index data is missing
+    """
+    file_name, timeframes, quicktest, settings = task
+    source = get_data_source()
+    # get corresponding files of the other timeframes by name
+    index_data = {timeframe: source.load_index(timeframe, file_name, quicktest) for timeframe in timeframes}
+
+    if any(df is None for df in index_data.values()):
+        print(f"No matching files found for: {file_name} {timeframes}")
+        return file_name, None
+
+    return file_name, run_eval_month(index_data, file_name, **settings)
+
+
+def eval_months_task(task):
+    """
+    Evaluates several months with the data of the current data source, see 'eval_month_task'.
+
+    Params:
+        task: ((timeframes, quicktest, settings), file names)
+
+    Returns:
+        List of (file_name, results per spread width)
+    """
+    (timeframes, quicktest, settings), file_names = task
+    return [eval_month_task((file_name, timeframes, quicktest, settings)) for file_name in file_names]
+
+
+def summarize_months(month_results, verbose=True):
+    """
+    Aggregates the results of several months into the metrics that are logged per run.
+
+    Params:
+        month_results: list of (file_name, signal_stats, trade_stats), as returned by 'run_eval_months'
+        verbose: If False, the results per month are not printed.
+
+    Returns:
+        (metrics dictionary, DataFrame with the results per month)
+    """
+    # init empty report dicts
+    signal_stats_summary = {
+        'avg_entries_per_day': 0,
+        'avg_bp_entries_per_day': 0,
+        'avg_bc_entries_per_day': 0
+    }
+    trade_stats_summary = {
+        'avg_trades_per_day': 0,
+        'avg_bp_trades_per_day': 0,
+        'avg_bc_trades_per_day': 0,
+        'avg_spread_availability': 0,
+        'avg_profit_per_day': 0,
+        'total_profit': 0,
+        'total_wins': 0,
+        'total_losses': 0,
+        'win_rate': 0
+    }
+
+    results_per_month = []
+    for file_name, signal_stats, trade_stats in month_results:
+        # Update the summary dictionaries
+        for key in signal_stats_summary:
+            signal_stats_summary[key] += signal_stats[key]
+        for key in trade_stats_summary:
+            trade_stats_summary[key] += trade_stats[key]
+
+        # record results per month
+        total_trades = trade_stats['total_losses'] + trade_stats['total_wins']
+        results_per_month.append({
+            'file_name': file_name,
+            'total_profit': trade_stats['total_profit'],
+            'win_rate': trade_stats['win_rate'],
+            'total_wins': trade_stats['total_wins'],
+            'total_losses': trade_stats['total_losses'],
+            'total_trades': total_trades
+        })
+    valid_iterations = len(month_results)
+
+    # print the per month results
+    df_results_per_month = pd.DataFrame(results_per_month, columns=['file_name', 'total_profit', 'win_rate', 'total_wins', 'total_losses', 'total_trades'])
+    df_results_per_month = df_results_per_month.sort_values(by='file_name')
+    if verbose:
+        print("Per month results (Total Profit and Win Rate per File):")
+        print(df_results_per_month)
+
+    if valid_iterations > 0:
+        for key in signal_stats_summary:
+            signal_stats_summary[key] /= valid_iterations
+        for key in ['avg_trades_per_day', 'avg_bp_trades_per_day', 'avg_bc_trades_per_day', 'avg_spread_availability', 'avg_profit_per_day', 'win_rate']:
+            trade_stats_summary[key] /= valid_iterations
+
+    # calculate additional metrics
+    profit_per_trade = 0
+    total_wins = trade_stats_summary["total_wins"]
+    total_losses = trade_stats_summary["total_losses"]
+    if total_wins > 0 or total_losses > 0:
+        profit_per_trade = trade_stats_summary["total_profit"] / (total_wins + total_losses)
+
+    profit_std = df_results_per_month['total_profit'].std()
+    profit_z_score = ((df_results_per_month['total_profit'] - df_results_per_month['total_profit'].mean()) / profit_std).mean()
+
+    winrate_std = df_results_per_month['win_rate'].std()
+    winrate_z_score = ((df_results_per_month['win_rate'] - df_results_per_month['win_rate'].mean()) / winrate_std).mean()
+
+    sharpe_ratio = df_results_per_month['total_profit'].mean() / profit_std
+
+    metrics = {
+        "avg/avg_trades_per_day": trade_stats_summary["avg_trades_per_day"],
+        "avg/avg_bp_trades_per_day": trade_stats_summary["avg_bp_trades_per_day"],
+        "avg/avg_bc_trades_per_day": trade_stats_summary["avg_bc_trades_per_day"],
+        "avg/avg_spread_availability": trade_stats_summary["avg_spread_availability"],
+        "avg/avg_profit_per_day": trade_stats_summary["avg_profit_per_day"],
+        "t/total_profit": trade_stats_summary["total_profit"],
+        "t/total_wins": total_wins,
+        "t/total_losses": total_losses,
+        "win_rate": trade_stats_summary["win_rate"],
+        "profit_per_trade": profit_per_trade,
+        "avg/avg_entries_per_day": signal_stats_summary["avg_entries_per_day"],
+        "avg/avg_bp_entries_per_day": signal_stats_summary["avg_bp_entries_per_day"],
+        "avg/avg_bc_entries_per_day": signal_stats_summary["avg_bc_entries_per_day"],
+        "stat/profit_std": profit_std,
+        "stat/profit_z_score": profit_z_score,
+        "stat/winrate_std": winrate_std,
+        "stat/winrate_z_score": winrate_z_score,
+        "stat/sharpe_ratio": sharpe_ratio
+    }
+    return metrics, df_results_per_month
 
 def run_total_eval(experiment_name, run_name = f"run_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}",
                 quicktest = False,
@@ -121,171 +437,102 @@ def run_total_eval(experiment_name, run_name = f"run_{datetime.now().strftime('%
                 enforce_ITM=eval_config.ENFORCE_ITM,
                 middle_ITM=eval_config.MIDDLE_ITM,
                 enforce_OTM=eval_config.ENFORCE_OTM,
+                select_by_premium=eval_config.SELECT_BY_PREMIUM,
+                target_premium=eval_config.TARGET_PREMIUM,
+                select_nearest_listed=eval_config.SELECT_NEAREST_LISTED,
+                underlying=eval_config.UNDERLYING,
+                spread_width=eval_config.SPREAD_WIDTH,
                 stop_loss=eval_config.STOP_LOSS,
                 take_profit=eval_config.TAKE_PROFIT, 
                 exit_w_open=eval_config.EXIT_W_OPEN,
                 exit_w_midpoint=eval_config.EXIT_W_MIDPOINT,
                 exit_w_mm=eval_config.EXIT_W_MM,
                 mm_type=eval_config.MM_TYPE,
-                exit_based_on_close=eval_config.EXIT_BASED_ON_CLOSE):
-    
-    mlflow.set_experiment(experiment_name=experiment_name)
-    with mlflow.start_run(run_name=run_name):
-        mlflow.log_param("strategy/CONFIRM_WITH_5MIN", confirm_with_5min)
-        mlflow.log_param("strategy/USE_TREND_LINE", use_trend_line)
-        mlflow.log_param("strategy/USE_STOCH_RSI", use_stoch_rsi)
-        mlflow.log_param("__START_TIME", start_time)
-        mlflow.log_param("__END_TIME", end_time)
-        mlflow.log_param("mm/STOP_LOSS", stop_loss)
-        mlflow.log_param("mm/TAKE_PROFIT", take_profit)
-        mlflow.log_param("mm/MM_TYPE", mm_type)
-        mlflow.log_param("mm/EXIT_BASED_ON_CLOSE", exit_based_on_close)
-        mlflow.log_param("exit/EXIT_W_OPEN", exit_w_open)
-        mlflow.log_param("exit/EXIT_W_MIDPOINT", exit_w_midpoint)
-        mlflow.log_param("exit/EXIT_W_MM", exit_w_mm)
-        mlflow.log_param("spread_calc/ENFORCE_ITM", enforce_ITM)
-        mlflow.log_param("spread_calc/MIDDLE_ITM", middle_ITM)
-        mlflow.log_param("strategy/STRATEGY", strategy.__class__.__name__)
-
-
-        # Define flat file directories and get all files from first directory (extra directories for quicktest)
-        _1min_file_dir = "dev/data/polygon/index_flat_files/1_min_aggregates"
-        _5min_file_dir = "dev/data/polygon/index_flat_files/5_min_aggregates"
-        if quicktest:
-            _1min_file_dir = "dev/data/polygon/quick_test_files/1_min"
-            _5min_file_dir = "dev/data/polygon/quick_test_files/5_min"
-        _1min_files = glob.glob(os.path.join(_1min_file_dir, "*.csv"))
-
-        
-        # init empty report dicts
-        signal_stats_summary = {
-            'avg_entries_per_day': 0,
-            'avg_bp_entries_per_day': 0,
-            'avg_bc_entries_per_day': 0
-        }
-        trade_stats_summary = {
-            'avg_trades_per_day': 0,
-            'avg_bp_trades_per_day': 0,
-            'avg_bc_trades_per_day': 0,
-            'avg_spread_availability': 0,
-            'avg_profit_per_day': 0,
-            'total_profit': 0,
-            'total_wins': 0,
-            'total_losses': 0,
-            'win_rate': 0
-        }
+                exit_based_on_close=eval_config.EXIT_BASED_ON_CLOSE,
+                offline=eval_config.MLFLOW_OFFLINE,
+                parent_run=None,
+                processes=None,
+                checkpoint_path=None,
+                robustness_resamples=None):
+    """
+    Evaluates a strategy on all monthly index files and logs params and aggregated metrics to mlflow.
+    Logging is buffered and flushed in the background (see 'utils.mlflow_logger').
 
-        valid_iterations = 0
-        results_per_month = []
-        for _1min_file in _1min_files:
-            # get corresponding 5 min file by name
-            file_name = os.path.basename(_1min_file)
-            _5min_file = os.path.join(_5min_file_dir, file_name)
-            
-            if os.path.exists(_5min_file):
-                df_1_min = pd.read_csv(_1min_file)
-                df_5_min = pd.read_csv(_5min_file)
-
-                signal_stats, trade_stats = run_eval_month(df_1_min, df_5_min, file_name, 
-                                                           start_time, 
-                                                           end_time,
-                                                           strategy=strategy,
-                                                           use_trend_line=use_trend_line,
-                                                           use_stoch_rsi=use_stoch_rsi,
-                                                           stop_loss=stop_loss,
-                                                           take_profit=take_profit,
-                                                           enforce_ITM=enforce_ITM,
-                                                           middle_ITM=middle_ITM,
-                                                           enforce_OTM=enforce_OTM,
-                                                           exit_w_open=exit_w_open,
-                                                           exit_w_midpoint=exit_w_midpoint,
-                                                           exit_w_mm=exit_w_mm,
-                                                           mm_type=mm_type,
-                                                           exit_based_on_close=exit_based_on_close)
-                
-                # Update the summary dictionaries
-                signal_stats_summary['avg_entries_per_day'] += signal_stats['avg_entries_per_day']
-                signal_stats_summary['avg_bp_entries_per_day'] += signal_stats['avg_bp_entries_per_day']
-                signal_stats_summary['avg_bc_entries_per_day'] += signal_stats['avg_bc_entries_per_day']
-                trade_stats_summary['avg_trades_per_day'] += trade_stats['avg_trades_per_day']
-                trade_stats_summary['avg_bp_trades_per_day'] += trade_stats['avg_bp_trades_per_day']
-                trade_stats_summary['avg_bc_trades_per_day'] += trade_stats['avg_bc_trades_per_day']
-                trade_stats_summary['avg_spread_availability'] += trade_stats['avg_spread_availability']
-                trade_stats_summary['avg_profit_per_day'] += trade_stats['avg_profit_per_day']
-                trade_stats_summary['total_profit'] += trade_stats['total_profit']
-                trade_stats_summary['total_wins'] += trade_stats['total_wins']
-                trade_stats_summary['total_losses'] += trade_stats['total_losses']
-                trade_stats_summary['win_rate'] += trade_stats['win_rate']
-
-                # record results per month
-                total_trades = trade_stats['total_losses'] + trade_stats['total_wins']
-                results_per_month.append({
-                    'file_name': file_name,
-                    'total_profit': trade_stats['total_profit'],
-                    'win_rate': trade_stats['win_rate'],
-                    'total_wins': trade_stats['total_wins'],
-                    'total_losses': trade_stats['total_losses'],
-                    'total_trades': total_trades
-                })
-                valid_iterations += 1
-
-            else:
-                print(f"No matching file found for: {_1min_file} and {_5min_file}")
-                continue
-
-        # print the per month results
-        df_results_per_month = pd.DataFrame(results_per_month)
-        df_results_per_month = df_results_per_month.sort_values(by='file_name')
-        print("Per month results (Total Profit and Win Rate per File):")
-        print(df_results_per_month)
+    Params:
+        offline: If True, runs are written to the local file store 'mlruns' instead of the tracking server.
+        parent_run: Optional 'LoggedRun'. If given, the evaluation is logged as a child run of it (e.g. in sweeps).
+        processes: Optional number of worker processes that evaluate the months in parallel (see 'run_eval_months').
+        checkpoint_path: Optional checkpoint database, completed months are not evaluated again (see 'run_eval_months').
+        robustness_resamples: Optional number of bootstrap resamples. If given, confidence intervals of the profit,
+            win rate, drawdown and Sharpe ratio are logged as well (see utils/robustness.py).
+
+    Returns:
+        Dictionary of the logged metrics.
+    """
+    settings = eval_settings(start_time=start_time, end_time=end_time, strategy=strategy, use_trend_line=use_trend_line,
+                             use_stoch_rsi=use_stoch_rsi, enforce_ITM=enforce_ITM, middle_ITM=middle_ITM, enforce_OTM=enforce_OTM,
+                             select_by_premium=select_by_premium, target_premium=target_premium,
+                             select_nearest_listed=select_nearest_listed, underlying=underlying, spread_width=spread_width,
+                             stop_loss=stop_loss, take_profit=take_profit, exit_w_open=exit_w_open, exit_w_mm=exit_w_mm,
+                             exit_w_midpoint=exit_w_midpoint, mm_type=mm_type, exit_based_on_close=exit_based_on_close)
+
+    # child runs are flushed by the logger of their parent run
+    from utils.mlflow_logger import MLflowLogger  # imported here, mlflow is slow to import
+    if parent_run is not None:
+        logger = nullcontext()
+        run = parent_run.child_run(run_name=run_name)
+    else:
+        logger = MLflowLogger(offline=offline)
+        run = logger.start_run(experiment_name, run_name=run_name)
+    with logger, run:
+        log_eval_params(run, settings, confirm_with_5min)
+
+        month_results = run_eval_months(settings, quicktest, processes=processes, checkpoint_path=checkpoint_path)[spread_width]
+        metrics, df_results_per_month = summarize_months(month_results)
 
-        if valid_iterations > 0:
-            signal_stats_summary['avg_entries_per_day'] /= valid_iterations
-            signal_stats_summary['avg_bp_entries_per_day'] /= valid_iterations
-            signal_stats_summary['avg_bc_entries_per_day'] /= valid_iterations
-            
-            trade_stats_summary['avg_trades_per_day'] /= valid_iterations
-            trade_stats_summary['avg_bp_trades_per_day'] /= valid_iterations
-            trade_stats_summary['avg_bc_trades_per_day'] /= valid_iterations
-            trade_stats_summary['avg_spread_availability'] /= valid_iterations
-            trade_stats_summary['avg_profit_per_day'] /= valid_iterations
-            trade_stats_summary['win_rate'] /= valid_iterations
-        
-        # calculate additional metrics
-        profit_per_trade = 0
-        total_wins = trade_stats_summary["total_wins"]
-        total_losses = trade_stats_summary["total_losses"]
-        if total_wins > 0 or total_losses > 0:
-            profit_per_trade = trade_stats_summary["total_profit"] / (total_wins + total_losses)
-
-        profit_std = df_results_per_month['total_profit'].std()
-        profit_z_score = ((df_results_per_month['total_profit'] - df_results_per_month['total_profit'].mean()) / profit_std).mean()
-
-        winrate_std = df_results_per_month['win_rate'].std()
-        winrate_z_score = ((df_results_per_month['win_rate'] - df_results_per_month['win_rate'].mean()) / winrate_std).mean()
-
-        sharpe_ratio = df_results_per_month['total_profit'].mean() / profit_std
-        
         # Log key metrics to mlflow
-        mlflow.log_metric("avg/avg_trades_per_day", trade_stats_summary["avg_trades_per_day"])
-        mlflow.log_metric("avg/avg_bp_trades_per_day", trade_stats_summary["avg_bp_trades_per_day"])
-        mlflow.log_metric("avg/avg_bc_trades_per_day", trade_stats_summary["avg_bc_trades_per_day"])
-        mlflow.log_metric("avg/avg_spread_availability", trade_stats_summary["avg_spread_availability"])
-        mlflow.log_metric("avg/avg_profit_per_day", trade_stats_summary["avg_profit_per_day"])
-        mlflow.log_metric("t/total_profit", trade_stats_summary["total_profit"])
-        mlflow.log_metric("t/total_wins", total_wins)
-        mlflow.log_metric("t/total_losses", total_losses)
-        mlflow.log_metric("win_rate", trade_stats_summary["win_rate"])
-        mlflow.log_metric("profit_per_trade", profit_per_trade)
-        mlflow.log_metric("avg/avg_entries_per_day", signal_stats_summary["avg_entries_per_day"])
-        mlflow.log_metric("avg/avg_bp_entries_per_day", signal_stats_summary["avg_bp_entries_per_day"])
-        mlflow.log_metric("avg/avg_bc_entries_per_day", signal_stats_summary["avg_bc_entries_per_day"])
-        mlflow.log_metric("stat/profit_std", profit_std)
-        mlflow.log_metric("stat/profit_z_score", profit_z_score)
-        mlflow.log_metric("stat/winrate_std", winrate_std)
-        mlflow.log_metric("stat/winrate_z_score", winrate_z_score)
-        mlflow.log_metric("stat/sharpe_ratio", sharpe_ratio)
-
-        mlflow.log_table(data=df_results_per_month, artifact_file="monthly_stats.json")
-
-        mlflow.end_run()
+        run.log_metrics(metrics)
+        run.log_table(data=df_results_per_month, artifact_file="monthly_stats.json")
+
+        if robustness_resamples:
+            from utils.robustness import log_robustness
+            metrics.update(log_robustness(run, month_results, robustness_resamples, processes=processes))
+
+    return metrics
+
+
+def run_spread_width_sweep(experiment_name, spread_widths, run_name=f"spread_widths_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}",
+                           quicktest=False, confirm_with_5min=eval_config.CONFIRM_WITH_5MIN,
+                           offline=eval_config.MLFLOW_OFFLINE, processes=None, checkpoint_path=None, **settings):
+    """
+    Evaluates several spread widths in a single pass over the data: signals are generated once per month
+    and each day's options data is loaded once for all widths (see 'get_spreads_for_widths'). Every width
+    is logged as a child run of one parent run.
+
+    Params:
+        spread_widths: list of spread widths in the scale of the data, e.g. [50, 100, 150, 200, 250] for
+            5 to 25 point wide SPY spreads
+        processes: Optional number of worker processes that evaluate the months in parallel (see 'run_eval_months').
+        checkpoint_path: Optional checkpoint database, completed months are not evaluated again (see 'run_eval_months').
+        settings: keyword arguments of 'run_eval_month' that differ from eval_config (see 'eval_settings')
+
+    Returns:
+        Dictionary, spread width -> logged metrics
+    """
+    from utils.mlflow_logger import MLflowLogger  # imported here, mlflow is slow to import
+    settings = eval_settings(**settings)
+    results = {}
+    with MLflowLogger(offline=offline) as logger, logger.start_run(experiment_name, run_name=run_name) as parent_run:
+        parent_run.log_param("spread_calc/SPREAD_WIDTHS", ", ".join(str(width) for width in spread_widths))
+
+        month_results = run_eval_months(settings, quicktest, spread_widths=spread_widths, processes=processes,
+                                        checkpoint_path=checkpoint_path)
+        for width in spread_widths:
+            with parent_run.child_run(run_name=f"Spread width: {width}") as run:
+                log_eval_params(run, {**settings, "spread_width": width}, confirm_with_5min)
+                metrics, df_results_per_month = summarize_months(month_results[width])
+                run.log_metrics(metrics)
+                run.log_table(data=df_results_per_month, artifact_file="monthly_stats.json")
+            results[width] = metrics
+
+    return results
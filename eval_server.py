@@ -0,0 +1,270 @@
+# Long running evaluation server for interactive single day evaluations
+#
+#   python cli.py serve                                  # start the server
+#   python cli.py by-day --date 2025-01-08 --remote --set STOP_LOSS=1.5
+#
+# The server keeps the index data of recently used days, their indicators and the option chains
+# in memory and re-imports the strategy modules when they change, so re-evaluating a day after
+# an edit only runs the strategy and the trade simulation.
+import os
+import sys
+import json
+import time
+import types
+import socket
+import tempfile
+import threading
+import importlib
+import socketserver
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from datetime import date
+from collections import OrderedDict
+
+"""Default path of the server socket."""
+SOCKET_PATH = os.path.join(tempfile.gettempdir(), "zerotheta-eval.sock")
+
+"""
+Modules that are re-imported when one of their files changes, in dependency order. Modules of the
+strategies package that are not listed are reloaded after these.
+"""
+RELOAD_ORDER = ["strategies.conditions", "strategies.expressions", "strategies.registry", "strategies.strategies"]
+
+
+class LRUCache:
+    """
+    Dictionary with a maximum size, the least recently used entry is dropped first.
+    """
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, load):
+        """
+        Returns the cached value of key, or calls 'load()' and caches its result.
+        """
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        value = load()
+        self.entries[key] = value
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        return {"size": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+class ModuleWatcher:
+    """
+    Re-imports the strategy modules (and the modules that depend on them, e.g. eval_by_day) when a
+    source file of the strategies package changed since the last check.
+    """
+    def __init__(self, package_dir="strategies", dependents=("eval_by_day",)):
+        self.package_dir = Path(package_dir)
+        self.dependents = list(dependents)
+        self.generation = 0  # incremented with every reload, part of the cache keys of derived data
+        self.mtimes = self._mtimes()
+
+    def _mtimes(self):
+        return {path: path.stat().st_mtime_ns for path in self.package_dir.glob("*.py")}
+
+    def check(self):
+        """
+        Reloads the modules if a file changed. Returns the names of the reloaded modules.
+        """
+        mtimes = self._mtimes()
+        if mtimes == self.mtimes:
+            return []
+        self.mtimes = mtimes
+
+        package = self.package_dir.name
+        loaded = [name for name in sys.modules if name.startswith(package + ".")]
+        names = [name for name in RELOAD_ORDER if name in loaded]
+        names += sorted(name for name in loaded if name not in RELOAD_ORDER)
+        names += [name for name in self.dependents if name in sys.modules]
+        for name in names:
+            importlib.reload(sys.modules[name])
+        self.generation += 1
+        return names
+
+
+def to_json(value):
+    """Converts the values of evaluation results that json does not support."""
+    if isinstance(value, pd.DataFrame):
+        return value.to_dict(orient="records")
+    if isinstance(value, pd.Series):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
+
+
+class EvalServer(socketserver.UnixStreamServer):
+    """
+    Evaluates strategies on single days. Requests are handled one at a time, one json object per line:
+
+        {"date": "2025-01-08", "strategy": "DeHighInLowSimple", "params": {"STOP_LOSS": 1.5}}
+
+    'date' defaults to YEAR, MONTH, DAY and 'strategy' to STRATEGY of eval_config. 'params' overrides
+    settings of eval_config for this request only (see 'cli.apply_overrides'). {"command": "stats"}
+    returns the cache statistics and {"command": "shutdown"} stops the server.
+
+    Params:
+        cached_days: number of days of index data, indicators and option chains kept in memory
+    """
+    def __init__(self, socket_path=SOCKET_PATH, cached_days=32):
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        super().__init__(socket_path, EvalRequestHandler)
+        self.socket_path = socket_path
+
+        import eval_config
+        from data.sources import FileSource, set_data_source, create_data_source
+        self.config = eval_config
+        # option chains of the recently used days stay in memory
+        if eval_config.DATA_SOURCE == "file":
+            self.source = FileSource(cached_days=cached_days)
+        else:
+            self.source = create_data_source(eval_config.DATA_SOURCE, eval_config.DATA_SOURCE_PATH)
+        set_data_source(self.source)
+
+        self.watcher = ModuleWatcher()
+        self.index_days = LRUCache(cached_days * 2)  # (timeframe, date) -> index data of the day
+        self.prepared_days = LRUCache(cached_days * 2)  # (..., indicators, time window, generation) -> (whole day, time window)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+    def settings(self, params):
+        """Returns eval_config with the overrides of a request, as a namespace."""
+        from cli import apply_overrides
+        settings = types.SimpleNamespace(**{key: getattr(self.config, key) for key in dir(self.config) if key.isupper()})
+        apply_overrides(settings, params or {})
+        return settings
+
+    def evaluate(self, request):
+        """
+        Evaluates a strategy on one day. Returns a dictionary with the trades, report metrics and timings.
+        """
+        timings = {}
+        start = time.perf_counter()
+        reloaded = self.watcher.check()
+        timings["reload"] = time.perf_counter() - start
+
+        import eval_by_day  # re-imported by the watcher
+        from strategies.registry import get_strategy_spec
+
+        params = dict(request.get("params") or {})
+        if request.get("strategy"):
+            params["STRATEGY"] = request["strategy"]
+        elif self.watcher.generation > 0:
+            # eval_config.STRATEGY is an instance of the class before the reload
+            params["STRATEGY"] = self.config.STRATEGY.__class__.__name__
+        settings = self.settings(params)
+        target_date = date.fromisoformat(request["date"]) if request.get("date") else date(settings.YEAR, settings.MONTH, settings.DAY)
+        spec = get_strategy_spec(settings.STRATEGY)
+
+        start = time.perf_counter()
+        frames, days = {}, {}
+        for timeframe in spec.timeframes:
+            day = self.index_days.get((timeframe, target_date),
+                                      lambda: eval_by_day.load_index_day(self.source, timeframe, target_date))
+            key = (timeframe, target_date, tuple(spec.indicators), settings.START_TIME, settings.END_TIME, self.watcher.generation)
+            days[timeframe], prepared = self.prepared_days.get(key, lambda: eval_by_day.prepare_index_day(day, spec.indicators, settings.START_TIME, settings.END_TIME))
+            # strategies may add columns to the frames, the cached data stays unchanged
+            frames[timeframe] = prepared.copy()
+        timings["data"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        _, trades, report_metrics = eval_by_day.evaluate_day(settings.STRATEGY, target_date, frames, settings, days=days)
+        timings["evaluate"] = time.perf_counter() - start
+
+        return {
+            "date": target_date.isoformat(),
+            "strategy": settings.STRATEGY.__class__.__name__,
+            "trades": trades,
+            "report_metrics": report_metrics,
+            "total_profit": sum(trade["profit"] for trade in trades),
+            "reloaded": reloaded,
+            "timings": timings
+        }
+
+    def stats(self):
+        return {"index_days": self.index_days.stats(), "prepared_days": self.prepared_days.stats(),
+                "option_days": len(getattr(self.source, "_days", {})), "generation": self.watcher.generation}
+
+
+class EvalRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                command = request.get("command", "eval")
+                if command == "shutdown":
+                    self.respond({"status": "ok"})
+                    # 'shutdown' waits for the serve loop, which runs this handler, so it is called from a thread
+                    threading.Thread(target=self.server.shutdown, daemon=True).start()
+                    return
+                if command == "stats":
+                    response = self.server.stats()
+                else:
+                    response = self.server.evaluate(request)
+                response["status"] = "ok"
+            except Exception as e:
+                print(f"Request failed: {e!r}")
+                response = {"status": "error", "error": f"{e.__class__.__name__}: {e}"}
+            self.respond(response)
+
+    def respond(self, response):
+        self.wfile.write((json.dumps(response, default=to_json) + "\n").encode())
+        self.wfile.flush()
+
+
+def serve(socket_path=SOCKET_PATH, cached_days=32):
+    """
+    Runs the evaluation server until it receives a shutdown request or is interrupted.
+    """
+    with EvalServer(socket_path, cached_days) as server:
+        print(f"Evaluation server listening on {socket_path}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def request(message, socket_path=SOCKET_PATH, timeout=None):
+    """
+    Sends a request to a running evaluation server and returns the response.
+
+    Params:
+        message: request dictionary (see 'EvalServer')
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        client.connect(socket_path)
+        client.sendall((json.dumps(message) + "\n").encode())
+        with client.makefile("rb") as file:
+            response = json.loads(file.readline())
+    if response.get("status") == "error":
+        raise RuntimeError(f"Evaluation failed: {response['error']}")
+    return response
+
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,138 @@
+# Portfolio level simulation of concurrent spread positions
+import heapq
+import pandas as pd
+from utils.options_helper import UNDERLYING_PRICE_SCALE
+
+
+class PortfolioSimulator:
+    """
+    Simulates a trading account that takes the trades of a strategy one after another in time. In
+    contrast to 'summarize_trades', which adds up the profits of all trades, positions here use
+    capital: every open spread blocks its margin (spread width x 100 per contract) and an entry is
+    only taken if the number of open positions and the free buying power allow it.
+
+    Entries are processed in time order and the exits of open positions are kept in a heap, so every
+    event costs O(log k) for k open positions.
+
+    Strikes and prices of the data are scaled per underlying (see UNDERLYING_PRICE_SCALE), margins and
+    profits are converted back to dollars.
+
+    Params:
+        starting_capital: account size at the start of the simulation
+        max_open_positions: maximum number of concurrently open spreads
+        contracts: number of contracts per trade
+        multiplier: contract multiplier of the options
+        underlying: root symbol of the traded options, e.g. 'SPY'
+    """
+    def __init__(self, starting_capital=10000, max_open_positions=3, contracts=1, multiplier=100, underlying="SPY"):
+        self.starting_capital = starting_capital
+        self.max_open_positions = max_open_positions
+        self.contracts = contracts
+        self.multiplier = multiplier
+        self.price_scale = UNDERLYING_PRICE_SCALE.get(underlying, 1)
+
+    def dollars(self, points):
+        """Converts spread price points of the data into dollars of the position."""
+        return points / self.price_scale * self.multiplier * self.contracts
+
+    def margin(self, trade):
+        """Buying power used by a trade: spread width (in dollars of the underlying) x multiplier x contracts."""
+        spread = trade["spread"]
+        return self.dollars(abs(spread["sold_option_price"] - spread["bought_option_price"]))
+
+    def run(self, trades):
+        """
+        Runs the simulation.
+
+        Params:
+            trades: list of trade dictionaries with 'entry_time', 'exit_time', 'profit' and 'spread'
+                (spread type and strike prices), e.g. as returned by 'Strategy.generate_trades' or
+                'ReplayEngine.run'. The profit is given in spread price points of the data. Trades with
+                'marks' (spread prices while the trade is open) and 'entry_price' are marked to market.
+
+        Returns:
+            Dictionary with
+                'taken': list of the trades that were taken
+                'rejected': list of (trade, reason) for trades that were not taken
+                'equity_curve': DataFrame with the realized equity, used buying power and open positions
+                    after every event
+                'marked_equity': DataFrame with the realized and unrealized equity at every mark of the
+                    open positions (see 'mark_to_market'), None without marks
+                'stats': final equity, total profit, max drawdown (realized and marked to market) and
+                    max concurrent positions
+        """
+        trades = sorted(trades, key=lambda trade: trade["entry_time"])
+
+        equity = self.starting_capital
+        used_margin = 0
+        open_exits = []  # heap of (exit time, sequence number, trade, margin)
+        taken = []
+        rejected = []
+        curve = [(trades[0]["entry_time"] if trades else None, equity, used_margin, 0, "start")]
+        max_open = 0
+
+        def close_until(timestamp):
+            nonlocal equity, used_margin
+            # exits at the same time as an entry are processed first, so they free capacity for it
+            while open_exits and (timestamp is None or open_exits[0][0] <= timestamp):
+                exit_time, _, trade, margin = heapq.heappop(open_exits)
+                equity += self.dollars(trade["profit"])
+                used_margin -= margin
+                curve.append((exit_time, equity, used_margin, len(open_exits), "exit"))
+
+        for seq, trade in enumerate(trades):
+            close_until(trade["entry_time"])
+
+            margin = self.margin(trade)
+            if len(open_exits) >= self.max_open_positions:
+                rejected.append((trade, "max open positions"))
+                continue
+            if used_margin + margin > equity:
+                rejected.append((trade, "buying power"))
+                continue
+
+            used_margin += margin
+            heapq.heappush(open_exits, (trade["exit_time"], seq, trade, margin))
+            taken.append(trade)
+            max_open = max(max_open, len(open_exits))
+            curve.append((trade["entry_time"], equity, used_margin, len(open_exits), "entry"))
+
+        close_until(None)
+
+        equity_curve = pd.DataFrame(curve, columns=["Datetime", "equity", "used_buying_power", "open_positions", "event"])
+        running_max = equity_curve["equity"].cummax()
+        marked_equity = self.mark_to_market(taken, equity_curve)
+        stats = {
+            "final_equity": equity,
+            "total_profit": equity - self.starting_capital,
+            "max_drawdown": (running_max - equity_curve["equity"]).max(),
+            "max_drawdown_marked": None if marked_equity is None else
+                (marked_equity["marked_equity"].cummax() - marked_equity["marked_equity"]).max(),
+            "max_concurrent_positions": max_open,
+            "trades_taken": len(taken),
+            "trades_rejected": len(rejected)
+        }
+
+        return {"taken": taken, "rejected": rejected, "equity_curve": equity_curve, "marked_equity": marked_equity, "stats": stats}
+
+    def mark_to_market(self, taken, equity_curve):
+        """
+        Marks the open positions to market: at every time with a spread price of an open position, the
+        realized equity of the equity curve plus the unrealized profit of all open positions.
+
+        Returns:
+            DataFrame with 'Datetime' (UTC), 'equity' (realized), 'unrealized' and 'marked_equity', None if
+            no taken trade has marks
+        """
+        unrealized = [self.dollars(trade["marks"] - trade["entry_price"]) for trade in taken if trade.get("marks") is not None]
+        if not unrealized:
+            return None
+        unrealized = pd.concat(unrealized).groupby(level=0).sum()
+        marks = pd.DataFrame({"Datetime": pd.to_datetime(unrealized.index, utc=True), "unrealized": unrealized.to_numpy()})
+        marks = marks.sort_values("Datetime")
+
+        realized = equity_curve.dropna(subset=["Datetime"]).assign(Datetime=lambda df: pd.to_datetime(df["Datetime"], utc=True))
+        marks = pd.merge_asof(marks, realized[["Datetime", "equity"]].sort_values("Datetime", kind="stable"), on="Datetime")
+        marks["equity"] = marks["equity"].fillna(self.starting_capital)
+        marks["marked_equity"] = marks["equity"] + marks["unrealized"]
+        return marks[["Datetime", "equity", "unrealized", "marked_equity"]]
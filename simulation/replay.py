@@ -0,0 +1,329 @@
+# Event-driven replay of one trading day, bar by bar
+import time
+import math
+import numpy as np
+import pandas as pd
+from collections import deque
+from utils.options_helper import calculate_spread_strike_prices, to_utc_ns, UNDERLYING_PRICE_SCALE
+from utils.contract_codec import encode_tickers, contract_key
+from strategies.strategies import ReplayStrategy
+
+
+class RollingExtreme:
+    """
+    Rolling minimum or maximum over the last 'window' values, updated in amortized O(1) per value
+    with a monotonic deque.
+    """
+    def __init__(self, window, mode="min"):
+        self.window = window
+        self.mode = mode
+        self.values = deque()  # (position, value), values monotonic
+        self.position = 0
+
+    def update(self, value):
+        if self.mode == "min":
+            while self.values and self.values[-1][1] >= value:
+                self.values.pop()
+        else:
+            while self.values and self.values[-1][1] <= value:
+                self.values.pop()
+        self.values.append((self.position, value))
+
+        # drop values that left the window
+        while self.values[0][0] <= self.position - self.window:
+            self.values.popleft()
+        self.position += 1
+
+        return self.values[0][1]
+
+
+class IncrementalStochRSI:
+    """
+    Stochastic RSI that is updated with one close price at a time. Produces the same values as
+    'Conditions.stoch_rsi' (ta library, Wilder smoothing of the RSI), NaN until enough bars are seen.
+    """
+    def __init__(self, window=8):
+        self.window = window
+        self.alpha = 1 / window
+        self.bars = 0
+        self.prev_close = None
+        self.ema_up = 0.0
+        self.ema_down = 0.0
+        self.valid_rsi = 0  # number of consecutive valid rsi values
+        self.lowest = RollingExtreme(window, "min")
+        self.highest = RollingExtreme(window, "max")
+
+    def update(self, close):
+        diff = 0.0 if self.prev_close is None else close - self.prev_close
+        self.prev_close = close
+        up, down = max(diff, 0.0), max(-diff, 0.0)
+
+        if self.bars == 0:
+            self.ema_up, self.ema_down = up, down
+        else:
+            self.ema_up += self.alpha * (up - self.ema_up)
+            self.ema_down += self.alpha * (down - self.ema_down)
+        self.bars += 1
+
+        if self.bars < self.window:
+            return math.nan
+
+        rsi = 100.0 if self.ema_down == 0 else 100 - 100 / (1 + self.ema_up / self.ema_down)
+        self.valid_rsi += 1
+        lowest = self.lowest.update(rsi)
+        highest = self.highest.update(rsi)
+
+        if self.valid_rsi < self.window or highest == lowest:
+            return math.nan
+        return (rsi - lowest) / (highest - lowest)
+
+
+class ReplayEngine:
+    """
+    Replays one trading day as a stream of bars in timestamp order: option bars and index bars are
+    merged by time, the latest option prices are kept as-of, incremental indicators are updated with
+    every index bar and the strategy's 'on_bar' hook decides about new entries. Open spread positions
+    are checked against their stop loss and take profit on every bar and closed by the exit signals of
+    the strategy's 'on_bar_exits' hook, in the same order as 'Strategy.generate_trades'.
+
+    The work per bar does not depend on how many bars came before (O(1) per bar for a bounded number
+    of open positions), so the engine can also be driven by a live feed for paper trading.
+
+    Params:
+        strategy: a 'ReplayStrategy', its 'on_bar(bar, indicators)' returns 'Bull Put', 'Bear Call' or None,
+            'on_bar_exits(bar, indicators)' the spread types to exit
+        stop_loss, take_profit: money management limits in spread price points
+        mm_type: 'static' or 'trailing' (see eval_config.MM_TYPE)
+        exit_based_on_close: compare close (True) or low/high (False) against the limits
+        exit_w_open: fill exits with the open of the following bar
+        exit_w_mm: the profit of a trade is exactly -stop_loss or take_profit
+        max_open_positions: entries are ignored while this many positions are open
+    """
+    def __init__(self, strategy, stop_loss=1, take_profit=2, mm_type="static", exit_based_on_close=True,
+                 exit_w_open=True, exit_w_mm=False, spread_width=20, enforce_ITM=False, middle_ITM=False,
+                 enforce_OTM=True, max_open_positions=1, stoch_rsi_window=8, underlying="SPY"):
+        if not isinstance(strategy, ReplayStrategy):
+            raise TypeError(f"{strategy.__class__.__name__} does not support event-driven replay, it is not a ReplayStrategy.")
+        self.strategy = strategy
+        self.stop_loss = stop_loss
+        self.take_profit = take_profit
+        self.mm_type = mm_type
+        self.exit_based_on_close = exit_based_on_close
+        self.exit_w_open = exit_w_open
+        self.exit_w_mm = exit_w_mm
+        self.spread_width = spread_width
+        self.enforce_ITM = enforce_ITM
+        self.middle_ITM = middle_ITM
+        self.enforce_OTM = enforce_OTM
+        self.max_open_positions = max_open_positions
+        self.stoch_rsi_window = stoch_rsi_window
+        self.underlying = underlying
+        self.bar_latencies_ns = []
+
+    def run(self, index_df, options_df, date):
+        """
+        Replays one day.
+
+        Params:
+            index_df: index bars of the day (time window already applied), with 'Datetime' and OHLC
+            options_df: options data of the day, as returned by 'load_options_from_file'
+            date: date of the day, used for the option tickers
+
+        Returns:
+            List of trades. Each trade is a dictionary with 'entry_time', 'exit_time', 'entry_price',
+            'exit_price', 'profit', 'exit_reason' and 'spread' (spread type and strike prices).
+        """
+        stoch_rsi = IncrementalStochRSI(self.stoch_rsi_window)
+        self.bar_latencies_ns = []
+
+        index_times = to_utc_ns(index_df["Datetime"])
+        index_values = index_df[["Open", "High", "Low", "Close"]].to_numpy(dtype=float)
+
+        options_df = options_df.sort_values("Datetime", kind="stable")
+        option_times = to_utc_ns(options_df["Datetime"])
+        if "contract" in options_df:
+            option_contracts = options_df["contract"].to_numpy()
+        else:
+            option_contracts = encode_tickers(options_df["ticker"])
+        option_values = options_df[["Open", "High", "Low", "Close"]].to_numpy(dtype=float)
+
+        last_prices = {}  # contract key -> latest (open, high, low, close)
+        positions = []
+        trades = []
+        option_pos = 0
+
+        for i in range(len(index_times)):
+            start = time.perf_counter_ns()
+            bar_time = index_times[i]
+
+            # 1. consume all option bars up to this bar (merge by timestamp)
+            while option_pos < len(option_times) and option_times[option_pos] <= bar_time:
+                last_prices[option_contracts[option_pos]] = option_values[option_pos]
+                option_pos += 1
+
+            # 2. manage open positions
+            for position in list(positions):
+                spread = self._spread_bar(position, last_prices)
+                if position["pending_exit"] is not None:
+                    exit_price = spread[0] if spread is not None else position["last_price"]
+                    trades.append(self._close(position, bar_time, exit_price, position["pending_exit"]))
+                    positions.remove(position)
+                    continue
+                if spread is None:
+                    continue
+                self._check_limits(position, spread, bar_time, trades, positions)
+
+            # 3. update indicators, close positions with an exit signal and ask the strategy for new entries
+            bar = {
+                "Datetime": pd.Timestamp(bar_time, tz="UTC"),
+                "Open": index_values[i, 0],
+                "High": index_values[i, 1],
+                "Low": index_values[i, 2],
+                "Close": index_values[i, 3]
+            }
+            indicators = {"stoch_rsi": stoch_rsi.update(bar["Close"])}
+            spread_type = self.strategy.on_bar(bar, indicators)
+
+            exits = self.strategy.on_bar_exits(bar, indicators)
+            for position in list(positions):
+                # like the limits, exit signals apply from the bar after the entry on
+                if position["spread"]["spread_type"] in exits and position["pending_exit"] is None:
+                    if self.exit_w_open:
+                        position["pending_exit"] = "exit signal"  # filled with the open of the next bar
+                    else:
+                        trades.append(self._close(position, bar_time, position["last_price"], "exit signal"))
+                        positions.remove(position)
+
+            if spread_type is not None and len(positions) < self.max_open_positions:
+                position = self._open(spread_type, bar, bar_time, date, last_prices)
+                if position is not None:
+                    positions.append(position)
+
+            self.bar_latencies_ns.append(time.perf_counter_ns() - start)
+
+        # close remaining positions with the last known spread price at the end of the day
+        for position in positions:
+            trades.append(self._close(position, index_times[-1], position["last_price"], "end of day"))
+
+        return trades
+
+    def latency_stats(self):
+        """
+        Returns count, mean, median, 99th percentile and maximum of the processing time per bar (in
+        microseconds) of the last replay.
+        """
+        latencies = np.asarray(self.bar_latencies_ns, dtype=float) / 1000
+        if len(latencies) == 0:
+            return {"bars": 0}
+        return {
+            "bars": len(latencies),
+            "mean_us": latencies.mean(),
+            "p50_us": np.percentile(latencies, 50),
+            "p99_us": np.percentile(latencies, 99),
+            "max_us": latencies.max()
+        }
+
+    def _open(self, spread_type, bar, bar_time, date, last_prices):
+        strikes = calculate_spread_strike_prices(bar["Close"], spread_type, spread_width=self.spread_width,
+                                                 enforce_ITM=self.enforce_ITM, middle_ITM=self.middle_ITM,
+                                                 enforce_OTM=self.enforce_OTM)
+        option_type = "P" if spread_type == "Bull Put" else "C"
+        price_scale = UNDERLYING_PRICE_SCALE.get(self.underlying, 1)
+        position = {
+            "spread": {
+                "spread_type": spread_type,
+                "sold_option_price": strikes[0],
+                "bought_option_price": strikes[1]
+            },
+            "sold_contract": contract_key(date, option_type, strikes[0], self.underlying, price_scale),
+            "bought_contract": contract_key(date, option_type, strikes[1], self.underlying, price_scale),
+            "entry_time": bar_time,
+            "pending_exit": None
+        }
+
+        # no entry without known prices for both legs
+        spread = self._spread_bar(position, last_prices)
+        if spread is None:
+            return None
+
+        position["entry_price"] = spread[3]
+        position["last_price"] = spread[3]
+        position["stop_loss_price"] = spread[3] - self.stop_loss
+        position["take_profit_price"] = spread[3] + self.take_profit
+        return position
+
+    def _spread_bar(self, position, last_prices):
+        # spread ohlc in the same convention as 'calculate_spread_ohlc(bought, sold)'
+        sold = last_prices.get(position["sold_contract"])
+        bought = last_prices.get(position["bought_contract"])
+        if sold is None or bought is None:
+            return None
+        return (bought[0] - sold[0], bought[1] - sold[2], bought[2] - sold[1], bought[3] - sold[3])
+
+    def _check_limits(self, position, spread, bar_time, trades, positions):
+        open_, high, low, close = spread
+        position["last_price"] = close
+
+        hit_stop = (close if self.exit_based_on_close else low) <= position["stop_loss_price"]
+        hit_target = (close if self.exit_based_on_close else high) >= position["take_profit_price"]
+
+        if hit_stop or hit_target:
+            reason = "stop loss" if hit_stop else "take profit"
+            if self.exit_w_open:
+                position["pending_exit"] = reason  # filled with the open of the next bar
+            else:
+                trades.append(self._close(position, bar_time, close, reason))
+                positions.remove(position)
+            return
+
+        if self.mm_type == "trailing" and close - self.stop_loss > position["stop_loss_price"]:
+            position["stop_loss_price"] = close - self.stop_loss
+
+    def _close(self, position, bar_time, exit_price, reason):
+        profit = exit_price - position["entry_price"]
+        if self.exit_w_mm and reason == "stop loss":
+            profit = -self.stop_loss
+        elif self.exit_w_mm and reason == "take profit":
+            profit = self.take_profit
+
+        return {
+            "entry_time": pd.Timestamp(position["entry_time"], tz="UTC"),
+            "exit_time": pd.Timestamp(bar_time, tz="UTC"),
+            "entry_price": position["entry_price"],
+            "exit_price": exit_price,
+            "profit": profit,
+            "exit_reason": reason,
+            "spread": position["spread"]
+        }
+
+
+def cross_check(replay_trades, batch_trades, key="entry_time", value="profit", tolerance=1e-6):
+    """
+    Compares the trades of a replay with the trades of the batch pipeline ('Strategy.generate_trades'
+    of the same day). Trades are matched by their entry timestamp, which is compared in UTC, so timezone
+    aware and naive UTC timestamps match.
+
+    Params:
+        replay_trades, batch_trades: lists of trade dictionaries
+        key: timestamp field that identifies a trade in both lists
+        value: trade field that is compared
+
+    Returns:
+        Dictionary with the number of matching trades, the entry timestamps (UTC) of mismatching trades
+        and the entry timestamps that only appear in one of the lists.
+    """
+    def by_entry(trades):
+        times = to_utc_ns(pd.Series([trade[key] for trade in trades], dtype=object)) if trades else []
+        return {pd.Timestamp(entry_time, tz="UTC"): trade[value] for entry_time, trade in zip(times, trades)}
+
+    replay = by_entry(replay_trades)
+    batch = by_entry(batch_trades)
+
+    common = replay.keys() & batch.keys()
+    mismatched = sorted(k for k in common if abs(replay[k] - batch[k]) > tolerance)
+    return {
+        "matched": len(common) - len(mismatched),
+        "mismatched": mismatched,
+        "only_in_replay": sorted(replay.keys() - batch.keys()),
+        "only_in_batch": sorted(batch.keys() - replay.keys())
+    }
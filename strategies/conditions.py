@@ -3,9 +3,19 @@ import pandas as pd
 
 class Conditions:
 
+    """Names of the indicators that can be requested from 'get_all' (see 'strategies/registry.py')."""
+    INDICATORS = ["stoch_rsi"]
+
     @staticmethod
-    def get_all(df):
-        df = Conditions.stoch_rsi(df, window=8, upper_threshhold=0.8, lower_threshhold=0.2)
+    def get_all(df, indicators=None):
+        """
+        Calculates the given indicators for df. If 'indicators' is None, all indicators are calculated.
+        """
+        if indicators is None:
+            indicators = Conditions.INDICATORS
+
+        if "stoch_rsi" in indicators:
+            df = Conditions.stoch_rsi(df, window=8, upper_threshhold=0.8, lower_threshhold=0.2)
         
         return df
 
@@ -0,0 +1,300 @@
+# Declarative conditions that are evaluated as vectorized numpy expressions
+import operator
+from collections import OrderedDict
+from abc import ABC, abstractmethod
+import numpy as np
+import pandas as pd
+import ta
+
+
+def _stoch_rsi(df, window=8):
+    return ta.momentum.StochRSIIndicator(df["Close"], window=window).stochrsi()
+
+def _rsi(df, window=14):
+    return ta.momentum.RSIIndicator(df["Close"], window=window).rsi()
+
+def _sma(df, window=20, column="Close"):
+    return df[column].rolling(window=window).mean()
+
+def _ema(df, window=20, column="Close"):
+    return df[column].ewm(span=window, adjust=False).mean()
+
+
+"""Indicator functions that can be referenced by name in 'Indicator' nodes."""
+INDICATOR_FUNCTIONS = {
+    "stoch_rsi": _stoch_rsi,
+    "rsi": _rsi,
+    "sma": _sma,
+    "ema": _ema
+}
+
+
+class Node(ABC):
+    """
+    Base class of all condition nodes. Nodes are combined with the operators
+        &, |, ~            (and, or, not)
+        <, <=, >, >=       (threshold comparisons, with numbers or other nodes)
+    and the methods 'crosses_above', 'crosses_below' and 'within'.
+
+    Every node has a 'key' that identifies the computation it represents. Nodes with the same key
+    are computed only once per day by a 'ConditionEvaluator', no matter how many strategies or
+    parameter variants use them.
+    """
+    key = None
+
+    @abstractmethod
+    def compute(self, evaluator):
+        """Returns the values of the node for every bar of the evaluator's day as a numpy array."""
+        pass
+
+    def __and__(self, other):
+        return And(self, other)
+
+    def __or__(self, other):
+        return Or(self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+    def __lt__(self, other):
+        return Compare("<", self, other)
+
+    def __le__(self, other):
+        return Compare("<=", self, other)
+
+    def __gt__(self, other):
+        return Compare(">", self, other)
+
+    def __ge__(self, other):
+        return Compare(">=", self, other)
+
+    def crosses_above(self, other):
+        return Cross(self, other, "above")
+
+    def crosses_below(self, other):
+        return Cross(self, other, "below")
+
+    def within(self, bars):
+        """True if the condition was True in any of the last 'bars' bars (including the current one)."""
+        return Lookback(self, bars)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}{self.key[1:]}"
+
+
+def as_node(value):
+    if isinstance(value, Node):
+        return value
+    return Const(value)
+
+
+class Const(Node):
+    def __init__(self, value):
+        self.value = value
+        self.key = ("const", value)
+
+    def compute(self, evaluator):
+        return np.full(evaluator.length, self.value, dtype=float)
+
+
+class Column(Node):
+    """A raw column of the day data, e.g. Column('Close')."""
+    def __init__(self, name):
+        self.name = name
+        self.key = ("column", name)
+
+    def compute(self, evaluator):
+        return evaluator.df[self.name].to_numpy(dtype=float)
+
+
+class Indicator(Node):
+    """An indicator from 'INDICATOR_FUNCTIONS', e.g. Indicator('stoch_rsi', window=8)."""
+    def __init__(self, name, **params):
+        if name not in INDICATOR_FUNCTIONS:
+            raise ValueError(f"Unknown indicator '{name}'. Use one of {list(INDICATOR_FUNCTIONS)}.")
+        self.name = name
+        self.params = params
+        self.key = ("indicator", name, tuple(sorted(params.items())))
+
+    def compute(self, evaluator):
+        values = INDICATOR_FUNCTIONS[self.name](evaluator.df, **self.params)
+        return np.asarray(values, dtype=float)
+
+
+COMPARISONS = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge
+}
+
+
+class Compare(Node):
+    def __init__(self, op, left, right):
+        self.op = op
+        self.left = as_node(left)
+        self.right = as_node(right)
+        self.key = ("compare", op, self.left.key, self.right.key)
+
+    def compute(self, evaluator):
+        # comparisons with NaN are False, so bars without indicator values never match
+        return COMPARISONS[self.op](evaluator.evaluate(self.left), evaluator.evaluate(self.right))
+
+
+class And(Node):
+    def __init__(self, *nodes):
+        self.nodes = [as_node(node) for node in nodes]
+        # sorted, so that 'a & b' and 'b & a' share the same cache entry
+        self.key = ("and",) + tuple(sorted((node.key for node in self.nodes), key=repr))
+
+    def compute(self, evaluator):
+        return np.logical_and.reduce([evaluator.evaluate(node) for node in self.nodes])
+
+
+class Or(Node):
+    def __init__(self, *nodes):
+        self.nodes = [as_node(node) for node in nodes]
+        self.key = ("or",) + tuple(sorted((node.key for node in self.nodes), key=repr))
+
+    def compute(self, evaluator):
+        return np.logical_or.reduce([evaluator.evaluate(node) for node in self.nodes])
+
+
+class Not(Node):
+    def __init__(self, node):
+        self.node = as_node(node)
+        self.key = ("not", self.node.key)
+
+    def compute(self, evaluator):
+        return ~evaluator.evaluate(self.node).astype(bool)
+
+
+class Cross(Node):
+    """True on the bar where 'left' crosses above (or below) 'right'."""
+    def __init__(self, left, right, direction="above"):
+        if direction not in ("above", "below"):
+            raise ValueError("Invalid cross direction. Use 'above' or 'below'.")
+        self.left = as_node(left)
+        self.right = as_node(right)
+        self.direction = direction
+        self.key = ("cross", direction, self.left.key, self.right.key)
+
+    def compute(self, evaluator):
+        left = evaluator.evaluate(self.left)
+        right = evaluator.evaluate(self.right)
+        if self.direction == "above":
+            now, before = left > right, left <= right
+        else:
+            now, before = left < right, left >= right
+
+        crossed = np.zeros(evaluator.length, dtype=bool)
+        crossed[1:] = now[1:] & before[:-1]
+        return crossed
+
+
+class Lookback(Node):
+    """True if 'node' was True in any of the last 'bars' bars, including the current bar."""
+    def __init__(self, node, bars):
+        if bars < 1:
+            raise ValueError("Lookback needs at least one bar.")
+        self.node = as_node(node)
+        self.bars = bars
+        self.key = ("lookback", bars, self.node.key)
+
+    def compute(self, evaluator):
+        # number of True values in the window = difference of the running count
+        count = np.cumsum(evaluator.evaluate(self.node).astype(np.int64))
+        window_count = count.copy()
+        window_count[self.bars:] -= count[:-self.bars]
+        return window_count > 0
+
+
+class ConditionEvaluator:
+    """
+    Evaluates condition nodes on the data of one day. Every node (and every shared sub-expression)
+    is computed at most once; later requests for the same key are served from the cache. Use one
+    evaluator per day for all strategies and parameter variants of a sweep.
+
+    Build the evaluator on the whole day (before the time window is applied), so indicators have
+    their warm-up, and select the rows of the time window with 'positions'.
+    """
+    # evaluators of the last 'cache_size' days of this process, see 'for_day'
+    cache_size = 64
+    _days = OrderedDict()
+
+    def __init__(self, df):
+        self.df = df
+        self.length = len(df)
+        self.cache = {}
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def for_day(cls, df):
+        """
+        Returns the evaluator of a day of index data. Evaluators are keyed by the content of the data,
+        so all configs and spread widths of a sweep that evaluate the same day in this process share
+        the computed nodes, while a different dataframe of the same date gets its own evaluator.
+        """
+        key = (len(df), tuple(df.columns), int(pd.util.hash_pandas_object(df, index=False).sum()))
+        evaluator = cls._days.get(key)
+        if evaluator is None:
+            evaluator = cls(df)
+            cls._days[key] = evaluator
+            if len(cls._days) > cls.cache_size:
+                cls._days.popitem(last=False)
+        else:
+            cls._days.move_to_end(key)
+        return evaluator
+
+    def positions(self, df):
+        """
+        Returns the row positions of the bars of 'df' (e.g. the time window of the day) in the data of
+        the evaluator, matched by 'Datetime'. None if 'df' is the data of the evaluator.
+        """
+        if df is self.df:
+            return None
+        day = pd.to_datetime(self.df["Datetime"], utc=True).astype("int64").to_numpy()
+        bars = pd.to_datetime(df["Datetime"], utc=True).astype("int64").to_numpy()
+        positions = np.searchsorted(day, bars)
+        if (positions >= len(day)).any() or (day[np.minimum(positions, len(day) - 1)] != bars).any():
+            raise ValueError("The bars are not part of the data of the evaluator.")
+        return positions
+
+    def evaluate(self, node):
+        node = as_node(node)
+        if node.key in self.cache:
+            self.hits += 1
+            return self.cache[node.key]
+
+        self.misses += 1
+        values = node.compute(self)
+        self.cache[node.key] = values
+        return values
+
+    def evaluate_all(self, conditions):
+        """
+        Evaluates a dictionary of named conditions, e.g. the signal columns of a strategy.
+
+        Returns:
+            Dictionary, name -> boolean array
+        """
+        return {name: self.evaluate(node).astype(bool) for name, node in conditions.items()}
+
+
+def evaluate_variants(df, variants):
+    """
+    Evaluates many strategy variants on the same day and shares all common sub-expressions.
+
+    Params:
+        df: index data of one day
+        variants: dictionary, variant name -> dictionary of named conditions
+
+    Returns:
+        Dictionary, variant name -> DataFrame with one boolean column per condition
+    """
+    evaluator = ConditionEvaluator(df)
+    return {
+        name: pd.DataFrame(evaluator.evaluate_all(conditions), index=df.index)
+        for name, conditions in variants.items()
+    }
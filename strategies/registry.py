@@ -0,0 +1,88 @@
+# Registry of strategies and the data they depend on
+from strategies.conditions import Conditions
+
+"""Index data timeframes that a strategy can request, in the order they are passed to 'generate_entries'."""
+TIMEFRAMES = ["1min", "5min"]
+
+
+class StrategySpec:
+    """
+    Declares what a strategy needs to generate entries:
+        timeframes: index data timeframes (see 'TIMEFRAMES'). The day dataframes are passed to
+            'generate_entries' as positional arguments in this order.
+        indicators: names of indicators from 'Conditions.INDICATORS' that are calculated for every
+            loaded timeframe before the strategy is applied.
+        parameters: names of the evaluation parameters (e.g. 'use_trend_line', 'date', 'start_time')
+            that are passed to 'generate_entries' as keyword arguments. 'evaluator' is the
+            'ConditionEvaluator' of the day (see strategies/expressions.py).
+    """
+    def __init__(self, timeframes=("1min",), indicators=(), parameters=()):
+        for timeframe in timeframes:
+            if timeframe not in TIMEFRAMES:
+                raise ValueError(f"Unknown timeframe '{timeframe}'. Use one of {TIMEFRAMES}.")
+        for indicator in indicators:
+            if indicator not in Conditions.INDICATORS:
+                raise ValueError(f"Unknown indicator '{indicator}'. Use one of {list(Conditions.INDICATORS)}.")
+
+        self.timeframes = list(timeframes)
+        self.indicators = list(indicators)
+        self.parameters = list(parameters)
+
+    def entry_arguments(self, frames, values):
+        """
+        Builds the arguments for 'generate_entries'.
+
+        Params:
+            frames: dictionary, timeframe -> index data of one day
+            values: dictionary, parameter name -> value. Has to contain every declared parameter.
+
+        Returns:
+            List of positional arguments and dictionary of keyword arguments.
+        """
+        args = [frames[timeframe] for timeframe in self.timeframes]
+        kwargs = {name: values[name] for name in self.parameters}
+        return args, kwargs
+
+
+STRATEGY_REGISTRY = {}
+
+
+def register_strategy(name, timeframes=("1min",), indicators=(), parameters=()):
+    """
+    Registers the data dependencies of a strategy class under its class name.
+    """
+    STRATEGY_REGISTRY[name] = StrategySpec(timeframes, indicators, parameters)
+
+
+def get_strategy_spec(strategy):
+    """
+    Returns the 'StrategySpec' for a strategy instance, class or class name.
+    """
+    if isinstance(strategy, str):
+        name = strategy
+    elif isinstance(strategy, type):
+        name = strategy.__name__
+    else:
+        name = strategy.__class__.__name__
+
+    if name not in STRATEGY_REGISTRY:
+        raise ValueError(f"Strategy '{name}' is not registered. Register it in 'strategies/registry.py'.")
+    return STRATEGY_REGISTRY[name]
+
+
+register_strategy("DeHighInLowSimple",
+                  timeframes=("1min", "5min"),
+                  indicators=("stoch_rsi",),
+                  parameters=("use_trend_line", "use_stoch_rsi"))
+
+register_strategy("LHLFormation",
+                  timeframes=("1min",),
+                  parameters=("date", "start_time", "end_time", "enforce_ITM", "middle_ITM"))
+
+register_strategy("StochRSIStrategy",
+                  timeframes=("1min",),
+                  indicators=("stoch_rsi",))
+
+register_strategy("ExpressionStrategy",
+                  timeframes=("1min",),
+                  parameters=("evaluator",))
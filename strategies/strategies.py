@@ -1,6 +1,9 @@
+import numpy as np
 import pandas as pd
 from abc import ABC, abstractmethod
 from strategies.conditions import *
+from strategies.expressions import ConditionEvaluator
+from utils.options_helper import to_utc_ns
 
 
 class Strategy(ABC):
@@ -9,17 +12,146 @@ class Strategy(ABC):
     df with chart data. The derivation of entry and exit points can be very different between 
     strategies. Typically, a strategy implementation makes use of conditions from 
     'strategies.conditions.Conditions' to derive entry and exit points.
+
+    Signals are returned as boolean columns of the chart dataframe (see 'SIGNAL_COLUMNS'), one value
+    per bar. They should be computed with vectorized expressions over whole columns (comparisons,
+    shifts, rolling windows, numpy functions) instead of iterating over the bars with 'iterrows' or
+    loops. Trades are derived from the signal columns and the spread charts with array operations as
+    well (see 'generate_trades').
     """
+    SIGNAL_COLUMNS = ["entry_bull_put", "entry_bear_call", "exit_bull_put", "exit_bear_call"]
+
+    """Exit signal column of every spread type."""
+    EXIT_COLUMNS = {"Bull Put": "exit_bull_put", "Bear Call": "exit_bear_call"}
+
     @abstractmethod
     def generate_entries(self, df):
         pass
 
+    def generate_trades(self, df, spreads, stop_loss=1, take_profit=2, exit_w_open=True, exit_w_mm=False,
+                        money_management=("static", True)):
+        """
+        Simulates a trade for every spread of the day (see 'get_spreads'). A trade is entered with the
+        spread close at its entry signal and exits on the first bar after the entry where the stop loss
+        or the take profit limit is hit or an exit signal of its spread type occurs, otherwise with the
+        last bar of the day. The exit of every trade is found with array operations over its spread chart.
+
+        Params:
+            df: signals of the day (see 'generate_entries')
+            spreads: spreads dictionary, entry timestamp -> spread, or None without options data
+            stop_loss, take_profit: money management limits in spread price points
+            exit_w_open: fill exits with the open of the bar that follows the exit bar
+            exit_w_mm: the profit of a trade is exactly -stop_loss or take_profit when a limit is hit
+            money_management: (mm_type, exit_based_on_close), see eval_config.MM_TYPE and
+                eval_config.EXIT_BASED_ON_CLOSE
+
+        Returns:
+            List of trades, dictionaries with 'entry_time', 'exit_time' (UTC timestamps), 'entry_price',
+            'exit_price', 'profit', 'exit_reason', 'spread' (spread type and strike prices) and 'marks'
+            (spread closes from the entry until the exit, indexed by UTC time, see simulation/portfolio.py).
+            Dictionary of report metrics: 'spread_availability' (share of entry signals with a spread,
+            NaN without entry signals), 'wins' and 'losses'.
+        """
+        mm_type, exit_based_on_close = money_management
+        entries = int(df["entry_bull_put"].sum() + df["entry_bear_call"].sum())
+        exit_times = {spread_type: np.sort(to_utc_ns(df.loc[df[column].to_numpy(dtype=bool), "Datetime"]))
+                      for spread_type, column in self.EXIT_COLUMNS.items()}
+
+        trades = []
+        for timestamp, spread in (spreads or {}).items():
+            ohlc = spread["spread_ohlc"]
+            times = to_utc_ns(ohlc["Datetime"])
+            open_, high, low, close = (ohlc[column].to_numpy(dtype=float) for column in ["Open", "High", "Low", "Close"])
+            entry_time = to_utc_ns(pd.Series([timestamp]))[0]
+
+            # entered with the last spread price at the signal, the limits are checked from the next bar on
+            start = np.searchsorted(times, entry_time, side="right")
+            if start == 0:
+                continue
+            entry_price = close[start - 1]
+
+            if mm_type == "trailing":
+                # the stop loss follows the highest close before each bar
+                stop_prices = np.maximum.accumulate(close[start - 1:-1]) - stop_loss
+            else:
+                stop_prices = entry_price - stop_loss
+            hit_stop = (close[start:] if exit_based_on_close else low[start:]) <= stop_prices
+            hit_target = (close[start:] if exit_based_on_close else high[start:]) >= entry_price + take_profit
+            signal_times = exit_times[spread["spread_type"]]
+            next_signal = signal_times[np.searchsorted(signal_times, entry_time, side="right"):]
+            hit_signal = times[start:] >= (next_signal[0] if len(next_signal) else np.iinfo(np.int64).max)
+
+            hits = np.flatnonzero(hit_stop | hit_target | hit_signal)
+            if len(hits) == 0:
+                exit_bar, reason = len(close) - 1, "end of day"
+                exit_price = close[exit_bar]
+            else:
+                exit_bar = start + hits[0]
+                reason = "stop loss" if hit_stop[hits[0]] else "take profit" if hit_target[hits[0]] else "exit signal"
+                exit_price = close[exit_bar]
+                if exit_w_open and exit_bar + 1 < len(open_):
+                    exit_bar += 1
+                    exit_price = open_[exit_bar]
+
+            profit = exit_price - entry_price
+            if exit_w_mm and reason == "stop loss":
+                profit = -stop_loss
+            elif exit_w_mm and reason == "take profit":
+                profit = take_profit
+
+            trades.append({
+                "entry_time": pd.Timestamp(entry_time, tz="UTC"),
+                "exit_time": pd.Timestamp(times[exit_bar], tz="UTC"),
+                "entry_price": entry_price,
+                "exit_price": exit_price,
+                "profit": profit,
+                "exit_reason": reason,
+                "spread": {key: spread[key] for key in ["spread_type", "sold_option_price", "bought_option_price"]},
+                "marks": pd.Series(close[start - 1:exit_bar], index=pd.to_datetime(times[start - 1:exit_bar], utc=True))
+            })
+
+        wins = sum(trade["profit"] > 0 for trade in trades)
+        report_metrics = {
+            "spread_availability": len(spreads or {}) / entries if entries > 0 else np.nan,
+            "wins": wins,
+            "losses": len(trades) - wins
+        }
+        return trades, report_metrics
+
+    @staticmethod
+    def empty_signals(df):
+        """
+        Returns a copy of df with all signal columns added and set to False.
+        """
+        signals = df.copy()
+        for column in Strategy.SIGNAL_COLUMNS:
+            signals[column] = np.zeros(len(df), dtype=bool)
+        return signals
+
+
+class ReplayStrategy(ABC):
+    """
+    Opt-in for the event-driven replay ('simulation.replay.ReplayEngine'): strategies that can decide
+    about entries bar by bar inherit from this class next to 'Strategy'.
+    """
     @abstractmethod
-    def generate_trades(self, df):
+    def on_bar(self, bar, indicators):
+        """
+        Called once per index bar with the bar (dictionary with 'Datetime' and OHLC) and the
+        incrementally updated indicators. Returns 'Bull Put' or 'Bear Call' to enter a spread, or None.
+        """
         pass
 
+    def on_bar_exits(self, bar, indicators):
+        """
+        Called once per index bar after 'on_bar'. Returns the spread types whose open positions are
+        closed by an exit signal on this bar, the replay counterpart of the exit columns of
+        'generate_entries'. No exit signals by default.
+        """
+        return ()
+
 
-class StochRSIStrategy(Strategy):
+class StochRSIStrategy(Strategy, ReplayStrategy):
     def __init__(self, stoch_rsi_entry_threshold=0.2, stoch_rsi_exit_threshold=0.8):
         "This is the threshold below which you consider entering a Bull Put Spread position. "
         "The default value is 0.2, which signifies an oversold condition."
@@ -29,41 +161,57 @@ class StochRSIStrategy(Strategy):
         self.stoch_rsi_exit_threshold = stoch_rsi_exit_threshold
 
     def generate_entries(self, df):
-        signals = []
+        """
+        Marks bull put entries where the stoch RSI lies below the entry threshold and bull put exits
+        where it lies above the exit threshold. Expects the 'stoch_rsi' column from
+        'Conditions.stoch_rsi'.
+        """
+        signals = self.empty_signals(df)
+        stoch_rsi = df["stoch_rsi"].to_numpy()
 
-        # iterate over ohlc and generate signals based on stoch RSI criteria
-        for _, bar in df.iterrows():
-            if bar['stoch_RSI'] < self.stoch_rsi_entry_threshold:
-                signals.append({'action': 'enter', 'bar': bar})
+        # comparisons with NaN (first bars of the day) are False, so no signals are generated there
+        signals["entry_bull_put"] = stoch_rsi < self.stoch_rsi_entry_threshold
+        signals["exit_bull_put"] = stoch_rsi > self.stoch_rsi_exit_threshold
 
         return signals
-    
-    def generate_trades(self, signals, df):
-        signals = self.generate_entries(df)
-        trades = []
 
-        # get entry signals
-        entry_signals = [e for e in signals if e['action'] == 'enter']
-        df = df.reset_index(drop=True)
+    def on_bar(self, bar, indicators):
+        if indicators["stoch_rsi"] < self.stoch_rsi_entry_threshold:
+            return "Bull Put"
+        return None
 
-        for entry in entry_signals:
-            entry_bar = entry['bar']
-            entry_index = df.index[df['timestamp'] == entry_bar['timestamp']].tolist()
+    def on_bar_exits(self, bar, indicators):
+        if indicators["stoch_rsi"] > self.stoch_rsi_exit_threshold:
+            return ("Bull Put",)
+        return ()
+    
 
-            if not entry_index:
-                continue
-            entry_idx = entry_index[0]
+class ExpressionStrategy(Strategy):
+    """
+    A strategy that is defined by condition expressions from 'strategies.expressions', one per signal
+    column, e.g.
 
-            # iterrate over ohlc to find exit
-            for i in range(entry_idx + 1, len(df)):
-                if df.loc[i, 'stoch_RSI'] > self.stoch_rsi_exit_threshold:
-                    exit_bar = df.loc[i]
-                    trades.append({
-                        'entry_bar': entry_bar,
-                        'exit_bar': exit_bar
-                    })
-                    break  
+        stoch_rsi = Indicator("stoch_rsi", window=8)
+        ExpressionStrategy(entry_bull_put=stoch_rsi.crosses_above(0.2), exit_bull_put=stoch_rsi > 0.8)
 
-        return trades
+    Signal columns without an expression stay False. If a 'ConditionEvaluator' for the day is passed
+    to 'generate_entries', sub-expressions are shared with all other strategies using the same evaluator
+    ('run_eval_month' uses one per day, see 'ConditionEvaluator.for_day'). The evaluator may hold the
+    whole day, the signals are returned for the bars of 'df'. Trades are simulated by 'Strategy.generate_trades'.
+    """
+    def __init__(self, **conditions):
+        unknown = set(conditions) - set(self.SIGNAL_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown signal columns {sorted(unknown)}. Use {self.SIGNAL_COLUMNS}.")
+        self.conditions = conditions
+
+    def generate_entries(self, df, evaluator=None):
+        if evaluator is None:
+            evaluator = ConditionEvaluator(df)
 
+        signals = self.empty_signals(df)
+        positions = evaluator.positions(df)
+        for column, values in evaluator.evaluate_all(self.conditions).items():
+            signals[column] = values if positions is None else values[positions]
 
+        return signals
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+from datetime import date
+from utils.chain_analytics import ChainAnalytics, black_scholes_price, implied_volatility, MINUTES_PER_YEAR
+
+
+def test_implied_volatility_round_trip():
+    strikes = np.arange(5740, 5820, 5.0)
+    sigma = np.linspace(0.1, 0.4, len(strikes))
+    t = 120 / MINUTES_PER_YEAR
+    for is_call in (True, False):
+        prices = black_scholes_price(5780.0, strikes, t, sigma, is_call)
+        np.testing.assert_allclose(implied_volatility(prices, 5780.0, strikes, t, is_call), sigma, atol=1e-6)
+
+    # no volatility can be derived from a price below the intrinsic value
+    assert np.isnan(implied_volatility(10.0, 5780.0, 5800.0, t, False))
+
+
+def put_chain():
+    minutes = pd.date_range("2025-03-07 19:00", periods=30, freq="1min", tz="UTC")
+    index_df = pd.DataFrame({"Datetime": minutes, "Close": 5780.0})
+
+    close = pd.Timestamp("2025-03-07 16:00", tz="America/New_York").value
+    t = (close - minutes.asi8) / 60e9 / MINUTES_PER_YEAR
+    rows = []
+    for strike in np.arange(5700, 5860, 5.0):
+        prices = black_scholes_price(5780.0, strike, t, 0.15, False)
+        rows.append(pd.DataFrame({"ticker": f"O:SPY250307P{int(strike * 100):08d}", "Datetime": minutes.tz_localize(None), "Close": prices}))
+    return pd.concat(rows), index_df
+
+
+def test_find_by_delta():
+    options_df, index_df = put_chain()
+    analytics = ChainAnalytics(date(2025, 3, 7), options_df, index_df)
+    put = analytics.find_by_delta(pd.Timestamp("2025-03-07 19:15", tz="UTC"), "P", -0.20)
+
+    # same result as a full scan over all puts of that minute
+    deltas = analytics.delta[15]
+    assert put["ticker"] == analytics.tickers[np.nanargmin(np.abs(deltas + 0.20))]
+    assert abs(put["iv"] - 0.15) < 1e-6
+    assert analytics.find_by_delta(pd.Timestamp("2025-03-07 19:15", tz="UTC"), "C", 0.2) is None
+
+
+def test_cache_is_bounded_and_keyed_by_rate():
+    options_df, index_df = put_chain()
+    ChainAnalytics.clear_cache()
+    day = date(2025, 3, 7)
+    analytics = ChainAnalytics.for_day(day, options_df, index_df)
+    assert ChainAnalytics.for_day(day, options_df, index_df) is analytics
+    assert ChainAnalytics.for_day(day, options_df, index_df, rate=0.05) is not analytics
+    # other data of the same day, e.g. a time window, is not served from the cache
+    assert ChainAnalytics.for_day(day, options_df, index_df.iloc[10:]) is not analytics
+
+    for underlying in range(ChainAnalytics.cache_size):
+        ChainAnalytics.for_day(day, options_df, index_df, underlying=str(underlying))
+    assert len(ChainAnalytics._cache) == ChainAnalytics.cache_size
+    assert not any(key[:3] == (day, "SPY", 0.0) for key in ChainAnalytics._cache)
+    ChainAnalytics.clear_cache()
+
+
+def test_no_lookups_before_the_first_minute():
+    options_df, index_df = put_chain()
+    analytics = ChainAnalytics(date(2025, 3, 7), options_df, index_df)
+
+    assert analytics.minute_index(pd.Timestamp("2025-03-07 18:59", tz="UTC")) == -1
+    assert analytics.find_by_delta(pd.Timestamp("2025-03-07 18:59", tz="UTC"), "P", -0.20) is None
+    assert analytics.find_by_delta(pd.Timestamp("2025-03-07 19:00", tz="UTC"), "P", -0.20) is not None
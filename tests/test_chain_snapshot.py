@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+from datetime import date
+from data.sources import FileSource, get_data_source, set_data_source
+from strategies.strategies import Strategy
+from utils.chain_snapshot import ChainSnapshot
+from utils.options_helper import get_spreads, get_spreads_for_widths, select_spread_strikes_from_chain
+
+DAY = date(2025, 3, 7)
+
+
+def make_chain():
+    """SPY puts 5760 - 5790 (prices 6 - 9, the 5790 put trades from 14:05 on), two calls and a put of next week."""
+    minutes = pd.date_range("2025-03-07 14:00", periods=10, freq="1min")
+    contracts = [("O:SPY250307P00576000", 6.0, 0), ("O:SPY250307P00577000", 7.0, 0), ("O:SPY250307P00578000", 8.0, 0),
+                 ("O:SPY250307P00579000", 9.0, 5), ("O:SPY250307C00578000", 5.0, 0), ("O:SPY250307C00579000", 4.0, 0),
+                 ("O:SPY250314P00578500", 1.0, 0)]
+    return pd.concat(pd.DataFrame({
+        "ticker": ticker, "volume": 1,
+        "Open": price, "Close": price, "High": price, "Low": price,
+        "Datetime": minutes[first:].asi8, "transactions": 1
+    }) for ticker, price, first in contracts)
+
+
+def load_chain(tmp_path):
+    path = tmp_path / "2025-03" / "SPY"
+    path.mkdir(parents=True)
+    make_chain().to_csv(path / "2025-03-07.csv", index=False)
+    source = FileSource(options_dir=str(tmp_path))
+    return source, source.load_day_options(DAY, "SPY")
+
+
+def test_point_in_time_lookups(tmp_path):
+    _, options_df = load_chain(tmp_path)
+    snapshot = ChainSnapshot(DAY, options_df)
+
+    # contracts of other expiries are not part of the chain
+    assert snapshot.strikes["P"].tolist() == [5760, 5770, 5780, 5790]
+    assert snapshot.strikes["C"].tolist() == [5780, 5790]
+
+    before = pd.Timestamp("2025-03-07 13:59", tz="UTC")
+    assert snapshot.minute_index(before) == -1
+    assert np.isnan(snapshot.price(before, "P", 5780))
+    assert snapshot.by_target_price(before, "P", 8) is None
+    assert snapshot.nearest_strike(before, "P", 5786) is None
+
+    # the 5790 put has no price before its first bar
+    early, late = pd.Timestamp("2025-03-07 14:02", tz="UTC"), pd.Timestamp("2025-03-07 14:06:30", tz="UTC")
+    assert np.isnan(snapshot.price(early, "P", 5790))
+    assert snapshot.price(late, "P", 5790) == 9.0
+    assert np.isnan(snapshot.price(late, "P", 5775))
+    assert snapshot.nearest_strike(early, "P", 5786) == (5780, 8.0)
+    assert snapshot.nearest_strike(late, "P", 5786) == (5790, 9.0)
+    assert snapshot.by_target_price(early, "P", 9.4) == (5780, 8.0)
+    assert snapshot.by_target_price(late, "P", 9.4) == (5790, 9.0)
+
+
+def test_select_spread_strikes_from_chain(tmp_path):
+    _, options_df = load_chain(tmp_path)
+    snapshot = ChainSnapshot(DAY, options_df)
+    timestamp = pd.Timestamp("2025-03-07 14:06", tz="UTC")
+
+    assert select_spread_strikes_from_chain(snapshot, timestamp, 5786, "Bull Put", spread_width=20) == (5790, 5770)
+    # the bought strike is the listed strike closest to the width
+    assert select_spread_strikes_from_chain(snapshot, timestamp, 5786, "Bull Put", spread_width=20,
+                                            select_by_premium=True, target_premium=7) == (5770, 5760)
+    assert select_spread_strikes_from_chain(snapshot, timestamp, 5781, "Bear Call", spread_width=20) == (5780, 5790)
+    # no bought strike below the lowest listed put
+    assert select_spread_strikes_from_chain(snapshot, timestamp, 5761, "Bull Put", spread_width=20) is None
+    assert select_spread_strikes_from_chain(snapshot, pd.Timestamp("2025-03-07 13:59", tz="UTC"), 5786, "Bull Put") is None
+
+
+def test_spread_selection_modes_of_get_spreads(tmp_path):
+    source, _ = load_chain(tmp_path)
+    signals = Strategy.empty_signals(pd.DataFrame({"Datetime": pd.date_range("2025-03-07 14:02", periods=5, freq="1min", tz="UTC"),
+                                                   "Close": [5784.0, 5785.0, 5785.0, 5785.0, 5786.0]}))
+    signals.loc[[0, 4], "entry_bull_put"] = True
+    early, late = signals["Datetime"][0], signals["Datetime"][4]
+
+    previous = get_data_source()
+    set_data_source(source)
+    try:
+        def strikes(**mode):
+            spreads = get_spreads(signals, DAY, "14:00", "14:09", enforce_ITM=False, enforce_OTM=True, **mode)
+            return {timestamp: (spread["sold_option_price"], spread["bought_option_price"]) for timestamp, spread in spreads.items()}
+
+        # strikes rounded from the index price, 5785 / 5765 are not listed
+        assert strikes() == {early: (5780, 5760)}
+        # the listed strike closest to the index price at the time of the signal
+        assert strikes(select_nearest_listed=True) == {early: (5780, 5760), late: (5790, 5770)}
+        assert strikes(select_by_premium=True, target_premium=7) == {early: (5770, 5760), late: (5770, 5760)}
+
+        # bought 5760 put - sold 5780 put
+        spread = get_spreads(signals, DAY, "14:00", "14:09", select_nearest_listed=True)[early]
+        assert (spread["spread_ohlc"]["Close"] == 6.0 - 8.0).all()
+    finally:
+        set_data_source(previous)
+
+
+def test_one_pass_for_several_widths_equals_single_width_calls(tmp_path):
+    source, _ = load_chain(tmp_path)
+    signals = Strategy.empty_signals(pd.DataFrame({"Datetime": pd.date_range("2025-03-07 14:02", periods=5, freq="1min", tz="UTC"),
+                                                   "Close": [5784.0, 5785.0, 5785.0, 5785.0, 5786.0]}))
+    signals.loc[[0, 4], "entry_bull_put"] = True
+    widths = [10, 20, 30]
+
+    previous = get_data_source()
+    set_data_source(source)
+    try:
+        for mode in [{}, {"select_nearest_listed": True}, {"select_by_premium": True, "target_premium": 9}]:
+            spreads_by_width = get_spreads_for_widths(signals, DAY, "14:00", "14:09", widths, enforce_ITM=False, enforce_OTM=True, **mode)
+            for width in widths:
+                expected = get_spreads(signals, DAY, "14:00", "14:09", enforce_ITM=False, enforce_OTM=True, spread_width=width, **mode)
+                assert spreads_by_width[width].keys() == expected.keys()
+                for timestamp, spread in expected.items():
+                    actual = spreads_by_width[width][timestamp]
+                    assert {key: actual[key] for key in ["spread_type", "sold_option_price", "bought_option_price"]} == \
+                           {key: spread[key] for key in ["spread_type", "sold_option_price", "bought_option_price"]}
+                    pd.testing.assert_frame_equal(actual["spread_ohlc"], spread["spread_ohlc"])
+    finally:
+        set_data_source(previous)
@@ -0,0 +1,48 @@
+import os
+from data.sources import FileSource
+from tuning.checkpoints import CheckpointStore, config_hash, code_hash, month_input_files
+
+
+class Strategy:
+    def __init__(self, threshold):
+        self.threshold = threshold
+
+
+def test_results_are_reused_until_config_or_inputs_change(tmp_path):
+    (tmp_path / "1min").mkdir()
+    (tmp_path / "options" / "2025-03" / "SPY").mkdir(parents=True)
+    (tmp_path / "1min" / "2025-03.csv").write_text("Datetime,Close\n2025-03-07 09:30:00-05:00,1\n")
+    options_file = tmp_path / "options" / "2025-03" / "SPY" / "2025-03-07.csv"
+    options_file.write_text("ticker,Close\nO:SPY250307P00578000,1\n")
+    source = FileSource(options_dir=str(tmp_path / "options"), index_file_dirs={"1min": str(tmp_path / "1min")})
+
+    files = month_input_files(source, "2025-03.csv", ["1min"])
+    assert files == [str(tmp_path / "1min" / "2025-03.csv"), str(options_file)]
+
+    config = config_hash({"stop_loss": 1, "strategy": Strategy(0.2)}, code="v1")
+    assert config == config_hash({"strategy": Strategy(0.2), "stop_loss": 1}, code="v1")
+    assert config != config_hash({"stop_loss": 1, "strategy": Strategy(0.3)}, code="v1")
+    assert config != config_hash({"stop_loss": 1, "strategy": Strategy(0.2)}, code="v2")
+
+    with CheckpointStore(str(tmp_path / "checkpoints.sqlite")) as store:
+        inputs = store.inputs_hash(files)
+        assert store.get(config, "2025-03.csv", inputs) is None
+        store.put(config, "2025-03.csv", inputs, {"avg_entries_per_day": 2.5}, {"total_profit": 3})
+        assert store.get(config, "2025-03.csv", store.inputs_hash(files)) == ({"avg_entries_per_day": 2.5}, {"total_profit": 3})
+
+        # new data for the month invalidates its checkpoint
+        options_file.write_text("ticker,Close\nO:SPY250307P00578000,2\n")
+        os.utime(options_file, ns=(0, options_file.stat().st_mtime_ns + 10**9))
+        assert store.get(config, "2025-03.csv", store.inputs_hash(files)) is None
+
+    # a rebuilt availability index changes the inputs as well
+    availability_file = tmp_path / "options" / "2025-03" / "SPY" / "2025-03-07.availability.npz"
+    availability_file.write_bytes(b"index")
+    assert str(availability_file) in month_input_files(source, "2025-03.csv", ["1min"])
+
+
+def test_code_hash_does_not_depend_on_the_working_directory(tmp_path, monkeypatch):
+    code = code_hash()
+    assert code != code_hash(patterns=[])
+    monkeypatch.chdir(tmp_path)
+    assert code_hash() == code
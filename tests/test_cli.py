@@ -0,0 +1,25 @@
+import sys
+import types
+import subprocess
+import pytest
+from cli import parse_overrides, apply_overrides
+
+
+def test_overrides_are_parsed_as_literals():
+    values = parse_overrides(["STOP_LOSS=1.5", "USE_TREND_LINE=False", "START_TIME=15:00", "MM_TYPE='trailing'"])
+    assert values == {"STOP_LOSS": 1.5, "USE_TREND_LINE": False, "START_TIME": "15:00", "MM_TYPE": "trailing"}
+
+    config = types.SimpleNamespace(STOP_LOSS=1, USE_TREND_LINE=True, START_TIME="14:30", MM_TYPE="static")
+    apply_overrides(config, values)
+    assert config.STOP_LOSS == 1.5 and config.START_TIME == "15:00"
+
+    with pytest.raises(ValueError):
+        apply_overrides(config, {"STOPLOSS": 2})
+    with pytest.raises(ValueError):
+        parse_overrides(["STOP_LOSS"])
+
+
+def test_cli_does_not_import_heavy_dependencies():
+    code = "import cli, sys; print(sorted({'mlflow', 'plotly', 'polygon', 'eval_functions'} & set(sys.modules)))"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert output.strip() == "[]"
@@ -0,0 +1,37 @@
+import pytest
+import pandas as pd
+from datetime import date
+from utils.contract_codec import INVALID_KEY, encode_tickers, decode_contracts, format_tickers, contract_key
+from utils.options_helper import get_option_ticker, index_contracts
+
+
+def test_round_trip_and_invalid_tickers():
+    tickers = pd.Series(["O:SPY250307C00578000", "O:SPXW250307P05782500", "O:AAPL250307P00500000",
+                         "invalid", "O:SPY250307C00578000"])
+    keys = encode_tickers(tickers)
+
+    assert keys[0] == keys[4]
+    assert list(keys[2:4]) == [INVALID_KEY, INVALID_KEY]
+    assert list(format_tickers(keys)) == [tickers[0], tickers[1], None, None, tickers[4]]
+
+    fields = decode_contracts(keys[:2])
+    assert list(fields["root"]) == ["SPY", "SPXW"]
+    assert list(fields["is_call"]) == [True, False]
+    assert list(fields["strike_cents"]) == [57800, 578250]
+
+
+def test_contract_key_matches_ticker():
+    day = date(2025, 3, 7)
+    for option_type, strike, underlying, scale in [("Bear Call", 5780, "SPY", 10), ("P", 5782.5, "SPXW", 1)]:
+        ticker = get_option_ticker(day, option_type, strike, underlying)
+        assert contract_key(day, option_type, strike, underlying, scale) == encode_tickers([ticker])[0]
+
+
+def test_unknown_roots_are_rejected_and_not_indexed():
+    with pytest.raises(ValueError):
+        contract_key(date(2025, 3, 7), "P", 500, "AAPL")
+
+    df = pd.DataFrame({"contract": encode_tickers(["O:AAPL250307P00500000", "O:SPY250307C00578000", "O:MSFT250307P00400000"])})
+    rows = index_contracts(df)
+    assert INVALID_KEY not in rows
+    assert list(rows[contract_key(date(2025, 3, 7), "C", 5780, "SPY", 10)]) == [1]
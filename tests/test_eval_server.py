@@ -0,0 +1,30 @@
+import os
+import sys
+from eval_server import LRUCache, ModuleWatcher
+
+
+def test_lru_cache_drops_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.get("a", lambda: 1)
+    cache.get("b", lambda: 2)
+    assert cache.get("a", lambda: None) == 1  # hit, "b" is now the least recently used
+    cache.get("c", lambda: 3)
+    assert list(cache.entries) == ["a", "c"]
+    assert cache.stats() == {"size": 2, "hits": 1, "misses": 3}
+
+
+def test_watcher_reloads_changed_modules(tmp_path, monkeypatch):
+    package = tmp_path / "watched_strategies"
+    package.mkdir()
+    module = package / "strategy.py"
+    module.write_text("THRESHOLD = 0.2\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+
+    import watched_strategies.strategy
+    watcher = ModuleWatcher(package_dir=str(package), dependents=())
+    assert watcher.check() == []
+
+    module.write_text("THRESHOLD = 0.8\n")
+    os.utime(module, ns=(0, module.stat().st_mtime_ns + 10**9))
+    assert watcher.check() == ["watched_strategies.strategy"]
+    assert sys.modules["watched_strategies.strategy"].THRESHOLD == 0.8 and watcher.generation == 1
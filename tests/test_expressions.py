@@ -0,0 +1,77 @@
+import pytest
+import numpy as np
+import pandas as pd
+from strategies.expressions import Node, Column, Indicator, ConditionEvaluator, evaluate_variants
+from strategies.strategies import ExpressionStrategy
+from strategies.registry import get_strategy_spec
+
+
+def make_day(closes):
+    return pd.DataFrame({
+        "Datetime": pd.date_range("2025-03-07 14:30", periods=len(closes), freq="1min"),
+        "Close": closes
+    })
+
+
+def test_cross_and_lookback():
+    close = Column("Close")
+    evaluator = ConditionEvaluator(make_day([1.0, 3.0, 1.0, 1.0, 3.0, 3.0]))
+
+    crossed = evaluator.evaluate(close.crosses_above(2))
+    assert crossed.tolist() == [False, True, False, False, True, False]
+    assert evaluator.evaluate(close.crosses_above(2).within(2)).tolist() == [False, True, True, False, True, True]
+    assert evaluator.evaluate(~(close > 2) | (close > 2.5)).tolist() == [True] * 6
+
+
+def test_shared_subexpressions_are_computed_once():
+    stoch_rsi = Indicator("stoch_rsi", window=8)
+    variants = {
+        f"threshold {threshold}": {"entry_bull_put": (stoch_rsi < threshold) & (Column("Close") > 0)}
+        for threshold in [0.1, 0.2, 0.3]
+    }
+    evaluator = ConditionEvaluator(make_day(np.linspace(100, 110, 50) + np.sin(np.arange(50))))
+    for conditions in variants.values():
+        evaluator.evaluate_all(conditions)
+
+    # stoch rsi and the close condition are computed once and then served from the cache
+    assert len([key for key in evaluator.cache if key[0] == "indicator"]) == 1
+    assert evaluator.hits == 4
+
+    results = evaluate_variants(make_day([1.0, 2.0]), {"a": {"x": Column("Close") > 1}})
+    assert results["a"]["x"].tolist() == [False, True]
+
+
+def test_expression_strategy_in_the_pipeline_contract():
+    day = make_day([1.0, 3.0, 1.0, 1.0])
+    strategy = ExpressionStrategy(entry_bull_put=Column("Close").crosses_above(2))
+    evaluator = ConditionEvaluator(day)
+    args, kwargs = get_strategy_spec(strategy).entry_arguments({"1min": day}, {"evaluator": evaluator})
+    signals = strategy.generate_entries(*args, **kwargs)
+    assert signals["entry_bull_put"].tolist() == [False, True, False, False]
+    assert evaluator.misses > 0
+
+    trades, report_metrics = strategy.generate_trades(signals, None)
+    assert trades == [] and report_metrics["spread_availability"] == 0
+
+    with pytest.raises(TypeError):
+        Node()
+
+
+def test_evaluator_of_the_whole_day_is_shared_and_keeps_the_warm_up():
+    day = make_day(np.linspace(100, 110, 60) + np.sin(np.arange(60)))
+    window = day.iloc[40:].copy()
+    stoch_rsi = Indicator("stoch_rsi", window=8)
+    strategy = ExpressionStrategy(entry_bull_put=stoch_rsi < 0.5)
+
+    evaluator = ConditionEvaluator.for_day(day)
+    signals = strategy.generate_entries(window, evaluator=evaluator)
+    expected = ConditionEvaluator(day).evaluate(stoch_rsi < 0.5)[40:]
+    # the indicator has its warm-up before the window, on the window alone the first bars would be NaN
+    assert signals["entry_bull_put"].tolist() == expected.tolist()
+    assert np.isnan(ConditionEvaluator(window).evaluate(stoch_rsi)[:8]).all()
+
+    # the same day (another config of the sweep) gets the same evaluator, other data of the date does not
+    assert ConditionEvaluator.for_day(day.copy()) is evaluator
+    assert ConditionEvaluator.for_day(window) is not evaluator
+    ExpressionStrategy(entry_bull_put=stoch_rsi < 0.5, entry_bear_call=stoch_rsi > 0.5).generate_entries(window, evaluator=evaluator)
+    assert len([key for key in evaluator.cache if key[0] == "indicator"]) == 1
@@ -0,0 +1,83 @@
+import os
+import time
+import asyncio
+import pandas as pd
+import pytest
+
+pytest.importorskip("ib_insync")
+from eventkit import Event
+from ib_insync import BarData
+from ib_insync.objects import BarDataList
+from data.ib_crawler import IBClient, PacingLimiter, chunk_date_range
+
+
+class FakeGateway:
+    """
+    Stands in for ib_insync.IB. Serves 5 min bars during regular trading hours and answers the first
+    request of every chunk with a pacing violation.
+    """
+    def __init__(self):
+        self.errorEvent = Event("errorEvent")
+        self.request_times = []
+        self.seen = set()
+        self.next_req_id = 0
+
+    def connect(self, host, port, clientId):
+        pass
+
+    async def qualifyContractsAsync(self, *contracts):
+        return list(contracts)
+
+    async def reqHistoricalDataAsync(self, contract, endDateTime, durationStr, barSizeSetting, whatToShow,
+                                     useRTH, formatDate=1, timeout=60):
+        self.request_times.append(time.monotonic())
+        self.next_req_id += 1
+        bars = BarDataList()
+        bars.reqId = self.next_req_id
+        await asyncio.sleep(0.001)
+
+        key = (contract.symbol, endDateTime)
+        if key not in self.seen:
+            self.seen.add(key)
+            self.errorEvent.emit(bars.reqId, 162, "Historical Market Data Service error message:Pacing violation", contract)
+            return bars
+
+        start = pd.Timestamp(endDateTime) - pd.Timedelta(days=int(durationStr.split()[0]))
+        for t in pd.date_range(start, endDateTime, freq="5min", inclusive="left"):
+            if t.weekday() < 5 and "14:30" <= t.strftime("%H:%M") < "21:00":
+                bars.append(BarData(date=t.to_pydatetime(), open=1.0, high=2.0, low=0.5, close=1.5))
+        return bars
+
+
+def test_backfill_chunks_retries_and_resumes(tmp_path):
+    config = {"contracts": {
+        "SPX": {"type": "Index", "symbol": "SPX", "exchange": "CBOE", "currency": "USD"},
+        "NDX": {"type": "Index", "symbol": "NDX", "exchange": "NASDAQ", "currency": "USD"}
+    }}
+    gateway = FakeGateway()
+    client = IBClient(config, ib=gateway)
+    limiter = PacingLimiter(max_requests=4, period=0.2, max_per_contract=2, contract_period=0.05, identical_period=0.01)
+
+    start, end = pd.Timestamp("2025-01-01", tz="UTC"), pd.Timestamp("2025-03-01", tz="UTC")
+    stats = asyncio.run(client.backfill_async(start, end, bar_size="5 mins", store_dir=str(tmp_path),
+                                              limiter=limiter, retry_delay=0.01))
+
+    chunks = len(chunk_date_range(start, end, "5 mins"))
+    assert stats["SPX"] == {"chunks": chunks, "skipped": 0, "failed": 0, "rows": stats["NDX"]["rows"]}
+    assert len(gateway.request_times) == 4 * chunks  # every chunk of both contracts failed once
+
+    # never more than 4 requests in any 0.2 seconds
+    times = sorted(gateway.request_times)
+    assert all(times[i + 4] - times[i] >= 0.2 - 1e-3 for i in range(len(times) - 4))
+
+    stored = pd.concat(pd.read_csv(tmp_path / "SPX" / "5_mins" / f"{month}.csv") for month in ("2025-01", "2025-02"))
+    datetimes = pd.to_datetime(stored["Datetime"], utc=True)
+    assert datetimes.is_unique and datetimes.is_monotonic_increasing
+    assert datetimes.min() >= start and datetimes.max() < end
+    assert len(stored) == stats["SPX"]["rows"]
+
+    # a second run only skips completed chunks
+    requests = len(gateway.request_times)
+    stats = asyncio.run(client.backfill_async(start, end, bar_size="5 mins", store_dir=str(tmp_path), limiter=limiter))
+    assert stats["SPX"]["skipped"] == chunks and len(gateway.request_times) == requests
+    assert os.path.exists(tmp_path / "NDX" / "5_mins" / "backfill_manifest.json")
@@ -0,0 +1,82 @@
+import pytest
+import pandas as pd
+from utils.mlflow_logger import MLflowLogger, MAX_PARAMS_PER_BATCH, MAX_METRICS_PER_BATCH
+
+
+def offline_logger(tmp_path):
+    # no background flushes during the test
+    return MLflowLogger(offline=True, tracking_dir=str(tmp_path / "mlruns"), flush_interval=3600)
+
+
+def test_logging_is_buffered_and_sent_in_batches(tmp_path, monkeypatch):
+    logger = offline_logger(tmp_path)
+    run = logger.start_run("Test", run_name="batches")
+    for i in range(2 * MAX_PARAMS_PER_BATCH + 1):
+        run.log_param(f"p{i}", i)
+    run.log_param("p0", "last value")
+    for i in range(2 * MAX_METRICS_PER_BATCH + 1):
+        run.log_metric(f"m{i}", i)
+    run.log_table(pd.DataFrame({"a": [1, 2]}), "table.json")
+
+    # nothing is sent before the flush
+    assert logger.client.get_run(run.run_id).data.params == {}
+
+    batches = []
+    log_batch = logger.client.log_batch
+    monkeypatch.setattr(logger.client, "log_batch", lambda run_id, **kwargs: batches.append(kwargs) or log_batch(run_id, **kwargs))
+    logger.flush()
+
+    assert [len(batch.get("params", [])) for batch in batches] == [100, 100, 1, 0, 0, 0]
+    assert [len(batch.get("metrics", [])) for batch in batches] == [0, 0, 0, 1000, 1000, 1]
+    data = logger.client.get_run(run.run_id).data
+    assert len(data.params) == 2 * MAX_PARAMS_PER_BATCH + 1 and data.params["p0"] == "last value"
+    assert len(data.metrics) == 2 * MAX_METRICS_PER_BATCH + 1
+    run.end()
+    logger.close()
+
+
+def test_offline_runs_are_written_to_the_local_store(tmp_path):
+    with offline_logger(tmp_path) as logger, logger.start_run("Test", run_name="parent") as parent:
+        with parent.child_run(run_name="child") as child:
+            child.log_metric("profit", 1.5)
+
+    with offline_logger(tmp_path) as reader:
+        assert reader.client.get_run(child.run_id).data.metrics == {"profit": 1.5}
+        assert reader.client.get_run(child.run_id).data.tags["mlflow.parentRunId"] == parent.run_id
+        assert reader.client.get_run(parent.run_id).info.status == "FINISHED"
+
+
+def test_failed_sends_are_retried_and_reported_on_close(tmp_path, monkeypatch):
+    logger = offline_logger(tmp_path)
+    run = logger.start_run("Test")
+    run.log_metric("a", 1)
+
+    log_batch = logger.client.log_batch
+    def fail(run_id, **kwargs):
+        raise ConnectionError("tracking server is down")
+    monkeypatch.setattr(logger.client, "log_batch", fail)
+    logger.flush()
+    run.log_metric("b", 2)
+    run.end()
+    # the run is not terminated while its data is not sent
+    logger.flush()
+    assert logger.client.get_run(run.run_id).info.status == "RUNNING"
+
+    monkeypatch.setattr(logger.client, "log_batch", log_batch)
+    logger.flush()
+    assert logger.client.get_run(run.run_id).data.metrics == {"a": 1, "b": 2}
+    assert logger.client.get_run(run.run_id).info.status == "FINISHED"
+
+    other = logger.start_run("Test")
+    other.log_metric("c", 3)
+    monkeypatch.setattr(logger.client, "log_batch", fail)
+    with pytest.raises(RuntimeError):
+        logger.close()
+
+
+def test_logging_to_an_ended_run_raises(tmp_path):
+    with offline_logger(tmp_path) as logger:
+        run = logger.start_run("Test")
+        run.end()
+        with pytest.raises(RuntimeError, match="has ended"):
+            run.log_metric("profit", 1)
@@ -0,0 +1,80 @@
+import pandas as pd
+from datetime import date
+from data.polygon.polygon_options_preprocessing import ingest_day_file
+from data.availability import DayAvailability
+from data.sources import FileSource
+from data.quicktest_builder import has_options_data
+
+
+def test_ingest_filters_underlyings_and_expiry_in_chunks(tmp_path):
+    tickers = ["O:SPY250307P00578000", "O:SPY250314P00578000", "O:SPXW250307C05780000", "O:AAPL250307C00200000"]
+    raw = pd.DataFrame({
+        "ticker": tickers * 5,
+        "volume": 1,
+        "open": 1.0, "close": 1.5, "high": 2.0, "low": 0.5,
+        "window_start": range(20),
+        "transactions": 1
+    })
+    month_dir = tmp_path / "2025-03"
+    month_dir.mkdir()
+    raw.to_csv(month_dir / "2025-03-07.csv.gz", index=False)
+
+    stats = ingest_day_file(month_dir / "2025-03-07.csv.gz", underlyings=["SPY", "SPXW"], chunksize=3)
+    assert stats["rows"] == {"SPY": 5, "SPXW": 5}
+    assert stats["rows_kept"] == 10 and stats["rows_dropped"] == 10
+
+    spy = pd.read_csv(month_dir / "SPY" / "2025-03-07.csv")
+    assert list(spy["ticker"].unique()) == ["O:SPY250307P00578000"]
+    assert list(spy["Datetime"]) == [0, 4, 8, 12, 16]
+    assert (spy["Close"] == 15.0).all()  # SPY prices are scaled by 10
+    assert not list(month_dir.glob("*/*.part"))
+
+    availability = DayAvailability.load(month_dir / "SPY" / "2025-03-07.availability.npz")
+    assert availability.available("P", 5780, price_scale=10)
+    assert availability.available("Bull Put", 5780, price_scale=10, start_ns=16, end_ns=30)
+    assert not availability.available("P", 5780, price_scale=10, start_ns=17)
+    assert not availability.available("C", 5780, price_scale=10)  # only the put has bars
+    assert not availability.available("P", 5790, price_scale=10)
+
+
+def test_underlyings_without_rows_get_empty_partitions(tmp_path):
+    raw = pd.DataFrame({"ticker": ["O:SPY250307P00578000"] * 3, "volume": 1, "open": 1.0, "close": 1.5, "high": 2.0,
+                        "low": 0.5, "window_start": range(3), "transactions": 1})
+    month_dir = tmp_path / "2025-03"
+    month_dir.mkdir()
+    raw.to_csv(month_dir / "2025-03-07.csv", index=False)
+    raw.to_csv(month_dir / "2025-03-10.csv", index=False)  # raw file of a day that is not ingested
+
+    stats = ingest_day_file(month_dir / "2025-03-07.csv", underlyings=["SPY", "QQQ"])
+    assert stats["rows"] == {"SPY": 3, "QQQ": 0}
+    assert list(pd.read_csv(month_dir / "QQQ" / "2025-03-07.csv").columns) == list(pd.read_csv(month_dir / "SPY" / "2025-03-07.csv").columns)
+    assert not DayAvailability.load(month_dir / "QQQ" / "2025-03-07.availability.npz").has_bars.any()
+
+    # the raw files are never read in place of a partition
+    source = FileSource(options_dir=str(tmp_path))
+    assert source.load_options(date(2025, 3, 7), ["SPY", "QQQ"])["QQQ"] is None
+    assert not source.has_options(date(2025, 3, 10), "SPY")
+    assert has_options_data(source, date(2025, 3, 7), "SPY")
+    assert not has_options_data(source, date(2025, 3, 7), "QQQ")
+    assert not has_options_data(source, date(2025, 3, 10), "SPY")
+
+
+def test_preprocessed_day_files_are_rescaled_per_root(tmp_path):
+    # the old pipeline scaled the prices of every root by 10
+    legacy = pd.DataFrame({"ticker": ["O:SPY250307P00578000", "O:SPXW250307P05780000"], "volume": 1, "Open": 10.0,
+                           "Close": 15.0, "High": 20.0, "Low": 5.0, "Datetime": [0, 1], "transactions": 1})
+    month_dir = tmp_path / "2025-03"
+    month_dir.mkdir()
+    legacy.to_csv(month_dir / "2025-03-07.csv", index=False)
+
+    # read through the combined file fallback, before ingesting
+    options = FileSource(options_dir=str(tmp_path)).load_options(date(2025, 3, 7), ["SPY", "SPXW"])
+    assert options["SPY"][["Open", "Close", "High", "Low"]].values.tolist() == [[10.0, 15.0, 20.0, 5.0]]
+    assert options["SPXW"][["Open", "Close", "High", "Low"]].values.tolist() == [[1.0, 1.5, 2.0, 0.5]]
+
+    assert ingest_day_file(month_dir / "2025-03-07.csv", underlyings=["SPY", "SPXW"])["rows"] == {"SPY": 1, "SPXW": 1}
+    spy = pd.read_csv(month_dir / "SPY" / "2025-03-07.csv")
+    spxw = pd.read_csv(month_dir / "SPXW" / "2025-03-07.csv")
+    assert list(spy.columns) == list(legacy.columns)
+    assert spy[["Open", "Close", "High", "Low"]].values.tolist() == [[10.0, 15.0, 20.0, 5.0]]
+    assert spxw[["Open", "Close", "High", "Low"]].values.tolist() == [[1.0, 1.5, 2.0, 0.5]]
@@ -0,0 +1,79 @@
+import json
+import threading
+import pandas as pd
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from data.polygon.polygon_crawler import PolygonCrawler
+
+
+class MockPolygonHandler(BaseHTTPRequestHandler):
+    """
+    Serves 10 minute bars of a day in pages of 3 bars. The first request of every day is answered
+    with 429 (rate limit).
+    """
+    requests = []
+    throttled = set()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        MockPolygonHandler.requests.append(self.path)
+        if self.headers.get("Authorization") != "Bearer test-key":
+            return self.respond(401, {"status": "ERROR"})
+
+        # /v2/aggs/ticker/<ticker>/range/1/minute/<from>/<to>
+        parts = url.path.split("/")
+        ticker, day = parts[4], parts[8]
+        if (ticker, day) not in self.throttled:
+            self.throttled.add((ticker, day))
+            return self.respond(429, {"status": "ERROR"}, {"Retry-After": "0"})
+
+        cursor = int(parse_qs(url.query).get("cursor", ["0"])[0])
+        start = pd.Timestamp(day, tz="UTC") + pd.Timedelta(hours=14, minutes=30)
+        bars = [{"t": (start + pd.Timedelta(minutes=i)).value // 1_000_000, "o": i, "h": i + 1, "l": i - 1, "c": i, "v": 100, "n": 5}
+                for i in range(cursor, min(cursor + 3, 10))]
+        data = {"status": "OK", "results": bars}
+        if cursor + 3 < 10:
+            data["next_url"] = f"http://{self.headers['Host']}{url.path}?cursor={cursor + 3}"
+        self.respond(200, data)
+
+    def respond(self, status, data, headers=None):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_crawl_paginates_retries_and_resumes(tmp_path):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockPolygonHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    try:
+        with PolygonCrawler(api_key="test-key", store_dir=str(tmp_path), base_url=base_url, max_workers=4, backoff=0) as crawler:
+            # 2025-03-07 is a friday, the weekend is skipped
+            stats = crawler.crawl(["O:SPY250310C00578000", "SPY"], "2025-03-07", "2025-03-10")
+            assert stats == {"downloaded": 4, "skipped": 0, "failed": 0, "rows": 40}
+            # per day: one throttled request and four pages
+            assert len(MockPolygonHandler.requests) == 4 * 5
+
+            df = crawler.load_days("SPY", "2025-03-07", "2025-03-10")
+            assert len(df) == 20 and df["window_start"].is_monotonic_increasing
+            assert df["window_start"].iloc[0] == pd.Timestamp("2025-03-07 14:30", tz="UTC").value
+            assert (tmp_path / "O_SPY250310C00578000" / "2025-03-10.csv").exists()
+
+            # an extended range only downloads the new days
+            stats = crawler.crawl(["O:SPY250310C00578000", "SPY"], "2025-03-07", "2025-03-11")
+            assert stats["downloaded"] == 2 and stats["skipped"] == 4
+
+            # days that are not over at the exchange yet are not final, they are downloaded again
+            future = (pd.Timestamp.now(tz="America/New_York") + pd.offsets.BDay(5)).strftime("%Y-%m-%d")
+            assert crawler.crawl(["SPY"], future, future)["downloaded"] == 1
+            assert crawler.crawl(["SPY"], future, future)["downloaded"] == 1
+    finally:
+        server.shutdown()
@@ -0,0 +1,49 @@
+import pandas as pd
+from simulation.portfolio import PortfolioSimulator
+
+
+def make_trade(entry, exit, profit, width=20):
+    return {
+        "entry_time": pd.Timestamp(f"2025-03-07 {entry}"),
+        "exit_time": pd.Timestamp(f"2025-03-07 {exit}"),
+        "profit": profit,
+        "spread": {"spread_type": "Bull Put", "sold_option_price": 5780, "bought_option_price": 5780 - width}
+    }
+
+
+def test_position_and_buying_power_limits():
+    trades = [
+        make_trade("14:30", "15:00", 1.0),
+        make_trade("14:40", "15:30", -0.5),
+        make_trade("14:50", "15:10", 2.0),   # rejected, two positions open
+        make_trade("15:00", "15:20", 1.0),   # taken, first trade exits at the same time
+    ]
+    result = PortfolioSimulator(starting_capital=10000, max_open_positions=2).run(trades)
+
+    assert result["stats"]["trades_taken"] == 3
+    assert result["rejected"][0][1] == "max open positions"
+    # SPY prices are scaled by 10, a profit of 1.0 is $0.10 per share
+    assert result["stats"]["total_profit"] == 15.0
+    assert result["stats"]["max_drawdown"] == 5.0
+    assert result["marked_equity"] is None
+
+    # one $2 SPY spread (width 20 in the data) blocks $200, so only one fits into an account of $300
+    result = PortfolioSimulator(starting_capital=300, max_open_positions=5).run(trades[:2])
+    assert [reason for _, reason in result["rejected"]] == ["buying power"]
+
+    result = PortfolioSimulator(starting_capital=10000, underlying="SPXW").run(trades[:1])
+    assert result["stats"]["total_profit"] == 100.0
+
+
+def test_open_positions_are_marked_to_market():
+    trade = make_trade("14:30", "14:33", 1.0)
+    times = pd.date_range("2025-03-07 14:30", periods=3, freq="1min", tz="UTC")
+    trade.update(entry_time=times[0], exit_time=times[0] + pd.Timedelta("3min"), entry_price=-10.0,
+                 marks=pd.Series([-10.0, -12.0, -9.5], index=times))
+    result = PortfolioSimulator(starting_capital=1000).run([trade])
+
+    marked = result["marked_equity"]
+    assert marked["unrealized"].tolist() == [0.0, -20.0, 5.0]
+    assert marked["marked_equity"].tolist() == [1000.0, 980.0, 1005.0]
+    # the realized equity never drops, the open position did
+    assert result["stats"]["max_drawdown"] == 0 and result["stats"]["max_drawdown_marked"] == 20.0
@@ -0,0 +1,65 @@
+import json
+import numpy as np
+import pandas as pd
+from datetime import date
+from data.sources import FileSource
+from data.quicktest_builder import build_quicktest, allocate
+
+
+def write_full_data(tmp_path):
+    rng = np.random.default_rng(0)
+    days = pd.bdate_range("2025-01-02", "2025-02-28")
+    bars = []
+    for i, day in enumerate(days):
+        minutes = pd.date_range(day + pd.Timedelta("08:30:00"), periods=60, freq="1min", tz="America/Chicago")
+        # every third day trends, the others move randomly with a volatility that grows over the days
+        drift = 0.5 if i % 3 == 0 else 0.0
+        close = 5800 + np.cumsum(drift + rng.normal(0, 0.2 + i / 20, 60))
+        bars.append(pd.DataFrame({"Datetime": minutes.astype(str), "Open": close, "High": close + 0.5, "Low": close - 0.5, "Close": close}))
+    index = pd.concat(bars)
+    month = index["Datetime"].str[:7]
+    for timeframe in ("1min", "5min"):
+        (tmp_path / timeframe).mkdir()
+        for name, df in index.groupby(month):
+            df.to_csv(tmp_path / timeframe / f"{name}.csv", index=False)
+
+    # options data only for the days of January
+    for day in days[days.month == 1]:
+        minutes = pd.date_range(day + pd.Timedelta("14:30:00"), periods=10, freq="1min")
+        options = pd.DataFrame({"ticker": f"O:SPY{day:%y%m%d}P00578000", "volume": 1, "Open": 1.0, "Close": 1.0,
+                                "High": 1.0, "Low": 1.0, "Datetime": minutes.asi8, "transactions": 1})
+        path = tmp_path / "options" / f"{day:%Y-%m}" / "SPY"
+        path.mkdir(parents=True, exist_ok=True)
+        options.to_csv(path / f"{day:%Y-%m-%d}.csv", index=False)
+
+    return FileSource(options_dir=str(tmp_path / "options"),
+                      index_file_dirs={"1min": str(tmp_path / "1min"), "5min": str(tmp_path / "5min")})
+
+
+def test_stratified_sample_is_self_contained(tmp_path):
+    source = write_full_data(tmp_path)
+    out = tmp_path / "quicktest"
+    manifest = build_quicktest(days_per_month=4, out_dir=str(out), source=source)
+
+    selected = [date.fromisoformat(day["date"]) for day in manifest["days"]]
+    assert [sum(day.month == month for day in selected) for month in (1, 2)] == [4, 4]
+    assert json.loads((out / "manifest.json").read_text())["settings"]["days_per_month"] == 4
+
+    # the dataset is read without the full data: index of the selected days, options of the january days
+    quicktest = FileSource(options_dir=str(out / "options_flat_files"),
+                           index_file_dirs={"1min": str(out / "1_min"), "5min": str(out / "5_min")})
+    assert quicktest.index_files("5min") == ["2025-01.csv", "2025-02.csv"]
+    index_days = set(quicktest.load_index("1min", "2025-01.csv")["Datetime"].str[:10])
+    assert index_days == {day.isoformat() for day in selected if day.month == 1}
+    january = [day for day in selected if day.month == 1]
+    assert all(quicktest.has_options(day, "SPY") for day in january)
+    assert len(quicktest.load_options(january[0], ["SPY"])["SPY"]) == 10
+    assert (out / "options_flat_files" / "2025-01" / "SPY" / f"{january[0]}.availability.npz").exists()
+    written = pd.read_csv(out / "options_flat_files" / "2025-01" / "SPY" / f"{january[0]}.csv")
+    original = pd.read_csv(tmp_path / "options" / "2025-01" / "SPY" / f"{january[0]}.csv")
+    assert written["Datetime"].tolist() == original["Datetime"].tolist()
+
+
+def test_allocation_is_proportional():
+    assert allocate({"a": 10, "b": 5, "c": 1}, 4) == {"a": 3, "b": 1, "c": 0}
+    assert allocate({"a": 1, "b": 1}, 5) == {"a": 1, "b": 1}
@@ -0,0 +1,20 @@
+import pytest
+from strategies.registry import StrategySpec, get_strategy_spec
+
+
+def test_lhl_formation_only_needs_1min_data():
+    spec = get_strategy_spec("LHLFormation")
+    assert spec.timeframes == ["1min"]
+    assert spec.indicators == []
+
+
+def test_entry_arguments():
+    spec = StrategySpec(timeframes=("1min", "5min"), parameters=("use_trend_line",))
+    args, kwargs = spec.entry_arguments({"1min": "a", "5min": "b"}, {"use_trend_line": True, "date": None})
+    assert args == ["a", "b"]
+    assert kwargs == {"use_trend_line": True}
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError, match="is not registered"):
+        get_strategy_spec("UnknownStrategy")
@@ -0,0 +1,124 @@
+import pytest
+import numpy as np
+import pandas as pd
+from datetime import date
+from strategies.conditions import Conditions
+from strategies.strategies import Strategy, ReplayStrategy, StochRSIStrategy
+from data.sources import FileSource, get_data_source, set_data_source
+from simulation.replay import IncrementalStochRSI, ReplayEngine, cross_check
+from utils.options_helper import get_spreads
+
+
+def test_incremental_stoch_rsi_matches_batch():
+    closes = 100 + np.cumsum(np.random.default_rng(0).normal(size=200))
+    expected = Conditions.stoch_rsi(pd.DataFrame({"Close": closes}))["stoch_rsi"].to_numpy()
+
+    indicator = IncrementalStochRSI(window=8)
+    actual = np.array([indicator.update(close) for close in closes])
+    np.testing.assert_allclose(actual, expected, equal_nan=True)
+
+
+class EnterOnce(Strategy, ReplayStrategy):
+    """Enters a bull put on the first bar, in the replay as well as in the batch pipeline."""
+    def __init__(self):
+        self.entered = False
+
+    def generate_entries(self, df):
+        signals = self.empty_signals(df)
+        signals.loc[signals.index[0], "entry_bull_put"] = True
+        return signals
+
+    def on_bar(self, bar, indicators):
+        if not self.entered:
+            self.entered = True
+            return "Bull Put"
+        return None
+
+
+class EnterOnceExitOnThirdBar(EnterOnce):
+    """Enters a bull put on the first bar and has a bull put exit signal on the third bar."""
+    def generate_entries(self, df):
+        signals = super().generate_entries(df)
+        signals.loc[signals.index[2], "exit_bull_put"] = True
+        return signals
+
+    def __init__(self):
+        super().__init__()
+        self.bars = 0
+
+    def on_bar(self, bar, indicators):
+        self.bars += 1
+        return super().on_bar(bar, indicators)
+
+    def on_bar_exits(self, bar, indicators):
+        return ("Bull Put",) if self.bars == 3 else ()
+
+
+def make_day(sold):
+    times = pd.date_range("2025-03-07 14:30", periods=len(sold), freq="1min")
+    index_df = pd.DataFrame({"Datetime": times, "Open": 5781.0, "High": 5781.0, "Low": 5781.0, "Close": 5781.0})
+    rows = []
+    for i, t in enumerate(times):
+        rows.append({"ticker": "O:SPY250307P00578000", "Datetime": t, "Open": sold[i], "High": sold[i], "Low": sold[i], "Close": sold[i]})
+        rows.append({"ticker": "O:SPY250307P00576000", "Datetime": t, "Open": 2.0, "High": 2.0, "Low": 2.0, "Close": 2.0})
+    return index_df, pd.DataFrame(rows)
+
+
+def test_replay_take_profit():
+    # sold put loses value over time, the spread (bought - sold) rises from -10 to -6
+    index_df, options_df = make_day([12.0, 11.0, 9.0, 8.0])
+
+    engine = ReplayEngine(EnterOnce(), stop_loss=1, take_profit=2, exit_w_open=True)
+    trades = engine.run(index_df, options_df, date(2025, 3, 7))
+
+    assert len(trades) == 1
+    assert trades[0]["exit_reason"] == "take profit"
+    assert trades[0]["profit"] == 4.0  # entry -10, filled with the open of the next bar at -6
+    assert engine.latency_stats()["bars"] == 4
+
+
+def replay_and_batch(tmp_path, strategy_class, sold, mm_type, exit_w_open):
+    day = date(2025, 3, 7)
+    index_df, options_df = make_day(sold)
+    path = tmp_path / "2025-03" / "SPY"
+    path.mkdir(parents=True, exist_ok=True)
+    options_df.assign(Datetime=options_df["Datetime"].astype("int64")).to_csv(path / "2025-03-07.csv", index=False)
+
+    replay_trades = ReplayEngine(strategy_class(), stop_loss=1, take_profit=2, mm_type=mm_type,
+                                 exit_w_open=exit_w_open).run(index_df, options_df, day)
+
+    previous = get_data_source()
+    set_data_source(FileSource(options_dir=str(tmp_path)))
+    try:
+        strategy = strategy_class()
+        signals = strategy.generate_entries(index_df)
+        spreads = get_spreads(signals, day, "14:30", "14:35", enforce_ITM=False, enforce_OTM=True)
+        batch_trades, _ = strategy.generate_trades(signals, spreads, stop_loss=1, take_profit=2, exit_w_open=exit_w_open,
+                                                   money_management=(mm_type, True))
+    finally:
+        set_data_source(previous)
+    return replay_trades, batch_trades
+
+
+def test_replay_matches_batch_pipeline(tmp_path):
+    for mm_type, exit_w_open in [("static", True), ("trailing", False)]:
+        replay_trades, batch_trades = replay_and_batch(tmp_path, EnterOnce, [12.0, 11.5, 12.5, 11.0, 13.5, 12.0], mm_type, exit_w_open)
+
+        assert [trade["exit_reason"] for trade in batch_trades] == [trade["exit_reason"] for trade in replay_trades] == ["stop loss"]
+        assert cross_check(replay_trades, batch_trades) == {"matched": 1, "mismatched": [], "only_in_replay": [], "only_in_batch": []}
+
+
+def test_replay_applies_exit_signals_like_batch_pipeline(tmp_path):
+    # no limit is hit, the exit signal on the third bar closes the trade
+    for exit_w_open, profit in [(True, 0.5), (False, 0.4)]:
+        replay_trades, batch_trades = replay_and_batch(tmp_path, EnterOnceExitOnThirdBar, [12.0, 11.8, 11.6, 11.5, 11.4, 11.3], "static", exit_w_open)
+
+        assert [trade["exit_reason"] for trade in batch_trades] == [trade["exit_reason"] for trade in replay_trades] == ["exit signal"]
+        assert replay_trades[0]["profit"] == pytest.approx(profit)
+        assert cross_check(replay_trades, batch_trades) == {"matched": 1, "mismatched": [], "only_in_replay": [], "only_in_batch": []}
+
+
+def test_replay_needs_a_replay_strategy():
+    assert isinstance(StochRSIStrategy(), ReplayStrategy)
+    with pytest.raises(TypeError):
+        ReplayEngine(object())
@@ -0,0 +1,51 @@
+import numpy as np
+from collections import OrderedDict
+from datetime import date
+from utils.report_utils import summarize_trades
+from utils.robustness import max_drawdowns, block_bootstrap_indices, resample_statistics, robustness_report
+
+
+def test_drawdown_and_block_bootstrap():
+    assert max_drawdowns(np.array([[1.0, -2.0, 3.0, -1.0], [-1.0, -1.0, 5.0, 0.0]])).tolist() == [2.0, 2.0]
+
+    indices = block_bootstrap_indices(10, 100, 3, np.random.default_rng(0))
+    assert indices.shape == (100, 10)
+    # blocks are runs of consecutive days (circular)
+    assert ((indices[:, 1] - indices[:, 0]) % 10 == 1).all()
+
+
+def test_resamples_do_not_depend_on_the_number_of_processes():
+    rng = np.random.default_rng(1)
+    daily, trades = rng.normal(10, 50, 250), rng.normal(5, 30, 600)
+    serial = resample_statistics(daily, trades, n_resamples=3000, chunk_size=1000, seed=7)
+    parallel = resample_statistics(daily, trades, n_resamples=3000, chunk_size=1000, processes=2, seed=7)
+    assert all(np.array_equal(serial[key], parallel[key]) for key in serial)
+    assert len(serial["sharpe_ratio"]) == 3000
+    # permutations keep the total, only the drawdown changes
+    assert (serial["trade_max_drawdown"] >= 0).all()
+
+
+def test_report_has_confidence_intervals_of_the_month_results():
+    month_results = [("2025-01.csv", {}, {"profits_per_day": [10, -5, 20], "profits_per_trade": [10, -5, 12, 8]}),
+                     ("2025-02.csv", {}, {"profits_per_day": [-15, 30], "profits_per_trade": [-15, 30]})]
+    metrics, intervals = robustness_report(month_results, n_resamples=500, seed=0)
+    assert intervals.set_index("statistic").loc["total_profit", "observed"] == 40
+    assert metrics["robust/total_profit_p5"] <= metrics["robust/total_profit_p50"] <= metrics["robust/total_profit_p95"]
+    assert {"robust/win_rate_p50", "robust/max_drawdown_p95", "robust/sharpe_ratio_p5"} <= set(metrics)
+
+
+def test_trade_stats_of_summarize_trades_feed_the_report():
+    def day(*profits):
+        trades = [{"spread": {"spread_type": "Bull Put"}, "profit": profit} for profit in profits]
+        return {"trades": trades, "spread_availability": 1.0, "wins": sum(p > 0 for p in profits), "losses": sum(p <= 0 for p in profits)}
+
+    # days in the order of the signal dictionary, which is not chronological
+    trades_dict = OrderedDict([(date(2025, 1, 3), day(-4.0)), (date(2025, 1, 2), day(10.0, 2.0)), (date(2025, 1, 6), day())])
+    trade_stats, _ = summarize_trades(trades_dict)
+    assert trade_stats["profit_per_trade"] == 8.0 / 3
+    assert trade_stats["profits_per_day"] == [12.0, -4.0, 0.0]
+    assert trade_stats["profits_per_trade"] == [10.0, 2.0, -4.0]
+
+    _, intervals = robustness_report([("2025-01.csv", {}, trade_stats)], n_resamples=200, seed=0)
+    observed = intervals.set_index("statistic")["observed"]
+    assert observed["total_profit"] == 8.0 and observed["win_rate"] == 2 / 3
@@ -0,0 +1,69 @@
+import multiprocessing
+import numpy as np
+import pandas as pd
+from datetime import date
+from data.shared_data import SharedDataPlane, SharedSource, attach_frame, release_frame, attached_segments, init_worker, map_in_batches
+from data.sources import FileSource, get_data_source
+from utils.contract_codec import contract_key, encode_tickers
+
+
+def options_frame():
+    minutes = pd.date_range("2025-03-07 14:30", periods=30, freq="1min")
+    tickers = ["O:SPY250307P00578000", "O:SPY250307C00578000"]
+    df = pd.concat(pd.DataFrame({"ticker": ticker, "Close": np.arange(30.0), "Datetime": minutes}) for ticker in tickers)
+    df["contract"] = encode_tickers(df["ticker"])
+    return df.reset_index(drop=True)
+
+
+def read_close(key):
+    option = get_data_source().get_option(date(2025, 3, 7), key, "14:40", "14:44")
+    return option["Close"].tolist()
+
+
+def test_frames_round_trip_without_copies():
+    df = options_frame()
+    with SharedDataPlane() as plane:
+        entry = plane.put(("options", "2025-03-07", "SPY"), df)
+        shared = attach_frame(entry)
+        pd.testing.assert_frame_equal(shared, df, check_categorical=False, check_dtype=False)
+        assert not shared["Close"].to_numpy().flags.writeable
+        assert attached_segments() == {entry["segment"]: 1}
+        release_frame(entry)
+        assert attached_segments() == {}
+
+
+def test_workers_read_from_shared_memory():
+    with SharedDataPlane() as plane:
+        plane.put(("options", "2025-03-07", "SPY"), options_frame())
+        key = contract_key(date(2025, 3, 7), "C", 5780, "SPY", 10)
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(2, initializer=init_worker, initargs=(plane.manifest(),)) as pool:
+            assert pool.map(read_close, [key, key]) == [[10.0, 11.0, 12.0, 13.0, 14.0]] * 2
+
+        source = SharedSource(plane.manifest())
+        assert source.has_options(date(2025, 3, 7), "SPY") and not source.has_options(date(2025, 3, 10), "SPY")
+        source.close()
+
+
+def visible_months(task):
+    _, file_names = task
+    source = get_data_source()
+    return [(file_name, source.index_files("1min"), len(source.load_index("1min", file_name))) for file_name in file_names]
+
+
+def test_tasks_run_on_month_batches(tmp_path):
+    (tmp_path / "1min").mkdir()
+    for month in ["2025-01", "2025-02", "2025-03"]:
+        index = pd.DataFrame({"Datetime": [f"{month}-03 08:30:00-06:00", f"{month}-04 08:30:00-06:00"], "Close": 1.0})
+        index.to_csv(tmp_path / "1min" / f"{month}.csv", index=False)
+    source = FileSource(options_dir=str(tmp_path / "options"), index_file_dirs={"1min": str(tmp_path / "1min")})
+
+    tasks = [("a", ["2025-01.csv", "2025-02.csv", "2025-03.csv"]), ("b", ["2025-02.csv"])]
+    results = {0: [], 1: []}
+    with multiprocessing.get_context("spawn").Pool(2) as pool:
+        for position, month_results in map_in_batches(pool, visible_months, tasks, source, ["1min"]):
+            results[position] += month_results
+
+    # every task sees only the month of its batch in shared memory
+    assert sorted(results[0]) == [(month, [month], 2) for month in tasks[0][1]]
+    assert results[1] == [("2025-02.csv", ["2025-02.csv"], 2)]
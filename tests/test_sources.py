@@ -0,0 +1,95 @@
+import pytest
+import pandas as pd
+from datetime import date
+from data.sources import DataSource, FileSource, SQLiteSource, get_data_source, set_data_source
+from strategies.strategies import Strategy
+from utils.options_helper import get_spreads
+from utils.contract_codec import contract_key
+from data.availability import availability_from_options, get_availability_path
+
+
+def write_files(tmp_path):
+    minutes = pd.date_range("2025-03-07 14:00", periods=90, freq="1min")
+    options = pd.concat(pd.DataFrame({
+        "ticker": ticker,
+        "volume": 1,
+        "Open": range(90), "Close": range(90), "High": range(90), "Low": range(90),
+        "Datetime": minutes.asi8,
+        "transactions": 1
+    }) for ticker in ["O:SPY250307P00578000", "O:SPY250307C00578000", "O:SPY250314P00578000"])
+    (tmp_path / "options" / "2025-03" / "SPY").mkdir(parents=True)
+    options.to_csv(tmp_path / "options" / "2025-03" / "SPY" / "2025-03-07.csv", index=False)
+
+    index = pd.DataFrame({
+        "Datetime": pd.date_range("2025-03-06 08:30", periods=3, freq="1D", tz="America/Chicago").astype(str),
+        "Open": [1.0, 2.0, 3.0], "High": 1.0, "Low": 1.0, "Close": 1.0
+    })
+    (tmp_path / "1min").mkdir()
+    index.to_csv(tmp_path / "1min" / "2025-03.csv", index=False)
+
+    return FileSource(options_dir=str(tmp_path / "options"), index_file_dirs={"1min": str(tmp_path / "1min")},
+                      quicktest_index_file_dirs={"1min": str(tmp_path / "quicktest")})
+
+
+def test_sqlite_source_matches_file_source(tmp_path):
+    files = write_files(tmp_path)
+    database = SQLiteSource(str(tmp_path / "data.sqlite"))
+    database.import_files(underlyings=["SPY"], file_source=files)
+
+    day = date(2025, 3, 7)
+    key = contract_key(day, "P", 5780, "SPY", 10)
+    for source in (files, database):
+        assert source.has_options(day, "SPY") and not source.has_options(date(2025, 3, 10), "SPY")
+        assert len(source.load_options(day, ["SPY"])["SPY"]) == 270
+
+    expected = files.get_option(day, key, "14:30", "15:00").reset_index(drop=True)
+    actual = database.get_option(day, key, "14:30", "15:00")
+    assert len(expected) == 31
+    pd.testing.assert_frame_equal(actual[expected.columns], expected, check_dtype=False)
+
+    assert files.index_files("1min") == database.index_files("1min") == ["2025-03.csv"]
+    pd.testing.assert_frame_equal(database.load_index("1min", "2025-03.csv"), files.load_index("1min", "2025-03.csv"))
+    assert list(database.load_index("1min", "2025-03.csv", date=day)["Open"]) == [2.0]
+    assert list(files.load_index("1min", "2025-03.csv", date=day)["Open"]) == [2.0]
+
+
+def test_day_options_and_availability_come_from_the_source(tmp_path):
+    files = write_files(tmp_path)
+    database = SQLiteSource(str(tmp_path / "data.sqlite"))
+    database.import_files(underlyings=["SPY"], file_source=files)
+    day = date(2025, 3, 7)
+
+    # the day that is kept for the contract lookups, no second read
+    assert files.load_day_options(day, "SPY") is files.load_day_options(day, "SPY")
+    assert len(database.load_day_options(day, "SPY")) == 270
+
+    assert files.load_availability(day, "SPY") is None
+    availability_from_options(day, files.load_day_options(day, "SPY")).save(get_availability_path(day, "SPY", files.options_dir))
+    assert files.load_availability(day, "SPY").available("P", 5780, price_scale=10)
+    # availability files of the csv data are never used for the database
+    assert database.load_availability(day, "SPY") is None
+
+
+def test_data_source_is_abstract():
+    with pytest.raises(TypeError):
+        DataSource()
+
+
+def test_spreads_without_option_bars_are_skipped(tmp_path):
+    files = write_files(tmp_path)
+    day = date(2025, 3, 7)
+    availability_from_options(day, files.load_day_options(day, "SPY")).save(get_availability_path(day, "SPY", files.options_dir))
+    # the availability index is left, the options data of the day is gone: 'get_option' returns None
+    (tmp_path / "options" / "2025-03" / "SPY" / "2025-03-07.csv").unlink()
+    source = FileSource(options_dir=files.options_dir)
+    assert source.get_option(day, contract_key(day, "P", 5780, "SPY", 10)) is None
+
+    signals = Strategy.empty_signals(pd.DataFrame({"Datetime": pd.date_range("2025-03-07 14:10", periods=1, freq="1min"), "Close": 5781.0}))
+    signals["entry_bull_put"] = True
+    previous = get_data_source()
+    set_data_source(source)
+    try:
+        # both legs on the 5780 put, which is available according to the index
+        assert get_spreads(signals, day, "14:00", "15:29", enforce_ITM=False, enforce_OTM=True, spread_width=0) == {}
+    finally:
+        set_data_source(previous)
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+from strategies.strategies import Strategy, StochRSIStrategy
+
+
+def make_spread(closes, start="2025-03-07 14:30"):
+    times = pd.date_range(start, periods=len(closes), freq="1min")
+    closes = np.asarray(closes, dtype=float)
+    return {"spread_type": "Bull Put", "sold_option_price": 5780, "bought_option_price": 5760,
+            "spread_ohlc": pd.DataFrame({"Datetime": times, "Open": closes + 0.5, "High": closes + 1, "Low": closes - 1, "Close": closes})}
+
+
+def test_stoch_rsi_strategy_trades():
+    df = pd.DataFrame({
+        "Datetime": pd.date_range("2025-03-07 14:30", periods=6, freq="1min", tz="UTC"),
+        "Close": [100.0, 101.0, 102.0, 103.0, 104.0, 105.0],
+        "stoch_rsi": [np.nan, 0.1, 0.5, 0.9, 0.15, 0.3]
+    })
+    signals = StochRSIStrategy().generate_entries(df)
+    # entries at bars 1 and 4, a spread is only available for the first one
+    spreads = {df["Datetime"][1]: make_spread([-10, -10, -9.5, -9, -8, -8])}
+    trades, report_metrics = StochRSIStrategy().generate_trades(signals, spreads, stop_loss=1, take_profit=2, exit_w_open=False)
+
+    # exit signal at bar 3, before the take profit at bar 4
+    assert [(trade["exit_reason"], trade["profit"]) for trade in trades] == [("exit signal", 1.0)]
+    assert trades[0]["entry_time"] == pd.Timestamp("2025-03-07 14:31", tz="UTC")
+    assert report_metrics == {"spread_availability": 0.5, "wins": 1, "losses": 0}
+
+
+def test_money_management_of_trades():
+    df = Strategy.empty_signals(pd.DataFrame({"Datetime": pd.date_range("2025-03-07 14:30", periods=6, freq="1min")}))
+    df.loc[0, "entry_bull_put"] = True
+    closes = [-10, -9, -7.5, -8.6, -9.5, -9]
+    spreads = {df["Datetime"][0]: make_spread(closes)}
+    strategy = StochRSIStrategy()
+
+    trades, _ = strategy.generate_trades(df, spreads, stop_loss=1, take_profit=5, exit_w_open=False)
+    assert [(trade["exit_reason"], trade["profit"]) for trade in trades] == [("end of day", 1.0)]
+    assert trades[0]["marks"].tolist() == closes[:-1]  # open from the entry until the last bar
+
+    # the trailing stop follows the close of -7.5 up to -8.5 and is hit at -8.6, filled with the next open
+    trades, _ = strategy.generate_trades(df, spreads, stop_loss=1, take_profit=5, money_management=("trailing", True))
+    assert [(trade["exit_reason"], trade["exit_price"]) for trade in trades] == [("stop loss", -9.0)]
+    assert trades[0]["exit_time"] == pd.Timestamp("2025-03-07 14:34", tz="UTC")
+
+    trades, report_metrics = strategy.generate_trades(df, spreads, stop_loss=1, take_profit=5, exit_w_mm=True,
+                                                      money_management=("trailing", True))
+    assert trades[0]["profit"] == -1 and report_metrics["losses"] == 1
+
+    # with the high of the bars, the target of -8 is hit at -9 + 1 already
+    trades, _ = strategy.generate_trades(df, spreads, stop_loss=1, take_profit=2, exit_w_open=False, money_management=("static", False))
+    assert [(trade["exit_reason"], trade["exit_time"].minute) for trade in trades] == [("take profit", 31)]
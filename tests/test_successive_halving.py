@@ -0,0 +1,48 @@
+from tuning.successive_halving import (successive_halving, hyperband, rung_schedule, spread_order, sample_configs,
+                                       expand_params, best_config, search_cost)
+
+
+def fake_evaluate(task):
+    # profit per day peaks at stop loss 2 / take profit 3, noisy on few months
+    params, months = task
+    noise = 0.5 if len(months) < 4 else 0.0
+    profit = -abs(params["stop_loss"] - 2) - abs(params["take_profit"] - 3) + (noise if params["stop_loss"] == 1 else 0)
+    return {"avg/avg_profit_per_day": profit}
+
+
+def test_rungs_promote_the_best_configs_to_more_months():
+    assert rung_schedule(27, 18, min_months=2, eta=3) == [(27, 2), (9, 6), (3, 18)]
+
+    months = spread_order([f"2024-{month:02d}.csv" for month in range(1, 13)] + [f"2025-{month:02d}.csv" for month in range(1, 7)])
+    assert len(set(months)) == 18
+    # a short prefix covers the whole history
+    assert months[:3] == ["2024-01.csv", "2024-10.csv", "2024-05.csv"]
+
+    configs = sample_configs({"stop_loss": [1, 1.5, 2, 2.5, 3], "take_profit": [1, 2, 3, 4, 5]}, 27, seed=1)
+    assert len(configs) == 25
+    evaluations = successive_halving(configs, fake_evaluate, months, min_months=2, eta=3)
+    assert [len([e for e in evaluations if e["rung"] == rung]) for rung in range(3)] == [25, 8, 2]
+
+    best = best_config(evaluations)
+    assert best["months"] == 18 and best["params"] == {"stop_loss": 2, "take_profit": 3}
+    cost, fraction = search_cost(evaluations, len(months))
+    # months of promoted configs are evaluated once: 17 configs on 2 months, 6 on 6 and 2 on all 18
+    assert cost == 17 * 2 + 6 * 6 + 2 * 18 and fraction < 0.25
+
+
+def test_hyperband_runs_all_brackets():
+    months = [f"2024-{month:02d}.csv" for month in range(1, 13)]
+    space = {"stop_loss": [1, 1.5, 2, 2.5, 3], "take_profit": [1, 2, 3, 4, 5]}
+    evaluations = hyperband(lambda n: sample_configs(space, n, seed=n), fake_evaluate, months, min_months=2, eta=2)
+    assert sorted({e["bracket"] for e in evaluations}) == [0, 1, 2]
+    assert best_config(evaluations)["months"] == 12
+
+    # a config that is sampled in two brackets is evaluated (and counted) in both
+    evaluations = [{"bracket": 1, "config": "a", "months": 2}, {"bracket": 1, "config": "a", "months": 6},
+                   {"bracket": 0, "config": "a", "months": 6}]
+    assert search_cost(evaluations, 6) == (12, 1.0)
+
+
+def test_spread_mode_and_time_window_are_expanded():
+    assert expand_params({"spread_mode": "Middle ITM", "time_window": ["15:30", "21:00"], "stop_loss": 1}) == {
+        "enforce_ITM": False, "middle_ITM": True, "enforce_OTM": False, "start_time": "15:30", "end_time": "21:00", "stop_loss": 1}
@@ -0,0 +1,37 @@
+import pytest
+from tuning.walk_forward import walk_forward_folds, cross_validation_folds, evaluate_folds, logged_metrics
+
+MONTHS = [f"2024-{month:02d}.csv" for month in range(1, 7)]
+
+
+def test_folds_never_test_on_train_months():
+    folds = walk_forward_folds(MONTHS, train_months=3, test_months=1)
+    assert folds[0] == (MONTHS[0:3], [MONTHS[3]]) and folds[-1] == (MONTHS[2:5], [MONTHS[5]])
+    assert walk_forward_folds(MONTHS, train_months=3, anchored=True)[-1] == (MONTHS[0:5], [MONTHS[5]])
+    assert len(walk_forward_folds(MONTHS, train_months=2, test_months=2)) == 2
+    # overlapping test folds would count months twice in the out-of-sample result
+    with pytest.raises(ValueError):
+        walk_forward_folds(MONTHS, train_months=2, test_months=2, step=1)
+
+    folds = cross_validation_folds(MONTHS, k=4)
+    assert [len(test) for _, test in folds] == [2, 2, 1, 1]
+    assert all(not set(train) & set(test) and len(train) + len(test) == 6 for train, test in folds)
+
+
+def test_best_train_config_is_evaluated_on_the_test_months():
+    # config 'a' wins the first three months, 'b' the last three
+    profits = {"a": [3, 3, 3, 0, 0, 0], "b": [1, 1, 1, 2, 2, 2]}
+    config_results = {name: ({"name": name}, [(month, {}, {"total_profit": profit}) for month, profit in zip(MONTHS, values)])
+                      for name, values in profits.items()}
+
+    def summarize(month_results):
+        return {"t/total_profit": sum(month[2]["total_profit"] for month in month_results)}
+
+    folds = evaluate_folds(config_results, walk_forward_folds(MONTHS, train_months=3), metric="t/total_profit", summarize=summarize)
+    assert [fold["config"] for fold in folds] == ["a", "a", "b"]
+    assert [fold["test_metrics"]["t/total_profit"] for fold in folds] == [0, 0, 2]
+    assert [month[0] for month in folds[0]["test_results"]] == [MONTHS[3]]
+
+
+def test_missing_metrics_are_not_logged():
+    assert logged_metrics({"train/t/total_profit": None, "t/total_profit": 2.0}) == {"t/total_profit": 2.0}
@@ -0,0 +1,44 @@
+import time
+from tuning.work_queue import WorkQueue
+from tuning.distributed_sweep import grid, run_worker, sweep_results
+
+
+def test_expired_leases_are_retried_until_max_attempts(tmp_path):
+    path = str(tmp_path / "queue.sqlite")
+    with WorkQueue(path, lease_seconds=0.05, max_attempts=2) as queue:
+        queue.add_sweep("sweep", [("a", {"stop_loss": 1})])
+
+        task = queue.claim("dead-worker")
+        assert task["attempts"] == 1 and queue.claim("other") is None
+
+        # the first worker dies, its lease expires and the task is handed to the next worker
+        time.sleep(0.1)
+        retry = queue.claim("other")
+        assert retry["id"] == task["id"] and retry["attempts"] == 2
+        assert not queue.heartbeat(task) and queue.heartbeat(retry)
+
+        time.sleep(0.1)
+        assert queue.claim("third") is None
+        assert queue.status("sweep") == {"pending": 0, "running": 0, "done": 0, "failed": 1}
+
+
+def test_workers_complete_all_configs(tmp_path):
+    path = str(tmp_path / "queue.sqlite")
+    configs = grid(stop_loss=[1, 2], take_profit=[2, 3])
+    with WorkQueue(path) as queue:
+        queue.add_sweep("sweep", [(str(params), params) for params in configs], settings={"quicktest": True})
+
+    failures = []
+
+    def evaluate(task, sweep):
+        assert sweep["settings"] == {"quicktest": True}
+        if task["params"] == {"stop_loss": 2, "take_profit": 3} and not failures:
+            failures.append(task["name"])
+            raise RuntimeError("worker crashed")
+        return {"t/total_profit": task["params"]["take_profit"] - task["params"]["stop_loss"]}
+
+    assert run_worker(path, evaluate=evaluate, worker="w1") == 4
+    results = sweep_results("sweep", path)
+    assert len(results) == 4 and results["t/total_profit"].max() == 2
+    with WorkQueue(path) as queue:
+        assert queue.status("sweep")["done"] == 4
@@ -0,0 +1,144 @@
+# Per (config, month) result checkpoints, so sweeps can be resumed and only new or changed months are evaluated
+import os
+import glob
+import json
+import time
+import sqlite3
+import hashlib
+from pathlib import Path
+
+"""Default path of the checkpoint database."""
+CHECKPOINT_PATH = "dev/data/checkpoints.sqlite"
+
+"""Root of the repository, the patterns of CODE_FILES are relative to it."""
+REPO_ROOT = Path(__file__).parents[1]
+
+"""
+Source files that determine the results of an evaluation. Their content is part of the config hash, so
+results are recomputed after the strategies or the simulation changed.
+"""
+CODE_FILES = ["strategies/*.py", "simulation/*.py", "data/sources.py", "data/availability.py",
+              "utils/options_helper.py", "utils/chain_snapshot.py", "utils/chain_analytics.py", "utils/report_utils.py",
+              "utils/contract_codec.py", "eval_functions.py"]
+
+
+def _to_json(value):
+    if hasattr(value, "item"):  # numpy scalars
+        return value.item()
+    if hasattr(value, "__dict__"):  # e.g. strategy instances, by class and attributes
+        return {"class": value.__class__.__name__, **vars(value)}
+    return str(value)
+
+
+def code_hash(patterns=CODE_FILES):
+    """
+    Returns the hash of the content of the source files that determine the results. The patterns are
+    resolved against the repository root, so the hash does not depend on the working directory.
+    """
+    digest = hashlib.sha256()
+    for pattern in patterns:
+        for path in sorted(REPO_ROOT.glob(pattern)):
+            digest.update(path.relative_to(REPO_ROOT).as_posix().encode())
+            digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def config_hash(settings, quicktest=False, code=None):
+    """
+    Returns the hash of an evaluation config (keyword arguments of 'run_eval_month', see 'eval_settings').
+    """
+    config = {"settings": settings, "quicktest": quicktest, "code": code_hash() if code is None else code}
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=_to_json).encode()).hexdigest()
+
+
+def month_input_files(source, file_name, timeframes, quicktest=False, underlying="SPY"):
+    """
+    Returns the paths of the files a month is evaluated from: the monthly index files and the options
+    files of the month (with their availability indexes, which gate the spreads) for file sources, the
+    database for SQLite sources. None if the inputs of the data source are unknown, then the month is
+    not checkpointed.
+    """
+    if hasattr(source, "index_file_dirs"):
+        index_dirs = source.quicktest_index_file_dirs if quicktest else source.index_file_dirs
+        month = file_name.removesuffix(".csv")
+        month_dir = os.path.join(source.options_dir, month)
+        options_files = (glob.glob(os.path.join(month_dir, "*.csv")) + glob.glob(os.path.join(month_dir, underlying, "*.csv"))
+                         + glob.glob(os.path.join(month_dir, underlying, "*.availability.npz")))
+        return [os.path.join(index_dirs[timeframe], file_name) for timeframe in timeframes] + sorted(options_files)
+    if hasattr(source, "path"):
+        return [source.path]
+    return None
+
+
+class CheckpointStore:
+    """
+    Results of 'run_eval_month' per (config hash, month) in a SQLite database, together with the hash of
+    the month's input files. A result is reused if the config and the input files are unchanged.
+
+    File hashes are cached by path, size and modification time, so unchanged files are not read again.
+    """
+    def __init__(self, path=CHECKPOINT_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=60)
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    config TEXT, month TEXT, inputs TEXT, signal_stats TEXT, trade_stats TEXT, created REAL,
+                    PRIMARY KEY (config, month)
+                )""")
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS file_hashes (
+                    path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, hash TEXT
+                )""")
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def file_hash(self, path):
+        stat = os.stat(path)
+        row = self.connection.execute("SELECT size, mtime_ns, hash FROM file_hashes WHERE path = ?", (path,)).fetchone()
+        if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return row[2]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                digest.update(block)
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?)",
+                                    (path, stat.st_size, stat.st_mtime_ns, digest.hexdigest()))
+        return digest.hexdigest()
+
+    def inputs_hash(self, paths):
+        """Returns the combined hash of input files (missing files count as missing), None for unknown inputs."""
+        if paths is None:
+            return None
+        digest = hashlib.sha256()
+        for path in paths:
+            digest.update(path.encode())
+            digest.update((self.file_hash(path) if os.path.exists(path) else "missing").encode())
+        return digest.hexdigest()
+
+    def get(self, config, month, inputs):
+        """Returns the checkpointed (signal_stats, trade_stats), or None if missing or the inputs changed."""
+        row = self.connection.execute("SELECT inputs, signal_stats, trade_stats FROM results WHERE config = ? AND month = ?",
+                                      (config, month)).fetchone()
+        if row is None or inputs is None or row[0] != inputs:
+            return None
+        return json.loads(row[1]), json.loads(row[2])
+
+    def put(self, config, month, inputs, signal_stats, trade_stats):
+        if inputs is None:
+            return
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                                    (config, month, inputs, json.dumps(signal_stats, default=_to_json),
+                                     json.dumps(trade_stats, default=_to_json), time.time()))
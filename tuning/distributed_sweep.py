@@ -0,0 +1,211 @@
+# Parameter sweeps that are executed by worker processes on any number of hosts
+#
+#   coordinator:  python -m tuning.distributed_sweep submit "SL/TP" --experiment "MM Tuning" \
+#                     --grid '{"stop_loss": [1, 1.5, 2], "take_profit": [2, 3, 4]}'
+#   every host:   python -m tuning.distributed_sweep work
+#   coordinator:  python -m tuning.distributed_sweep aggregate "SL/TP"
+#
+# All hosts need the repository, the data directory and the queue file (e.g. on a shared mount) and
+# the same mlflow tracking server (or, with --offline, a shared 'mlruns' folder).
+import json
+import time
+import argparse
+import itertools
+import threading
+import pandas as pd
+from tuning.work_queue import WorkQueue, default_worker_name
+
+"""Default path of the queue database, next to the data."""
+QUEUE_PATH = "dev/data/sweeps.sqlite"
+
+
+def grid(**values):
+    """
+    Returns the cartesian product of parameter values as a list of dictionaries, e.g.
+    grid(stop_loss=[1, 2], take_profit=[2, 3]) -> 4 configs.
+    """
+    names = list(values)
+    return [dict(zip(names, combination)) for combination in itertools.product(*(values[name] for name in names))]
+
+
+def config_name(params):
+    """Run name of a config, e.g. 'stop_loss: 1, take_profit: 2'."""
+    return ", ".join(f"{key}: {value}" for key, value in params.items())
+
+
+def submit_sweep(name, configs, experiment_name, queue_path=QUEUE_PATH, quicktest=False, offline=False, checkpoint_path=None):
+    """
+    Starts the parent run of a sweep in mlflow and puts one task per config on the queue.
+
+    Params:
+        name: unique name of the sweep
+        configs: list of keyword arguments of 'run_total_eval' (json serializable, strategies by class
+            name), e.g. from 'grid'
+        checkpoint_path: Optional checkpoint database shared by the workers (see tuning/checkpoints.py), so
+            retried tasks and later sweeps skip the months that were already evaluated
+    """
+    from utils.mlflow_logger import MLflowLogger  # imported here, mlflow is slow to import
+    if quicktest:
+        experiment_name = f"Quicktest/{experiment_name}"
+    with MLflowLogger(offline=offline) as logger:
+        parent_run = logger.start_run(experiment_name, run_name=name)
+        parent_run.log_param("sweep/CONFIGS", len(configs))
+
+    settings = {"quicktest": quicktest, "offline": offline, "checkpoint_path": checkpoint_path}
+    with WorkQueue(queue_path) as queue:
+        queue.add_sweep(name, [(config_name(params), params) for params in configs], experiment=experiment_name,
+                        parent_run_id=parent_run.run_id, settings=settings)
+    print(f"Submitted sweep '{name}' with {len(configs)} configs to {queue_path}")
+
+
+def evaluate_task(task, sweep):
+    """
+    Evaluates the config of a task with 'run_total_eval', logged as a child run of the sweep's parent run.
+
+    Returns:
+        The metrics of the run
+    """
+    from eval_functions import run_total_eval
+    from utils.mlflow_logger import MLflowLogger
+    import strategies.strategies as strategies
+
+    params = dict(task["params"])
+    if isinstance(params.get("strategy"), str):
+        params["strategy"] = getattr(strategies, params["strategy"])()
+
+    settings = sweep["settings"]
+    with MLflowLogger(offline=settings.get("offline", False)) as logger:
+        parent_run = logger.resume_run(sweep["parent_run_id"], sweep["experiment"])
+        return run_total_eval(sweep["experiment"], run_name=task["name"], quicktest=settings.get("quicktest", False),
+                              parent_run=parent_run, checkpoint_path=settings.get("checkpoint_path"), **params)
+
+
+def run_worker(queue_path=QUEUE_PATH, sweep=None, worker=None, evaluate=evaluate_task, lease_seconds=600, max_attempts=3,
+               poll_interval=10, exit_when_idle=True):
+    """
+    Claims and evaluates tasks until the queue is empty. The lease of the running task is renewed from a
+    background thread, so a task is only handed to another worker if this worker dies or hangs.
+
+    Params:
+        sweep: Optional name of a sweep, by default tasks of all sweeps are evaluated
+        evaluate: function (task, sweep) -> json serializable result
+        exit_when_idle: If False, the worker waits for new tasks instead of returning.
+
+    Returns:
+        Number of completed tasks
+    """
+    worker = worker or default_worker_name()
+    completed = 0
+    with WorkQueue(queue_path, lease_seconds=lease_seconds, max_attempts=max_attempts) as queue:
+        while True:
+            task = queue.claim(worker, sweep)
+            if task is None:
+                if exit_when_idle:
+                    return completed
+                time.sleep(poll_interval)
+                continue
+
+            print(f"{worker}: evaluating '{task['name']}' of sweep '{task['sweep']}' (attempt {task['attempts']})")
+            stop = threading.Event()
+            heartbeat = threading.Thread(target=_renew_lease, args=(queue, task, stop), daemon=True)
+            heartbeat.start()
+            try:
+                result = evaluate(task, queue.sweep(task["sweep"]))
+            except Exception as e:
+                print(f"{worker}: '{task['name']}' failed: {e!r}")
+                queue.fail(task, repr(e))
+            else:
+                queue.complete(task, result)
+                completed += 1
+            finally:
+                stop.set()
+                heartbeat.join()
+
+
+def _renew_lease(queue, task, stop):
+    while not stop.wait(queue.lease_seconds / 3):
+        if not queue.heartbeat(task):
+            print(f"Lost the lease of task '{task['name']}', it was handed to another worker.")
+            return
+
+
+def sweep_results(name, queue_path=QUEUE_PATH):
+    """
+    Returns the results of the completed tasks of a sweep as a DataFrame, one row per config with its
+    params and metrics.
+    """
+    with WorkQueue(queue_path) as queue:
+        tasks = queue.tasks(name)
+    rows = [{"config": task["name"], **task["params"], **task["result"]} for task in tasks if task["result"] is not None]
+    return pd.DataFrame(rows)
+
+
+def aggregate_sweep(name, queue_path=QUEUE_PATH, metric="t/total_profit"):
+    """
+    Logs the results of all configs of a sweep as a table to its parent run, together with the best value
+    of 'metric', and ends the parent run.
+
+    Returns:
+        DataFrame of the results, sorted by 'metric' (best first)
+    """
+    from utils.mlflow_logger import MLflowLogger  # imported here, mlflow is slow to import
+    with WorkQueue(queue_path) as queue:
+        sweep = queue.sweep(name)
+        status = queue.status(name)
+    if sweep is None:
+        raise ValueError(f"Unknown sweep '{name}'.")
+
+    results = sweep_results(name, queue_path)
+    if not results.empty:
+        results = results.sort_values(metric, ascending=False).reset_index(drop=True)
+
+    with MLflowLogger(offline=sweep["settings"].get("offline", False)) as logger:
+        parent_run = logger.resume_run(sweep["parent_run_id"], sweep["experiment"])
+        parent_run.log_metrics({f"sweep/{key}": value for key, value in status.items()})
+        if not results.empty:
+            parent_run.log_metric(f"best/{metric}", results[metric].iloc[0])
+            parent_run.log_param("best/CONFIG", results["config"].iloc[0])
+            parent_run.log_table(data=results, artifact_file="sweep_results.json")
+        parent_run.end("FINISHED" if status["pending"] == status["running"] == status["failed"] == 0 else "FAILED")
+
+    print(f"Sweep '{name}': {status}")
+    print(results)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distributed parameter sweeps over a shared work queue.")
+    parser.add_argument("--queue", default=QUEUE_PATH, help="path of the queue database")
+    actions = parser.add_subparsers(dest="action", required=True)
+
+    submit = actions.add_parser("submit", help="submit a sweep over a parameter grid")
+    submit.add_argument("name")
+    submit.add_argument("--experiment", required=True)
+    submit.add_argument("--grid", required=True, help='json, parameter -> list of values, e.g. {"stop_loss": [1, 2]}')
+    submit.add_argument("--quicktest", action="store_true")
+    submit.add_argument("--offline", action="store_true")
+    submit.add_argument("--checkpoints", metavar="PATH", help="checkpoint database shared by the workers")
+
+    work = actions.add_parser("work", help="evaluate tasks until the queue is empty")
+    work.add_argument("--sweep")
+    work.add_argument("--lease", type=float, default=600, help="lease of a task in seconds")
+    work.add_argument("--wait", action="store_true", help="wait for new tasks instead of exiting")
+
+    status = actions.add_parser("status", help="print the task counts of a sweep")
+    status.add_argument("name")
+
+    aggregate = actions.add_parser("aggregate", help="log the results of a sweep to its parent run")
+    aggregate.add_argument("name")
+    aggregate.add_argument("--metric", default="t/total_profit")
+
+    args = parser.parse_args()
+    if args.action == "submit":
+        submit_sweep(args.name, grid(**json.loads(args.grid)), args.experiment, args.queue, args.quicktest, args.offline,
+                     args.checkpoints)
+    elif args.action == "work":
+        print(f"Completed {run_worker(args.queue, args.sweep, lease_seconds=args.lease, exit_when_idle=not args.wait)} tasks")
+    elif args.action == "status":
+        with WorkQueue(args.queue) as queue:
+            print(queue.status(args.name))
+    else:
+        aggregate_sweep(args.name, args.queue, args.metric)
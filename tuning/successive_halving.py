@@ -0,0 +1,331 @@
+# Adaptive hyperparameter search: many configs are evaluated on a few months, only the best are promoted
+# to more months (successive halving, Hyperband)
+#
+#   python -m tuning.successive_halving "MM Tuning" \
+#       --space '{"stop_loss": [1, 1.5, 2], "take_profit": [2, 3, 4], "spread_mode": ["OTM", "ITM"]}' --processes 8
+#
+# The months of every rung are a prefix of the same spread out order of all months, so a promoted config
+# only evaluates the months it has not seen yet (with checkpoints, see tuning/checkpoints.py).
+import json
+import math
+import random
+import argparse
+import functools
+import contextlib
+import pandas as pd
+from datetime import datetime
+from tuning.distributed_sweep import grid, config_name
+from tuning.checkpoints import CHECKPOINT_PATH
+
+"""Metric that is maximized by default. Per day, so it is comparable between rungs with different months."""
+METRIC = "avg/avg_profit_per_day"
+
+"""Spread selection modes, the 'spread_mode' parameter of a search space, see 'expand_params'."""
+SPREAD_MODES = {
+    "OTM": {"enforce_ITM": False, "middle_ITM": False, "enforce_OTM": True},
+    "ITM": {"enforce_ITM": True, "middle_ITM": False, "enforce_OTM": False},
+    "Middle ITM": {"enforce_ITM": False, "middle_ITM": True, "enforce_OTM": False},
+    "ITM / OTM": {"enforce_ITM": False, "middle_ITM": False, "enforce_OTM": False}
+}
+
+
+def expand_params(params):
+    """
+    Converts the parameters of a search space into keyword arguments of 'run_eval_month':
+    'spread_mode' (key of SPREAD_MODES) sets the ITM / OTM flags, 'time_window' ([start, end]) sets the
+    start and end time and a strategy given by class name is instantiated. Other keys are passed unchanged.
+    """
+    params = dict(params)
+    if "spread_mode" in params:
+        params.update(SPREAD_MODES[params.pop("spread_mode")])
+    if "time_window" in params:
+        params["start_time"], params["end_time"] = params.pop("time_window")
+    if isinstance(params.get("strategy"), str):
+        import strategies.strategies as strategies
+        params["strategy"] = getattr(strategies, params["strategy"])()
+    return params
+
+
+def sample_configs(space, n, seed=None):
+    """
+    Returns n distinct configs drawn at random from the grid of a search space, or the whole grid (shuffled)
+    if it has at most n configs.
+
+    Params:
+        space: dictionary, parameter -> list of values
+    """
+    configs = grid(**space)
+    random.Random(seed).shuffle(configs)
+    return configs[:n]
+
+
+def spread_order(items):
+    """
+    Orders items so that every prefix is spread evenly over the whole list (van der Corput sequence),
+    e.g. the first months of the order cover the beginning, the middle and the end of the history.
+    """
+    order = []
+    seen = set()
+    i = 0
+    while len(order) < len(items):
+        # bit reversed fraction of i: 0, 1/2, 1/4, 3/4, 1/8, ...
+        fraction, denominator, k = 0.0, 1, i
+        while k:
+            denominator *= 2
+            fraction += (k % 2) / denominator
+            k //= 2
+        index = int(fraction * len(items))
+        if index not in seen:
+            seen.add(index)
+            order.append(items[index])
+        i += 1
+    return order
+
+
+def rung_schedule(n_configs, n_months, min_months=2, eta=3):
+    """
+    Returns the rungs of successive halving as a list of (number of configs, number of months): the first
+    rung evaluates all configs on 'min_months' months, every following rung the best 1/eta of the configs
+    on eta times as many months, until the last rung uses all months.
+    """
+    months = min(max(min_months, 1), n_months)
+    schedule = [(n_configs, months)]
+    while months < n_months:
+        n_configs = max(1, n_configs // eta)
+        months = min(months * eta, n_months)
+        schedule.append((n_configs, months))
+    return schedule
+
+
+def metric_score(metrics, metric):
+    """Returns the value of a metric to maximize, -inf if it is missing or NaN (e.g. no trades)."""
+    value = metrics.get(metric) if metrics else None
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return float("-inf")
+    return value
+
+
+def successive_halving(configs, evaluate, months, min_months=2, eta=3, metric=METRIC, map_function=map, bracket=0):
+    """
+    Evaluates configs with successive halving.
+
+    Params:
+        configs: list of parameter dictionaries
+        evaluate: function ((params, months)) -> metrics dictionary, e.g. 'evaluate_config'
+        months: monthly files in the order they are added to the rungs (see 'spread_order')
+        map_function: map used to evaluate the configs of a rung, e.g. 'pool.imap' of a process pool
+
+    Returns:
+        List of evaluations, dictionaries with 'bracket', 'rung', 'months', 'config', 'params', 'score'
+        and 'metrics'
+    """
+    evaluations = []
+    survivors = list(configs)
+    for rung, (count, n_months) in enumerate(rung_schedule(len(configs), len(months), min_months, eta)):
+        survivors = survivors[:count]
+        rung_months = list(months[:n_months])
+        results = list(map_function(evaluate, [(params, rung_months) for params in survivors]))
+        scores = [metric_score(metrics, metric) for metrics in results]
+        for params, metrics, score in zip(survivors, results, scores):
+            evaluations.append({"bracket": bracket, "rung": rung, "months": n_months, "config": config_name(params),
+                                "params": params, "score": score, "metrics": metrics})
+        print(f"Bracket {bracket}, rung {rung}: {len(survivors)} configs on {n_months} months, best {max(scores)}")
+        ranking = sorted(range(len(survivors)), key=lambda i: scores[i], reverse=True)
+        survivors = [survivors[i] for i in ranking]
+    return evaluations
+
+
+def hyperband(sample, evaluate, months, min_months=2, eta=3, metric=METRIC, map_function=map):
+    """
+    Runs successive halving in several brackets, from many configs that start on few months to a few
+    configs that start on all months, so a good config is found even if few months are misleading.
+
+    Params:
+        sample: function (n) -> list of n configs, e.g. from 'sample_configs'
+
+    Returns:
+        List of evaluations of all brackets, see 'successive_halving'
+    """
+    s_max = 0
+    while min_months * eta ** (s_max + 1) <= len(months):
+        s_max += 1
+    evaluations = []
+    for s in range(s_max, -1, -1):
+        n_configs = math.ceil((s_max + 1) / (s + 1) * eta ** s)
+        start_months = max(min_months, len(months) // eta ** s)
+        evaluations += successive_halving(sample(n_configs), evaluate, months, start_months, eta, metric, map_function, bracket=s)
+    return evaluations
+
+
+def config_month_results(task, quicktest=False, checkpoint_path=None):
+    """
+    Evaluates a config on some months with 'run_eval_months'.
+
+    Params:
+        task: (params, months), params of a search space (see 'expand_params'), months a list of monthly files
+
+    Returns:
+        List of (file_name, signal_stats, trade_stats)
+    """
+    from eval_functions import run_eval_months, eval_settings
+    settings = eval_settings(**expand_params(task[0]))
+    return run_eval_months(settings, quicktest, checkpoint_path=checkpoint_path, file_names=task[1])[settings["spread_width"]]
+
+
+def summarize_config(month_results):
+    """Returns the metrics of 'summarize_months' for the month results of a config, in the order of the months."""
+    from eval_functions import summarize_months
+    metrics, _ = summarize_months(sorted(month_results, key=lambda month: month[0]), verbose=False)
+    return metrics
+
+
+def evaluate_config(task, quicktest=False, checkpoint_path=None):
+    """
+    Evaluates a config on some months (see 'config_month_results').
+
+    Returns:
+        The metrics of 'summarize_months'
+    """
+    return summarize_config(config_month_results(task, quicktest, checkpoint_path))
+
+
+def batched_map(pool, source, timeframes, quicktest=False, underlyings=("SPY",), checkpoint_path=None, batch_months=1):
+    """
+    Returns a map function for 'successive_halving' that evaluates the configs of a rung in a process pool
+    (or in this process if pool is None), with the data published to shared memory 'batch_months' months
+    at a time (see 'map_in_batches'). The
+    configs are evaluated month batch by month batch and summarized when all their months are done.
+    """
+    from data.shared_data import map_in_batches
+    function = functools.partial(config_month_results, quicktest=quicktest, checkpoint_path=checkpoint_path)
+
+    def map_function(evaluate, tasks):
+        tasks = list(tasks)
+        month_results = [[] for _ in tasks]
+        for position, results in map_in_batches(pool, function, tasks, source, timeframes, quicktest, underlyings, batch_months):
+            month_results[position] += results
+        return [summarize_config(results) for results in month_results]
+
+    return map_function
+
+
+def best_config(evaluations):
+    """Returns the evaluation with the best score among the evaluations on the most months."""
+    most_months = max(evaluation["months"] for evaluation in evaluations)
+    return max((evaluation for evaluation in evaluations if evaluation["months"] == most_months), key=lambda e: e["score"])
+
+
+def search_cost(evaluations, n_months):
+    """
+    Returns the number of evaluated (config, month) pairs and the cost relative to evaluating every
+    sampled config on all months. Months of promoted configs that were evaluated before are counted once,
+    a config that is sampled in several brackets of hyperband counts once per bracket.
+    """
+    evaluated = {}
+    for evaluation in evaluations:
+        key = (evaluation["bracket"], evaluation["config"])
+        evaluated[key] = max(evaluated.get(key, 0), evaluation["months"])
+    cost = sum(evaluated.values())
+    return cost, cost / (len(evaluated) * n_months)
+
+
+def run_search(experiment_name, space, run_name=f"search_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}", method="halving",
+               n_configs=27, min_months=2, eta=3, metric=METRIC, quicktest=False, processes=None,
+               checkpoint_path=CHECKPOINT_PATH, offline=False, seed=None, batch_months=1):
+    """
+    Searches a parameter space with successive halving or Hyperband. Every evaluation is logged as a
+    child run (params of the config, rung and number of months), the parent run gets the best config
+    and a table of all evaluations.
+
+    Params:
+        space: dictionary, parameter -> list of values. Keys are keyword arguments of 'run_eval_month' and
+            'spread_mode' / 'time_window' (see 'expand_params'), e.g. {"stop_loss": [1, 2], "spread_mode": ["OTM", "ITM"]}
+        method: 'halving' (n_configs sampled configs) or 'hyperband'
+        quicktest: If True, the months are the quicktest files instead of the full history.
+        processes: Optional number of worker processes, the configs of a rung are evaluated in parallel
+            from data in shared memory (see data/shared_data.py)
+        checkpoint_path: checkpoint database, so promoted configs only evaluate their new months
+        batch_months: with processes, number of months that are in shared memory at a time
+
+    Returns:
+        DataFrame of all evaluations, best first
+    """
+    import eval_config
+    from data.sources import use_data_source
+    from strategies.registry import get_strategy_spec
+    from eval_functions import eval_settings, log_eval_params
+    from utils.mlflow_logger import MLflowLogger  # imported here, mlflow is slow to import
+
+    source = use_data_source(eval_config.DATA_SOURCE, eval_config.DATA_SOURCE_PATH)
+    months = spread_order(source.index_files("1min", quicktest))
+    if quicktest:
+        experiment_name = f"Quicktest/{experiment_name}"
+    evaluate = functools.partial(evaluate_config, quicktest=quicktest, checkpoint_path=checkpoint_path)
+    rng = random.Random(seed)  # every bracket of hyperband samples other configs
+
+    def sample(n):
+        return sample_configs(space, n, seed=rng.random())
+
+    def search(map_function):
+        if method == "hyperband":
+            return hyperband(sample, evaluate, months, min_months, eta, metric, map_function)
+        return successive_halving(sample(n_configs), evaluate, months, min_months, eta, metric, map_function)
+
+    # the configs of a rung are evaluated month batch by month batch, so they share the condition evaluator of
+    # a day (see 'ConditionEvaluator.for_day'). In a pool, the batches are published to shared memory one at a time
+    strategies = space.get("strategy", [eval_settings()["strategy"]])
+    timeframes = sorted({timeframe for strategy in strategies
+                         for timeframe in get_strategy_spec(expand_params({"strategy": strategy})["strategy"]).timeframes})
+    with contextlib.ExitStack() as stack:
+        pool = None
+        if processes is not None:
+            import multiprocessing
+            pool = stack.enter_context(multiprocessing.get_context("spawn").Pool(processes))
+        evaluations = search(batched_map(pool, source, timeframes, quicktest, space.get("underlying", [eval_config.UNDERLYING]),
+                                         checkpoint_path, batch_months))
+
+    cost, fraction = search_cost(evaluations, len(months))
+    best = best_config(evaluations)
+    print(f"Evaluated {cost} config months, {fraction:.0%} of evaluating the {len({e['config'] for e in evaluations})} configs on all months")
+    print(f"Best config: {best['config']} ({metric}: {best['score']})")
+
+    with MLflowLogger(offline=offline) as logger, logger.start_run(experiment_name, run_name=run_name) as parent_run:
+        parent_run.log_params({"search/METHOD": method, "search/ETA": eta, "search/MIN_MONTHS": min_months,
+                               "search/METRIC": metric, "search/SPACE": json.dumps(space)})
+        for evaluation in evaluations:
+            name = f"{evaluation['config']} (rung {evaluation['rung']}, {evaluation['months']} months)"
+            with parent_run.child_run(run_name=name) as run:
+                log_eval_params(run, eval_settings(**expand_params(evaluation["params"])))
+                run.log_params({"search/BRACKET": evaluation["bracket"], "search/RUNG": evaluation["rung"],
+                                "search/MONTHS": evaluation["months"]})
+                run.log_metrics(evaluation["metrics"])
+        parent_run.log_param("best/CONFIG", best["config"])
+        parent_run.log_metrics({f"best/{metric}": best["score"], "search/CONFIG_MONTHS": cost, "search/COST_FRACTION": fraction})
+        table = pd.DataFrame([{key: value for key, value in evaluation.items() if key not in ("params", "metrics")}
+                              for evaluation in evaluations])
+        table = table.sort_values(["months", "score"], ascending=False).reset_index(drop=True)
+        parent_run.log_table(data=table, artifact_file="search_results.json")
+
+    print(table)
+    return table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Successive halving / Hyperband search over evaluation parameters.")
+    parser.add_argument("experiment")
+    parser.add_argument("--space", required=True, help='json, parameter -> list of values, e.g. {"stop_loss": [1, 2]}')
+    parser.add_argument("--method", choices=["halving", "hyperband"], default="halving")
+    parser.add_argument("--configs", type=int, default=27, help="number of sampled configs (successive halving)")
+    parser.add_argument("--min-months", type=int, default=2)
+    parser.add_argument("--eta", type=int, default=3)
+    parser.add_argument("--metric", default=METRIC)
+    parser.add_argument("--quicktest", action="store_true")
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--checkpoints", default=CHECKPOINT_PATH, metavar="PATH")
+    parser.add_argument("--offline", action="store_true")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--batch-months", type=int, default=1, help="months in shared memory at a time (with --processes)")
+    args = parser.parse_args()
+    run_search(args.experiment, json.loads(args.space), method=args.method, n_configs=args.configs, min_months=args.min_months,
+               eta=args.eta, metric=args.metric, quicktest=args.quicktest, processes=args.processes,
+               checkpoint_path=args.checkpoints, offline=args.offline, seed=args.seed, batch_months=args.batch_months)
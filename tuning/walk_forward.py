@@ -0,0 +1,208 @@
+# Out-of-sample evaluation: configs are tuned on the months of a train fold and evaluated on the following
+# test fold (walk-forward), or on a held out block of months (cross-validation)
+#
+#   python -m tuning.walk_forward "MM Walk Forward" --space '{"stop_loss": [1, 1.5, 2], "take_profit": [2, 3, 4]}' \
+#       --train-months 12 --test-months 1 --processes 8
+#
+# Every config is evaluated once per month, optionally in parallel over the configs from data in shared memory. The
+# month results are shared by all folds whose windows contain the month, so the folds only aggregate them.
+import json
+import argparse
+import functools
+import contextlib
+import pandas as pd
+from datetime import datetime
+from tuning.distributed_sweep import grid, config_name
+from tuning.checkpoints import CHECKPOINT_PATH
+from tuning.successive_halving import METRIC, expand_params, metric_score, config_month_results
+
+
+def walk_forward_folds(months, train_months=12, test_months=1, step=None, anchored=False):
+    """
+    Splits months into rolling folds: every fold trains on 'train_months' months and tests on the
+    'test_months' months that follow them. The folds move forward by 'step' months (default: test_months),
+    at least test_months, so every month is tested by at most one fold.
+
+    Params:
+        months: sorted monthly files, e.g. ['2024-01.csv', ...]
+        anchored: If True, the train folds all start with the first month (expanding window).
+
+    Returns:
+        List of (train months, test months)
+    """
+    step = step or test_months
+    if step < test_months:
+        raise ValueError(f"step ({step}) is smaller than test_months ({test_months}), the test folds would overlap.")
+    folds = []
+    start = 0
+    while start + train_months + test_months <= len(months):
+        train = months[0 if anchored else start:start + train_months]
+        test = months[start + train_months:start + train_months + test_months]
+        folds.append((list(train), list(test)))
+        start += step
+    return folds
+
+
+def cross_validation_folds(months, k=5):
+    """
+    Splits months into k contiguous blocks, every block is the test fold of the other k - 1 blocks. Unlike
+    walk-forward folds, train folds contain months after the test fold.
+
+    Returns:
+        List of (train months, test months)
+    """
+    size, remainder = divmod(len(months), k)
+    folds = []
+    start = 0
+    for i in range(k):
+        end = start + size + (1 if i < remainder else 0)
+        folds.append((list(months[:start]) + list(months[end:]), list(months[start:end])))
+        start = end
+    return folds
+
+
+def evaluate_folds(config_results, folds, metric=METRIC, summarize=None):
+    """
+    Selects the best config on the train months of every fold and evaluates it on the test months.
+
+    Params:
+        config_results: dictionary, config name -> (params, list of (file_name, signal_stats, trade_stats))
+            with the results of every month (see 'config_month_results')
+        folds: list of (train months, test months)
+        summarize: function (month results) -> metrics, 'summarize_months' by default
+
+    Returns:
+        List of folds, dictionaries with 'fold', 'train', 'test', 'config', 'params', 'train_metrics',
+        'test_metrics' and 'test_results' (the month results of the test months)
+    """
+    if summarize is None:
+        from eval_functions import summarize_months
+        summarize = lambda month_results: summarize_months(month_results, verbose=False)[0]
+
+    results = []
+    for fold, (train, test) in enumerate(folds):
+        train_metrics = {name: summarize([month for month in month_results if month[0] in train])
+                         for name, (_, month_results) in config_results.items()}
+        best = max(train_metrics, key=lambda name: metric_score(train_metrics[name], metric))
+        params, month_results = config_results[best]
+        test_results = [month for month in month_results if month[0] in test]
+        results.append({"fold": fold, "train": train, "test": test, "config": best, "params": params,
+                        "train_metrics": train_metrics[best], "test_metrics": summarize(test_results),
+                        "test_results": test_results})
+    return results
+
+
+def logged_metrics(metrics):
+    """Returns the metrics that have a value, mlflow only takes numbers."""
+    return {key: value for key, value in metrics.items() if value is not None}
+
+
+def run_walk_forward(experiment_name, space, run_name=f"walk_forward_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}",
+                     train_months=12, test_months=1, step=None, anchored=False, cv_folds=None, metric=METRIC,
+                     quicktest=False, processes=None, checkpoint_path=CHECKPOINT_PATH, offline=False, batch_months=1):
+    """
+    Tunes a parameter grid on rolling train folds and evaluates the best config of every fold on the
+    following test fold. Every fold is logged as a child run with the params of its config and the
+    metrics of its test months, the parent run gets the metrics of all test months together (the
+    out-of-sample result of the tuning) and a table of the folds.
+
+    Params:
+        space: dictionary, parameter -> list of values (see 'expand_params')
+        cv_folds: Optional number of cross-validation folds, replaces the walk-forward folds
+        metric: metric that selects the config of a train fold (maximized)
+        processes: Optional number of worker processes, the configs are evaluated in parallel from data
+            in shared memory (see data/shared_data.py)
+        checkpoint_path: checkpoint database, months that were evaluated before are not evaluated again
+        batch_months: with processes, number of months that are in shared memory at a time
+
+    Returns:
+        DataFrame with one row per fold
+    """
+    import eval_config
+    from data.sources import use_data_source
+    from strategies.registry import get_strategy_spec
+    from eval_functions import eval_settings, log_eval_params, summarize_months
+    from utils.mlflow_logger import MLflowLogger  # imported here, mlflow is slow to import
+
+    source = use_data_source(eval_config.DATA_SOURCE, eval_config.DATA_SOURCE_PATH)
+    months = source.index_files("1min", quicktest)
+    if cv_folds is None:
+        folds = walk_forward_folds(months, train_months, test_months, step, anchored)
+    else:
+        folds = cross_validation_folds(months, cv_folds)
+    if not folds:
+        raise ValueError(f"{len(months)} months are not enough for folds of {train_months} train and {test_months} test months.")
+    if quicktest:
+        experiment_name = f"Quicktest/{experiment_name}"
+
+    configs = grid(**space)
+    from data.shared_data import map_in_batches
+    # every config is evaluated month batch by month batch: in a pool only one batch is in shared memory
+    # at a time, and the configs evaluating a day share its condition evaluator (see 'ConditionEvaluator.for_day')
+    strategies = space.get("strategy", [eval_settings()["strategy"]])
+    timeframes = sorted({timeframe for strategy in strategies
+                         for timeframe in get_strategy_spec(expand_params({"strategy": strategy})["strategy"]).timeframes})
+    function = functools.partial(config_month_results, quicktest=quicktest, checkpoint_path=checkpoint_path)
+    month_results = [[] for _ in configs]
+    with contextlib.ExitStack() as stack:
+        pool = None
+        if processes is not None:
+            import multiprocessing
+            pool = stack.enter_context(multiprocessing.get_context("spawn").Pool(processes))
+        for position, results in map_in_batches(pool, function, [(params, months) for params in configs], source, timeframes,
+                                                quicktest, space.get("underlying", [eval_config.UNDERLYING]), batch_months):
+            month_results[position] += results
+    evaluated = [(params, sorted(results, key=lambda month: month[0])) for params, results in zip(configs, month_results)]
+    config_results = {config_name(params): (params, month_results) for params, month_results in evaluated}
+
+    fold_results = evaluate_folds(config_results, folds, metric)
+    table = pd.DataFrame([{"fold": fold["fold"], "train": f"{fold['train'][0]} - {fold['train'][-1]}",
+                           "test": f"{fold['test'][0]} - {fold['test'][-1]}", "config": fold["config"],
+                           f"train/{metric}": fold["train_metrics"].get(metric), metric: fold["test_metrics"].get(metric)}
+                          for fold in fold_results])
+
+    with MLflowLogger(offline=offline) as logger, logger.start_run(experiment_name, run_name=run_name) as parent_run:
+        parent_run.log_params({"walk_forward/FOLDS": len(folds), "walk_forward/TRAIN_MONTHS": train_months,
+                               "walk_forward/TEST_MONTHS": test_months, "walk_forward/ANCHORED": anchored,
+                               "walk_forward/CV_FOLDS": cv_folds, "walk_forward/METRIC": metric,
+                               "walk_forward/SPACE": json.dumps(space)})
+        for fold in fold_results:
+            with parent_run.child_run(run_name=f"Fold {fold['fold']}: {fold['test'][0]} - {fold['test'][-1]}") as run:
+                log_eval_params(run, eval_settings(**expand_params(fold["params"])))
+                run.log_params({"walk_forward/CONFIG": fold["config"], "walk_forward/TRAIN_START": fold["train"][0],
+                                "walk_forward/TRAIN_END": fold["train"][-1], "walk_forward/TEST_START": fold["test"][0],
+                                "walk_forward/TEST_END": fold["test"][-1]})
+                # metrics are missing e.g. for folds without trades
+                run.log_metrics(logged_metrics({f"train/{metric}": fold["train_metrics"].get(metric), **fold["test_metrics"]}))
+
+        # the test months of all folds, each evaluated with the config of its fold (the test folds do not overlap)
+        metrics, df_results_per_month = summarize_months([month for fold in fold_results for month in fold["test_results"]])
+        parent_run.log_metrics(logged_metrics(metrics))
+        parent_run.log_table(data=df_results_per_month, artifact_file="monthly_stats.json")
+        parent_run.log_table(data=table, artifact_file="folds.json")
+
+    print(table)
+    print(f"Out-of-sample {metric}: {metrics.get(metric)}")
+    return table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Walk-forward and cross-validation evaluation of a parameter grid.")
+    parser.add_argument("experiment")
+    parser.add_argument("--space", required=True, help='json, parameter -> list of values, e.g. {"stop_loss": [1, 2]}')
+    parser.add_argument("--train-months", type=int, default=12)
+    parser.add_argument("--test-months", type=int, default=1)
+    parser.add_argument("--step", type=int)
+    parser.add_argument("--anchored", action="store_true", help="expanding train window from the first month")
+    parser.add_argument("--cv", type=int, metavar="K", help="k contiguous cross-validation folds instead")
+    parser.add_argument("--metric", default=METRIC)
+    parser.add_argument("--quicktest", action="store_true")
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--checkpoints", default=CHECKPOINT_PATH, metavar="PATH")
+    parser.add_argument("--offline", action="store_true")
+    parser.add_argument("--batch-months", type=int, default=1, help="months in shared memory at a time (with --processes)")
+    args = parser.parse_args()
+    run_walk_forward(args.experiment, json.loads(args.space), train_months=args.train_months, test_months=args.test_months,
+                     step=args.step, anchored=args.anchored, cv_folds=args.cv, metric=args.metric, quicktest=args.quicktest,
+                     processes=args.processes, checkpoint_path=args.checkpoints, offline=args.offline,
+                     batch_months=args.batch_months)
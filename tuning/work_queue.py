@@ -0,0 +1,144 @@
+# Durable task queue in a SQLite file, shared by the coordinator and the workers of a sweep
+import os
+import json
+import time
+import socket
+import sqlite3
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def default_worker_name():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class WorkQueue:
+    """
+    Queue of evaluation tasks in a SQLite database. Every process (coordinator or worker, on any host that
+    mounts the file) opens its own connection, SQLite's file locks make claiming a task atomic.
+
+    A worker claims a task with a lease of 'lease_seconds' and renews it with 'heartbeat' while the task
+    runs. If the worker dies, the lease expires and the task is handed to the next worker, up to
+    'max_attempts' times in total. Tasks that raise are retried in the same way.
+
+    The database uses the default rollback journal instead of WAL, which does not work on network file
+    systems.
+
+    Params:
+        path: path of the database file, created if it does not exist
+    """
+    def __init__(self, path, lease_seconds=600, max_attempts=3, timeout=60):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # autocommit mode, transactions are started explicitly
+        self.connection = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS sweeps (
+                name TEXT PRIMARY KEY, experiment TEXT, parent_run_id TEXT, settings TEXT, created REAL
+            )""")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY, sweep TEXT, name TEXT, params TEXT, status TEXT, attempts INTEGER,
+                worker TEXT, lease_until REAL, result TEXT, error TEXT, updated REAL
+            )""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, lease_until)")
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def add_sweep(self, name, tasks, experiment=None, parent_run_id=None, settings=None):
+        """
+        Adds a sweep and its tasks.
+
+        Params:
+            tasks: list of (task name, params dictionary)
+            settings: dictionary of settings shared by all tasks of the sweep (e.g. quicktest)
+        """
+        now = time.time()
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            self.connection.execute("INSERT INTO sweeps VALUES (?, ?, ?, ?, ?)",
+                                    (name, experiment, parent_run_id, json.dumps(settings or {}), now))
+            self.connection.executemany(
+                "INSERT INTO tasks (sweep, name, params, status, attempts, updated) VALUES (?, ?, ?, ?, 0, ?)",
+                [(name, task_name, json.dumps(params), PENDING, now) for task_name, params in tasks])
+
+    def sweep(self, name):
+        """Returns the sweep as a dictionary, or None if it does not exist."""
+        row = self.connection.execute("SELECT name, experiment, parent_run_id, settings FROM sweeps WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return None
+        return {"name": row[0], "experiment": row[1], "parent_run_id": row[2], "settings": json.loads(row[3])}
+
+    def claim(self, worker=None, sweep=None):
+        """
+        Claims the next pending task, or a running task whose lease expired.
+
+        Returns:
+            Task dictionary ('id', 'sweep', 'name', 'params', 'attempts'), or None if no task is available
+        """
+        worker = worker or default_worker_name()
+        now = time.time()
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            # tasks of dead workers that used up their attempts are failed
+            self.connection.execute("UPDATE tasks SET status = ?, error = ?, updated = ? WHERE status = ? AND lease_until < ? AND attempts >= ?",
+                                    (FAILED, "lease expired", now, RUNNING, now, self.max_attempts))
+            query = "SELECT id, sweep, name, params, attempts FROM tasks WHERE (status = ? OR (status = ? AND lease_until < ?))"
+            params = [PENDING, RUNNING, now]
+            if sweep is not None:
+                query += " AND sweep = ?"
+                params.append(sweep)
+            row = self.connection.execute(query + " ORDER BY id LIMIT 1", params).fetchone()
+            if row is None:
+                return None
+            self.connection.execute("UPDATE tasks SET status = ?, worker = ?, lease_until = ?, attempts = attempts + 1, updated = ? WHERE id = ?",
+                                    (RUNNING, worker, now + self.lease_seconds, now, row[0]))
+        return {"id": row[0], "sweep": row[1], "name": row[2], "params": json.loads(row[3]), "attempts": row[4] + 1, "worker": worker}
+
+    def heartbeat(self, task):
+        """
+        Renews the lease of a claimed task. Returns False if the task was handed to another worker.
+        """
+        now = time.time()
+        with self.connection:
+            cursor = self.connection.execute("UPDATE tasks SET lease_until = ?, updated = ? WHERE id = ? AND worker = ? AND status = ?",
+                                             (now + self.lease_seconds, now, task["id"], task["worker"], RUNNING))
+        return cursor.rowcount == 1
+
+    def complete(self, task, result):
+        """Stores the result (json serializable) of a claimed task."""
+        with self.connection:
+            self.connection.execute("UPDATE tasks SET status = ?, result = ?, error = NULL, updated = ? WHERE id = ? AND worker = ?",
+                                    (DONE, json.dumps(result), time.time(), task["id"], task["worker"]))
+
+    def fail(self, task, error):
+        """Returns a claimed task to the queue, or marks it as failed after 'max_attempts' attempts."""
+        status = FAILED if task["attempts"] >= self.max_attempts else PENDING
+        with self.connection:
+            self.connection.execute("UPDATE tasks SET status = ?, error = ?, lease_until = NULL, updated = ? WHERE id = ? AND worker = ?",
+                                    (status, str(error), time.time(), task["id"], task["worker"]))
+
+    def status(self, sweep):
+        """Returns the number of tasks per status of a sweep."""
+        counts = dict(self.connection.execute("SELECT status, COUNT(*) FROM tasks WHERE sweep = ? GROUP BY status", (sweep,)).fetchall())
+        return {status: counts.get(status, 0) for status in (PENDING, RUNNING, DONE, FAILED)}
+
+    def tasks(self, sweep):
+        """Returns all tasks of a sweep with their status, result and error."""
+        rows = self.connection.execute("SELECT id, name, params, status, attempts, worker, result, error FROM tasks WHERE sweep = ? ORDER BY id",
+                                       (sweep,)).fetchall()
+        return [{"id": row[0], "name": row[1], "params": json.loads(row[2]), "status": row[3], "attempts": row[4], "worker": row[5],
+                 "result": None if row[6] is None else json.loads(row[6]), "error": row[7]} for row in rows]
@@ -0,0 +1,239 @@
+# Implied volatility and greeks of a whole 0dte option chain, per minute
+import numpy as np
+import pandas as pd
+from datetime import datetime, time
+from collections import OrderedDict
+from utils.options_helper import to_utc_ns
+from utils.chain_snapshot import zero_dte_contracts, asof_price_matrix
+
+MINUTES_PER_YEAR = 365 * 24 * 60
+MIN_VOLATILITY = 1e-4
+MAX_VOLATILITY = 5.0
+
+
+def norm_cdf(x):
+    """
+    Standard normal cdf for numpy arrays, via the complementary error function approximation from
+    'Numerical Recipes' (relative error < 1.2e-7, also in the tails).
+    """
+    z = np.abs(x) / np.sqrt(2)
+    t = 1 / (1 + 0.5 * z)
+    erfc = t * np.exp(-z * z - 1.26551223 + t * (1.00002368 + t * (0.37409196 + t * (0.09678418 +
+           t * (-0.18628806 + t * (0.27886807 + t * (-1.13520398 + t * (1.48851587 +
+           t * (-0.82215223 + t * 0.17087277)))))))))
+    return np.where(x >= 0, 1 - 0.5 * erfc, 0.5 * erfc)
+
+
+def norm_pdf(x):
+    return np.exp(-0.5 * x * x) / np.sqrt(2 * np.pi)
+
+
+def black_scholes_price(spot, strike, t, sigma, is_call, rate=0.0):
+    """Black-Scholes price of european options. All arguments are numpy arrays (or scalars) of the same shape."""
+    sqrt_t = np.sqrt(t)
+    d1 = (np.log(spot / strike) + (rate + 0.5 * sigma ** 2) * t) / (sigma * sqrt_t)
+    d2 = d1 - sigma * sqrt_t
+    discount = np.exp(-rate * t)
+    call = spot * norm_cdf(d1) - strike * discount * norm_cdf(d2)
+    put = strike * discount * norm_cdf(-d2) - spot * norm_cdf(-d1)
+    return np.where(is_call, call, put)
+
+
+def implied_volatility(price, spot, strike, t, is_call, rate=0.0, newton_steps=8, bisection_steps=50, tolerance=1e-6):
+    """
+    Vectorized implied volatility. Runs a few Newton steps for all options at once and solves the
+    options that did not converge (low vega, far out of the money) with a bracketed bisection on
+    [MIN_VOLATILITY, MAX_VOLATILITY].
+
+    Returns:
+        Array of implied volatilities, NaN where the price lies outside the no-arbitrage bounds or
+        the time value is too small to determine a volatility.
+    """
+    price, spot, strike, t, is_call = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (price, spot, strike, t, is_call)))
+    is_call = is_call.astype(bool)
+    discount = np.exp(-rate * t)
+
+    # in the money options are solved as their out of the money counterpart (put-call parity), their
+    # small time value is far better conditioned than the full price
+    itm_call = is_call & (strike * discount < spot)
+    itm_put = ~is_call & (strike * discount > spot)
+    price = np.where(itm_call, price - (spot - strike * discount), price)
+    price = np.where(itm_put, price - (strike * discount - spot), price)
+    is_call = np.where(itm_call | itm_put, ~is_call, is_call)
+
+    # prices below the intrinsic value or above the upper bound have no implied volatility
+    lower = np.where(is_call, np.maximum(spot - strike * discount, 0), np.maximum(strike * discount - spot, 0))
+    upper = np.where(is_call, spot, strike * discount)
+    valid = np.isfinite(price) & np.isfinite(spot) & (t > 0) & (price - lower > tolerance) & (price < upper)
+
+    sigma = np.full(price.shape, 0.3)
+    converged = ~valid
+
+    # 1. newton steps
+    for _ in range(newton_steps):
+        sqrt_t = np.sqrt(t)
+        d1 = (np.log(spot / strike) + (rate + 0.5 * sigma ** 2) * t) / (sigma * sqrt_t)
+        vega = spot * norm_pdf(d1) * sqrt_t
+        diff = black_scholes_price(spot, strike, t, sigma, is_call, rate) - price
+
+        converged |= np.abs(diff) < tolerance * price
+        step = np.where(converged | (vega < 1e-8), 0.0, diff / np.where(vega < 1e-8, 1.0, vega))
+        sigma = np.clip(sigma - step, MIN_VOLATILITY, MAX_VOLATILITY)
+
+    # 2. bisection for the rest, the price is monotonic increasing in sigma
+    todo = ~converged
+    if todo.any():
+        low = np.full(todo.sum(), MIN_VOLATILITY)
+        high = np.full(todo.sum(), MAX_VOLATILITY)
+        args = (spot[todo], strike[todo], t[todo])
+        for _ in range(bisection_steps):
+            mid = 0.5 * (low + high)
+            too_high = black_scholes_price(*args, mid, is_call[todo], rate) > price[todo]
+            high = np.where(too_high, mid, high)
+            low = np.where(too_high, low, mid)
+        sigma[todo] = 0.5 * (low + high)
+
+    return np.where(valid, sigma, np.nan)
+
+
+def greeks(spot, strike, t, sigma, is_call, rate=0.0):
+    """
+    Returns delta, gamma and theta (per calendar day) as arrays.
+    """
+    sqrt_t = np.sqrt(t)
+    d1 = (np.log(spot / strike) + (rate + 0.5 * sigma ** 2) * t) / (sigma * sqrt_t)
+    d2 = d1 - sigma * sqrt_t
+    pdf = norm_pdf(d1)
+    discount = np.exp(-rate * t)
+
+    delta = np.where(is_call, norm_cdf(d1), norm_cdf(d1) - 1)
+    gamma = pdf / (spot * sigma * sqrt_t)
+    decay = -spot * pdf * sigma / (2 * sqrt_t)
+    theta = np.where(is_call,
+                     decay - rate * strike * discount * norm_cdf(d2),
+                     decay + rate * strike * discount * norm_cdf(-d2)) / 365
+    return delta, gamma, theta
+
+
+def data_key(df):
+    """Identifies the content of a dataframe, for cache keys."""
+    return len(df), tuple(df.columns), int(pd.util.hash_pandas_object(df, index=False).sum())
+
+
+class ChainAnalytics:
+    """
+    Implied volatility, delta, gamma and theta of every contract of a day's 0dte chain at every minute
+    of the index series, stored as (minutes x contracts) arrays. Option prices are taken as-of: the
+    last close of a contract at or before the minute.
+
+    Strike prices are derived from the contract keys in the scale of the data (see 'UNDERLYING_PRICE_SCALE'),
+    which is the scale of the index data. Since Black-Scholes prices
+    scale linearly with spot and strike, the implied volatilities do not depend on that scale.
+
+    Results of the last 'cache_size' days (and rates) are cached, use 'ChainAnalytics.for_day' to get them.
+    """
+    cache_size = 8
+    _cache = OrderedDict()  # (date, underlying, rate, data keys) -> analytics, least recently used first
+
+    def __init__(self, date, options_df, index_df, rate=0.0):
+        self.date = date
+
+        # 1. 0dte contracts of the day, decoded from the contract keys
+        options_df, parts = zero_dte_contracts(date, options_df)
+
+        contracts = pd.DataFrame({
+            "ticker": options_df["ticker"].to_numpy(),
+            "is_call": parts["is_call"].to_numpy(),
+            "strike": parts["strike"].to_numpy()
+        }).drop_duplicates("ticker").sort_values(["is_call", "strike"]).reset_index(drop=True)
+        self.tickers = contracts["ticker"].to_numpy()
+        self.is_call = contracts["is_call"].to_numpy()
+        self.strikes = contracts["strike"].to_numpy()
+
+        # 2. minute grid of the index series and as-of option prices
+        self.minutes = to_utc_ns(index_df["Datetime"])
+        self.spot = index_df["Close"].to_numpy(dtype=float)
+        self.prices = asof_price_matrix(options_df, self.tickers, self.minutes)
+
+        # 3. time to expiry (market close in New York) in years
+        close = pd.Timestamp(datetime.combine(date, time(16, 0)), tz="America/New_York").value
+        minutes_left = np.maximum((close - self.minutes) / 60e9, 1.0)
+        t = (minutes_left / MINUTES_PER_YEAR)[:, None]
+
+        # 4. implied volatility and greeks for all minutes and contracts at once
+        spot = self.spot[:, None]
+        self.iv = implied_volatility(self.prices, spot, self.strikes[None, :], t, self.is_call[None, :], rate)
+        self.delta, self.gamma, self.theta = greeks(spot, self.strikes[None, :], t, self.iv, self.is_call[None, :], rate)
+
+        # 5. per minute and right, contracts sorted by delta for O(log n) lookups
+        self._by_delta = {}
+        for is_call in (True, False):
+            columns = np.flatnonzero(self.is_call == is_call)
+            deltas = self.delta[:, columns]
+            order = np.argsort(deltas, axis=1)  # NaN values are sorted to the end
+            self._by_delta[is_call] = (columns[order], np.take_along_axis(deltas, order, axis=1),
+                                       np.isfinite(deltas).sum(axis=1))
+
+    @classmethod
+    def for_day(cls, date, options_df, index_df, underlying="SPY", rate=0.0):
+        """
+        Returns the (cached) analytics of a day. The cache key includes the content of the data, so other
+        data of the same date (e.g. another time window) gets its own analytics.
+        """
+        key = (date, underlying, rate, data_key(options_df), data_key(index_df))
+        if key in cls._cache:
+            cls._cache.move_to_end(key)
+        else:
+            cls._cache[key] = cls(date, options_df, index_df, rate=rate)
+            while len(cls._cache) > cls.cache_size:
+                cls._cache.popitem(last=False)
+        return cls._cache[key]
+
+    @classmethod
+    def clear_cache(cls):
+        cls._cache = OrderedDict()
+
+    def minute_index(self, timestamp):
+        """Position of the last minute at or before timestamp, -1 if the timestamp lies before the first minute."""
+        return int(np.searchsorted(self.minutes, to_utc_ns(pd.Series([timestamp]))[0], side="right") - 1)
+
+    def contract(self, minute, column):
+        return {
+            "ticker": self.tickers[column],
+            "strike": self.strikes[column],
+            "is_call": bool(self.is_call[column]),
+            "price": self.prices[minute, column],
+            "iv": self.iv[minute, column],
+            "delta": self.delta[minute, column],
+            "gamma": self.gamma[minute, column],
+            "theta": self.theta[minute, column]
+        }
+
+    def find_by_delta(self, timestamp, option_type, target_delta):
+        """
+        Finds the contract whose delta is closest to target_delta at the given time, e.g.
+        find_by_delta(ts, "P", -0.20) for the 0.20 delta put. O(log n) per lookup.
+
+        Params:
+            timestamp: time of the lookup, the last minute at or before it is used
+            option_type: 'C' or 'P' (or 'Bear Call' / 'Bull Put')
+            target_delta: delta of the contract, negative for puts
+
+        Returns:
+            Dictionary with ticker, strike, price, iv and greeks, or None if no delta is available (also
+            before the first minute).
+        """
+        is_call = option_type in ("C", "Bear Call")
+        minute = self.minute_index(timestamp)
+        if minute < 0:
+            return None
+        columns, deltas, valid = self._by_delta[is_call]
+        count = valid[minute]
+        if count == 0:
+            return None
+
+        row = deltas[minute, :count]
+        position = np.searchsorted(row, target_delta)
+        candidates = [p for p in (position - 1, position) if 0 <= p < count]
+        best = min(candidates, key=lambda p: abs(row[p] - target_delta))
+        return self.contract(minute, columns[minute, best])
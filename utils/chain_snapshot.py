@@ -0,0 +1,149 @@
+# Point-in-time view of a day's option chain for strike selection
+import numpy as np
+import pandas as pd
+from utils.options_helper import to_utc_ns, UNDERLYING_PRICE_SCALE
+from utils.contract_codec import encode_tickers, decode_contracts
+
+
+def zero_dte_contracts(date, options_df):
+    """
+    Selects the rows of the contracts that expire on date. The contracts are taken from the 'contract'
+    column (or encoded from the tickers, see utils/contract_codec.py).
+
+    Returns:
+        (rows of options_df, DataFrame with 'is_call' and 'strike' (in the scale of the data, see
+        'UNDERLYING_PRICE_SCALE') per row)
+    """
+    keys = options_df["contract"].to_numpy() if "contract" in options_df else encode_tickers(options_df["ticker"])
+    fields = decode_contracts(keys)
+    is_0dte = (fields["expiry"] == np.datetime64(date, "D")).to_numpy()
+    fields = fields[is_0dte].reset_index(drop=True)
+    scale = fields["root"].map(UNDERLYING_PRICE_SCALE).fillna(1)
+    return options_df[is_0dte], pd.DataFrame({"is_call": fields["is_call"], "strike": fields["strike_cents"] / 100 * scale})
+
+
+def asof_price_matrix(options_df, tickers, minutes, column="Close"):
+    """
+    Builds a (minutes x tickers) matrix with the last known price of every ticker at or before each
+    minute (forward filled, NaN before the first bar of a ticker).
+
+    Params:
+        options_df: options data with 'ticker', 'Datetime' and the price column
+        tickers: column order of the matrix
+        minutes: int64 UTC nanoseconds of the rows, sorted
+    """
+    prices = pd.DataFrame({
+        "minute": to_utc_ns(options_df["Datetime"]),
+        "ticker": options_df["ticker"].to_numpy(),
+        "price": options_df[column].to_numpy(dtype=float)
+    }).pivot_table(index="minute", columns="ticker", values="price", aggfunc="last")
+    prices = prices.reindex(columns=tickers)
+    prices = prices.reindex(prices.index.union(minutes)).ffill().reindex(minutes)
+    return prices.to_numpy()
+
+
+class ChainSnapshot:
+    """
+    Index over a day's 0dte option chain that answers "what did the chain look like at minute t"
+    without scanning the options data. For every minute and right ('C' / 'P') it holds the sorted
+    listed strikes and their last known close price (as-of, forward filled). Lookups by strike,
+    by target price and nearest to the index price take O(log n).
+
+    Params:
+        date: trading day, only contracts expiring on this day are used
+        options_df: options data of the day, as returned by 'load_options_from_file'
+        minutes: optional sorted minute grid (int64 UTC ns). Defaults to all minutes of options_df.
+    """
+    def __init__(self, date, options_df, minutes=None):
+        options_df, contracts = zero_dte_contracts(date, options_df)
+
+        if minutes is None:
+            minutes = np.unique(to_utc_ns(options_df["Datetime"]))
+        self.minutes = np.asarray(minutes)
+
+        self.strikes = {}
+        self.tickers = {}
+        self.prices = {}
+        self._price_order = {}
+        for right in ("C", "P"):
+            of_right = (contracts["is_call"] == (right == "C")).to_numpy()
+            listed = pd.DataFrame({
+                "ticker": options_df["ticker"].to_numpy()[of_right],
+                "strike": contracts["strike"].to_numpy()[of_right]
+            }).drop_duplicates("ticker").sort_values("strike")
+
+            self.strikes[right] = listed["strike"].to_numpy()
+            self.tickers[right] = listed["ticker"].to_numpy()
+            prices = asof_price_matrix(options_df, self.tickers[right], self.minutes)
+            self.prices[right] = prices
+
+            # per minute, strikes ordered by price (NaN last), for lookups by target price
+            order = np.argsort(prices, axis=1)
+            self._price_order[right] = (order, np.take_along_axis(prices, order, axis=1), np.isfinite(prices).sum(axis=1))
+
+    def minute_index(self, timestamp):
+        """Position of the last minute at or before timestamp, -1 if the timestamp lies before the first minute."""
+        return int(np.searchsorted(self.minutes, to_utc_ns(pd.Series([timestamp]))[0], side="right") - 1)
+
+    def price(self, timestamp, right, strike):
+        """
+        Returns the last known price of the contract at the timestamp, or NaN if the strike is not
+        listed or has no bar yet.
+        """
+        minute = self.minute_index(timestamp)
+        strikes = self.strikes[right]
+        position = np.searchsorted(strikes, strike)
+        if minute < 0 or position >= len(strikes) or strikes[position] != strike:
+            return np.nan
+        return self.prices[right][minute, position]
+
+    def by_target_price(self, timestamp, right, target_price):
+        """
+        Finds the contract with a price closest to target_price at the timestamp, e.g. the put that
+        can be sold for about 1.00.
+
+        Returns:
+            (strike, price) or None if no contract has a price at that time.
+        """
+        minute = self.minute_index(timestamp)
+        if minute < 0:
+            return None
+        order, sorted_prices, valid = self._price_order[right]
+        count = valid[minute]
+        if count == 0:
+            return None
+
+        row = sorted_prices[minute, :count]
+        position = np.searchsorted(row, target_price)
+        candidates = [p for p in (position - 1, position) if 0 <= p < count]
+        best = min(candidates, key=lambda p: abs(row[p] - target_price))
+        column = order[minute, best]
+        return self.strikes[right][column], self.prices[right][minute, column]
+
+    def nearest_strike(self, timestamp, right, price):
+        """
+        Finds the listed strike closest to price (e.g. the index price) that has a known option price
+        at the timestamp.
+
+        Returns:
+            (strike, price) or None if no strike is available.
+        """
+        minute = self.minute_index(timestamp)
+        strikes = self.strikes[right]
+        if minute < 0 or len(strikes) == 0:
+            return None
+
+        prices = self.prices[right][minute]
+        position = np.searchsorted(strikes, price)
+        left, right_ = position - 1, position
+        # walk outwards until strikes with known prices are found (usually zero or one step)
+        while left >= 0 and np.isnan(prices[left]):
+            left -= 1
+        while right_ < len(strikes) and np.isnan(prices[right_]):
+            right_ += 1
+
+        candidates = [p for p in (left, right_) if 0 <= p < len(strikes)]
+        if not candidates:
+            return None
+        best = min(candidates, key=lambda p: abs(strikes[p] - price))
+        return strikes[best], prices[best]
@@ -0,0 +1,132 @@
+# Packed integer keys for option contracts
+import numpy as np
+import pandas as pd
+
+"""
+Root symbols with a fixed id. The ids are part of the stored keys, so new roots are only appended.
+Tickers of roots that are not listed here get invalid keys (-1), 'contract_key' rejects them.
+"""
+ROOTS = ["SPY", "SPXW", "SPX", "QQQ", "IWM", "XSP", "NDX", "NDXP", "RUT", "RUTW"]
+ROOT_IDS = {root: i + 1 for i, root in enumerate(ROOTS)}
+
+"""
+Bit layout of a contract key (int64, always positive):
+    bits  0-31  strike price in cents (listed strike, OCC strike field / 10)
+    bit     32  1 for calls, 0 for puts
+    bits 33-50  expiration date as days since 1970-01-01
+    bits 51-62  root id (see ROOT_IDS)
+"""
+STRIKE_BITS = 32
+RIGHT_SHIFT = 32
+EXPIRY_SHIFT = 33
+EXPIRY_BITS = 18
+ROOT_SHIFT = 51
+ROOT_BITS = 12
+
+INVALID_KEY = -1
+
+TICKER_PATTERN = r"^O:([A-Z]+)(\d{6})([CP])(\d{8})$"
+
+
+def encode_contract(root_id, expiry_days, is_call, strike_cents):
+    """
+    Packs the contract fields into keys. Works for scalars and numpy arrays.
+    """
+    return ((np.asarray(root_id, dtype=np.int64) << ROOT_SHIFT)
+            | (np.asarray(expiry_days, dtype=np.int64) << EXPIRY_SHIFT)
+            | (np.asarray(is_call, dtype=np.int64) << RIGHT_SHIFT)
+            | np.asarray(strike_cents, dtype=np.int64))
+
+
+def expiry_to_days(yymmdd):
+    """
+    Converts yymmdd strings (years 2000-2099) to days since 1970-01-01, vectorized.
+    """
+    value = pd.Series(yymmdd).astype(np.int64).to_numpy()
+    year, month, day = 2000 + value // 10000, value // 100 % 100, value % 100
+    months = (year - 1970).astype("datetime64[Y]").astype("datetime64[M]") + (month - 1)
+    return (months.astype("datetime64[D]") + (day - 1)).astype(np.int64)
+
+
+def encode_tickers(tickers):
+    """
+    Parses OCC style tickers like 'O:SPY250307C00578000' into contract keys, vectorized over a
+    whole column. Every distinct ticker is parsed only once. Tickers that cannot be parsed or have
+    an unknown root get INVALID_KEY.
+
+    Params:
+        tickers: pandas Series or array of ticker strings
+
+    Returns:
+        numpy int64 array of contract keys
+    """
+    codes, uniques = pd.factorize(pd.Series(tickers))
+    parts = pd.Series(uniques).astype(str).str.extract(TICKER_PATTERN)
+    root_id = parts[0].map(ROOT_IDS)
+    valid = (root_id.notna() & parts[1].notna()).to_numpy()
+
+    unique_keys = np.full(len(parts), INVALID_KEY, dtype=np.int64)
+    if valid.any():
+        parts = parts[valid]
+        unique_keys[valid] = encode_contract(root_id[valid].to_numpy(dtype=np.int64),
+                                             expiry_to_days(parts[1]),
+                                             (parts[2] == "C").to_numpy(),
+                                             parts[3].astype(np.int64).to_numpy() // 10)
+
+    # missing tickers have code -1
+    return np.where(codes >= 0, unique_keys[codes], INVALID_KEY)
+
+
+def decode_contracts(keys):
+    """
+    Unpacks contract keys into their fields, vectorized.
+
+    Returns:
+        DataFrame with the columns 'root', 'expiry' (datetime64[D]), 'is_call' and 'strike_cents'.
+        Invalid keys produce a row with root None, expiry NaT and strike_cents -1.
+    """
+    keys = np.asarray(keys, dtype=np.int64)
+    valid = keys >= 0
+    root_id = np.where(valid, (keys >> ROOT_SHIFT) & ((1 << ROOT_BITS) - 1), 0)
+    roots = np.array([None] + ROOTS, dtype=object)
+    expiry = ((keys >> EXPIRY_SHIFT) & ((1 << EXPIRY_BITS) - 1)).astype("datetime64[D]")
+
+    return pd.DataFrame({
+        "root": roots[root_id],
+        "expiry": np.where(valid, expiry, np.datetime64("NaT")),
+        "is_call": valid & ((keys >> RIGHT_SHIFT) & 1).astype(bool),
+        "strike_cents": np.where(valid, keys & ((1 << STRIKE_BITS) - 1), -1)
+    })
+
+
+def format_tickers(keys):
+    """
+    Turns contract keys back into ticker strings, vectorized. Invalid keys give None.
+    """
+    fields = decode_contracts(keys)
+    expiry = fields["expiry"].dt.strftime("%y%m%d")
+    right = pd.Series(np.where(fields["is_call"], "C", "P"))
+    strike = (fields["strike_cents"] * 10).astype(str).str.zfill(8)
+    tickers = ("O:" + fields["root"].astype(str) + expiry + right + strike).to_numpy(dtype=object)
+    tickers[fields["root"].isna().to_numpy()] = None
+    return tickers
+
+
+def contract_key(date, option_type, strike_price, underlying="SPY", price_scale=1):
+    """
+    Returns the key of a single contract, the integer counterpart of 'get_option_ticker'. Raises a
+    ValueError for roots that are not listed in ROOTS, their contracts would all share INVALID_KEY.
+
+    Params:
+        date: expiration date
+        option_type: 'C' / 'Bear Call' or 'P' / 'Bull Put'
+        strike_price: strike price in the scale of the data
+        underlying: root symbol
+        price_scale: scale of the data for the underlying (see UNDERLYING_PRICE_SCALE)
+    """
+    if underlying not in ROOT_IDS:
+        raise ValueError(f"Unknown root '{underlying}', add it to ROOTS in utils/contract_codec.py.")
+    is_call = option_type in ("C", "Bear Call")
+    expiry_days = np.datetime64(pd.Timestamp(date).date(), "D").astype(np.int64)
+    strike_cents = round(strike_price / price_scale * 100)
+    return int(encode_contract(ROOT_IDS[underlying], expiry_days, is_call, strike_cents))
@@ -0,0 +1,223 @@
+# Buffered mlflow logging for evaluation runs
+import os
+import time
+import threading
+from pathlib import Path
+from mlflow import MlflowClient
+from mlflow.entities import Metric, Param
+
+# limits of a single 'log_batch' request, see mlflow docs
+MAX_PARAMS_PER_BATCH = 100
+MAX_METRICS_PER_BATCH = 1000
+
+
+class MLflowLogger:
+    """
+    Collects params, metrics and tables of one or more mlflow runs in memory and sends them to the
+    tracking store with mlflow's batch api from a background thread. Logging calls only append to
+    a buffer, so the evaluation code never waits for a round trip to the tracking server.
+
+    Runs are started with 'start_run' and can have nested child runs (e.g. one child per config
+    of a sweep). Worker processes can log into the same parent run by creating their own logger
+    and passing the parent's run id to 'start_run'.
+
+    If 'offline' is True, everything is written to a local file store in 'tracking_dir', so no
+    tracking server is needed. The runs can be viewed later with 'mlflow ui --backend-store-uri <dir>'.
+    """
+    def __init__(self, tracking_uri=None, offline=False, tracking_dir="mlruns", flush_interval=2.0):
+        if offline:
+            tracking_uri = Path(tracking_dir).resolve().as_uri()
+            # newer mlflow versions only use the file store when explicitly allowed
+            os.environ.setdefault("MLFLOW_ALLOW_FILE_STORE", "true")
+        self.client = MlflowClient(tracking_uri=tracking_uri)
+        self.flush_interval = flush_interval
+
+        self._lock = threading.Lock()
+        self._flushing = threading.Lock()  # flushes of the background thread and of 'flush' calls do not interleave
+        self._buffers = {}  # run id -> {"params": [], "metrics": [], "tables": []}
+        self._terminated = []  # (run id, status) of runs that are ended after their next flush
+        self._ended = set()  # run ids of ended runs, they take no more data
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._flush_loop, name="mlflow-logger", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def start_run(self, experiment_name, run_name=None, parent_run_id=None):
+        """
+        Creates a new run in the given experiment and returns a 'LoggedRun' handle for it.
+
+        Params:
+            experiment_name: name of the mlflow experiment, created if it does not exist yet
+            run_name: display name of the run
+            parent_run_id: optional id of a run, of which the new run becomes a child run
+        """
+        experiment = self.client.get_experiment_by_name(experiment_name)
+        if experiment is None:
+            experiment_id = self.client.create_experiment(experiment_name)
+        else:
+            experiment_id = experiment.experiment_id
+
+        tags = {}
+        if parent_run_id is not None:
+            tags["mlflow.parentRunId"] = parent_run_id
+        run = self.client.create_run(experiment_id, run_name=run_name, tags=tags)
+
+        with self._lock:
+            self._buffers[run.info.run_id] = {"params": [], "metrics": [], "tables": []}
+        return LoggedRun(self, run.info.run_id, experiment_name)
+
+    def resume_run(self, run_id, experiment_name):
+        """
+        Returns a 'LoggedRun' handle for an existing run, e.g. a parent run that was started by another
+        process. Child runs started from the handle are logged by this logger.
+        """
+        with self._lock:
+            self._buffers.setdefault(run_id, {"params": [], "metrics": [], "tables": []})
+        return LoggedRun(self, run_id, experiment_name)
+
+    def flush(self, raise_errors=False):
+        """
+        Sends all buffered data to the tracking store. Blocks until done. Data that could not be sent is
+        put back into the buffers and sent with the next flush, the runs are only terminated once all
+        their data is sent.
+
+        Params:
+            raise_errors: If True, a RuntimeError is raised if some data could not be sent.
+        """
+        with self._flushing:
+            with self._lock:
+                buffers = self._buffers
+                self._buffers = {run_id: {"params": [], "metrics": [], "tables": []} for run_id in buffers}
+                terminated = self._terminated
+                self._terminated = []
+
+            failed = {}
+            for run_id, buffer in buffers.items():
+                try:
+                    self._send(run_id, buffer)
+                except Exception as e:
+                    print(f"Failed to log to mlflow run {run_id}: {e}")
+                    failed[run_id] = e
+                    # the unsent data goes before the data that was logged in the meantime
+                    with self._lock:
+                        pending = self._buffers.setdefault(run_id, {"params": [], "metrics": [], "tables": []})
+                        for kind, items in buffer.items():
+                            pending[kind][:0] = items
+
+            for run_id, status in terminated:
+                if run_id in failed:
+                    with self._lock:
+                        self._terminated.append((run_id, status))
+                    continue
+                try:
+                    self.client.set_terminated(run_id, status=status)
+                except Exception as e:
+                    print(f"Failed to end mlflow run {run_id}: {e}")
+                    failed[run_id] = e
+                # ended runs take no more data, so their buffer is empty
+                with self._lock:
+                    self._buffers.pop(run_id, None)
+
+        if raise_errors and failed:
+            raise RuntimeError(f"Failed to log to mlflow runs {sorted(failed)}") from next(iter(failed.values()))
+
+    def close(self):
+        """
+        Stops the background thread and flushes the remaining data. Raises a RuntimeError if some data
+        could not be sent.
+        """
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        self.flush(raise_errors=True)
+
+    def _buffer(self, run_id, kind, item):
+        with self._lock:
+            if run_id in self._ended:
+                raise RuntimeError(f"mlflow run {run_id} has ended, it takes no more data.")
+            self._buffers[run_id][kind].append(item)
+
+    def _end_run(self, run_id, status):
+        with self._lock:
+            if run_id in self._ended:
+                return
+            self._ended.add(run_id)
+            self._terminated.append((run_id, status))
+        self._wake.set()
+
+    def _send(self, run_id, buffer):
+        # sent items are removed from the buffer, so after a failure it holds the data that is left.
+        # params of a run are immutable in mlflow, so only the last value of each key is kept
+        buffer["params"] = list({param.key: param for param in buffer["params"]}.values())
+
+        while buffer["params"]:
+            self.client.log_batch(run_id, params=buffer["params"][:MAX_PARAMS_PER_BATCH])
+            del buffer["params"][:MAX_PARAMS_PER_BATCH]
+        while buffer["metrics"]:
+            self.client.log_batch(run_id, metrics=buffer["metrics"][:MAX_METRICS_PER_BATCH])
+            del buffer["metrics"][:MAX_METRICS_PER_BATCH]
+        while buffer["tables"]:
+            data, artifact_file = buffer["tables"][0]
+            self.client.log_table(run_id, data=data, artifact_file=artifact_file)
+            del buffer["tables"][0]
+
+    def _flush_loop(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+
+class LoggedRun:
+    """
+    Handle for a single run of a 'MLflowLogger'. Mirrors the parts of the 'mlflow' module api that
+    are used by the evaluation functions (log_param, log_metric, log_table).
+    """
+    def __init__(self, logger, run_id, experiment_name):
+        self.logger = logger
+        self.run_id = run_id
+        self.experiment_name = experiment_name
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end("FAILED" if exc_type is not None else "FINISHED")
+
+    def log_param(self, key, value):
+        self.logger._buffer(self.run_id, "params", Param(key, str(value)))
+
+    def log_params(self, params):
+        for key, value in params.items():
+            self.log_param(key, value)
+
+    def log_metric(self, key, value, step=0):
+        timestamp = int(time.time() * 1000)
+        self.logger._buffer(self.run_id, "metrics", Metric(key, float(value), timestamp, step))
+
+    def log_metrics(self, metrics, step=0):
+        for key, value in metrics.items():
+            self.log_metric(key, value, step=step)
+
+    def log_table(self, data, artifact_file):
+        # copy, so that later changes to the dataframe do not end up in the logged table
+        self.logger._buffer(self.run_id, "tables", (data.copy(), artifact_file))
+
+    def child_run(self, run_name=None):
+        """
+        Starts a nested run with this run as parent.
+        """
+        return self.logger.start_run(self.experiment_name, run_name=run_name, parent_run_id=self.run_id)
+
+    def end(self, status="FINISHED"):
+        """
+        Marks the run as ended. The run is terminated in the tracking store after its buffered
+        data has been flushed. Logging to an ended run raises a RuntimeError.
+        """
+        self.logger._end_run(self.run_id, status)
@@ -1,31 +1,93 @@
+import os
 import pandas as pd
 from pathlib import Path
-from polygon import RESTClient
+from functools import lru_cache
 from datetime import datetime, timedelta
+from utils.contract_codec import INVALID_KEY, contract_key
+
+"""Directory of the preprocessed options flat files (see data/polygon/polygon_options_preprocessing.py)."""
+OPTIONS_DIR = "dev/data/polygon/options_flat_files"
+
+"""
+Factor between the prices of an underlying's options in the data files and their real prices. SPY data is
+scaled by 10 to match the SPX index data, so strike prices passed around in the pipeline are 10x the listed
+SPY strikes. Underlyings that are not listed here are not scaled.
+"""
+UNDERLYING_PRICE_SCALE = {
+    "SPY": 10,
+    "SPXW": 1,
+    "QQQ": 1
+}
+
+"""Factor of the prices in the combined day files of the old pipeline, which scaled every root by 10."""
+LEGACY_PRICE_SCALE = 10
+
+
+def rescale_legacy_prices(df, underlying):
+    """Converts the prices of rows of an underlying from a legacy combined day file to UNDERLYING_PRICE_SCALE."""
+    df = df.copy()
+    df[["Open", "High", "Low", "Close"]] *= UNDERLYING_PRICE_SCALE.get(underlying, 1) / LEGACY_PRICE_SCALE
+    return df
+
 
-def load_options_from_file(date):
+def get_options_file_path(date, underlying=None, options_dir=OPTIONS_DIR):
     """
-    Loads the csv file for a given date that contains all options data from that date.
-    Filters for SPY and returns the filtered dataframe.
-    If the file does not exist, returns None.
+    Returns the path of the options file of a day. With an underlying, the path of that underlying's
+    partition ('<month>/<underlying>/<date>.csv'), otherwise the path of the combined day file.
     """
     month_string = date.strftime("%Y-%m")
     date_string = date.strftime("%Y-%m-%d")
-    filename = f"dev/data/polygon/options_flat_files/{month_string}/{date_string}.csv"
-    filepath = Path(filename)
+    if underlying is None:
+        return Path(options_dir) / month_string / f"{date_string}.csv"
+    return Path(options_dir) / month_string / underlying / f"{date_string}.csv"
 
-    if not filepath.exists():
-        print("Path does not exist: ", filename)
-        return None 
 
-    df = pd.read_csv(filename)
-    df = df[df["ticker"].str.contains("SPY", na=False)]
-    df['Datetime'] = pd.to_datetime(df['Datetime'] / 1e9, unit='s')
+def get_option_roots(tickers):
+    """
+    Returns the root symbol of option tickers as a series, e.g. 'SPXW' for 'O:SPXW250307C05780000'.
+    """
+    return tickers.str.extract(r"^O:([A-Z]+)\d", expand=False)
 
-    return df
+
+def load_options_for_underlyings(date, underlyings):
+    """
+    Loads the options data of several underlyings for a given date from the configured data source
+    (see data/sources.py). With csv files, partition files of an underlying are read directly.
+    Underlyings without a partition are split off the combined day file, which is then read only once
+    for all of them.
+    The tickers are parsed once into the integer 'contract' column (see utils/contract_codec.py), which
+    is used for all later lookups of single contracts.
+
+    Returns:
+        Dictionary, underlying -> DataFrame (None if no data is available for that underlying)
+    """
+    from data.sources import get_data_source  # imported here, data.sources depends on this module
+    return get_data_source().load_options(date, underlyings)
+
+
+def load_options_from_file(date, underlying="SPY"):
+    """
+    Loads the csv file for a given date that contains all options data from that date.
+    Returns the data of the given underlying (e.g. 'SPY', 'SPXW', 'QQQ'). Reads the underlying's
+    partition file if the day has been split by 'polygon_options_preprocessing.py', otherwise
+    filters the combined day file.
+    If the file does not exist, returns None.
+    """
+    return load_options_for_underlyings(date, [underlying])[underlying]
+
+
+def index_contracts(df):
+    """
+    Returns a dictionary, contract key -> row positions of that contract in df. Built once per day,
+    it turns every later contract lookup into a hash probe instead of a scan over all rows. Rows with
+    INVALID_KEY (unparsable tickers, unknown roots) are not indexed, they are not one contract.
+    """
+    indices = df.groupby("contract", sort=False).indices
+    indices.pop(INVALID_KEY, None)
+    return indices
 
 
-def get_option(df, ticker, start_time="00:00", end_time="23:59"):
+def get_option(df, ticker, start_time="00:00", end_time="23:59", contract_rows=None):
     """
     Given a Dataframe that represents option data of one day, 'get_option' filters the 
     df for a specific option. The 'start_time' and 'end_time' parameters allow for the
@@ -33,14 +95,21 @@ def get_option(df, ticker, start_time="00:00", end_time="23:59"):
 
     Params:
         df: options data Dataframe
-        ticker: string, specifying the option, e.g. 'O:SPY250307C00578000'
+        ticker: string, specifying the option, e.g. 'O:SPY250307C00578000', or the integer
+            contract key of the option (see 'contract_key')
         start_time: time, from which one option data should be returned
         end_time: time, until which option data should be returned
+        contract_rows: optional result of 'index_contracts(df)' for lookups by contract key
     
     Returns:
         df: options data for ticker
     """
-    filtered_df = df[df["ticker"] == ticker].copy()
+    if isinstance(ticker, str):
+        filtered_df = df[df["ticker"] == ticker].copy()
+    elif contract_rows is not None:
+        filtered_df = df.iloc[contract_rows.get(ticker, [])].copy()
+    else:
+        filtered_df = df[df["contract"] == ticker].copy()
     
     filtered_df["Datetime"] = pd.to_datetime(filtered_df["Datetime"])  
     filtered_df["Time"] = filtered_df["Datetime"].dt.time  # get time component of datetime column
@@ -52,6 +121,19 @@ def get_option(df, ticker, start_time="00:00", end_time="23:59"):
     return filtered_df.drop(columns=["Time"])  # Drop time column if not needed
 
 
+@lru_cache(maxsize=None)
+def get_polygon_client(api_key=None):
+    """
+    Returns a polygon RESTClient, created once per api key so its connection pool is reused.
+    The api key defaults to the environment variable 'POLYGON_API_KEY'.
+    """
+    api_key = api_key or os.environ.get("POLYGON_API_KEY")
+    if not api_key:
+        raise ValueError("Set the environment variable 'POLYGON_API_KEY' to your polygon api key.")
+    from polygon import RESTClient  # imported here, only needed for api requests
+    return RESTClient(api_key)
+
+
 def get_option_api(ticker, date):
     """
     Get option data via polygon api (not loading from local file).
@@ -71,7 +153,7 @@ def get_option_api(ticker, date):
     date = date.strftime("%Y-%m-%d")
     next_day = next_day.strftime("%Y-%m-%d")
     
-    client = RESTClient("1qCvKyfRajf_ewGpw2ryraerx5Ct_MAB")
+    client = get_polygon_client()
     aggs = []
     for a in client.list_aggs(
         ticker,
@@ -155,27 +237,38 @@ def calculate_spread_strike_prices(index_price, spread_type, spread_width=20, en
         raise ValueError("Invalid spread type. Use 'Bull Put' or 'Bear Call'.")
     
 
-def get_option_ticker(date, option_type, strike_price):
+def get_option_ticker(date, option_type, strike_price, underlying="SPY"):
     """
     Returns ticker as string
 
     Params:
         date: Datetime object, indicating expiration date of option
         option_type: either C for Bear Call or P for Bull Put
-        strike_price: strike price of the option
+        strike_price: strike price of the option, in the scale of the data (see UNDERLYING_PRICE_SCALE)
+        underlying: root symbol of the option, e.g. 'SPY' or 'SPXW'
     """
     if option_type == "Bull Put":
         option_type = "P"
     elif option_type == "Bear Call":
         option_type = "C"
 
+    # OCC strike field: listed strike price * 1000
+    scale = UNDERLYING_PRICE_SCALE.get(underlying, 1)
     formatted_date = date.strftime("%y%m%d")
-    formatted_strike = f"{int(strike_price * 100):08d}"
-    ticker = f"O:SPY{formatted_date}{option_type}{formatted_strike}"
+    formatted_strike = f"{round(strike_price / scale * 1000):08d}"
+    ticker = f"O:{underlying}{formatted_date}{option_type}{formatted_strike}"
     
     return ticker
 
 
+def to_utc_ns(datetimes):
+    """
+    Converts a series of datetimes (naive datetimes are treated as UTC) to int64 nanoseconds since
+    epoch. Used to compare timestamps of index data (timezone aware) and options data (naive UTC).
+    """
+    return pd.to_datetime(datetimes, utc=True).astype("int64").to_numpy()
+
+
 def calculate_spread_ohlc(short_option_df, long_option_df):
     """
     Calculate the OHLC chart for a bull put or bear call spread.
@@ -256,7 +349,48 @@ def fill_missing_minutes(df: pd.DataFrame) -> pd.DataFrame:
         return df
 
 
-def get_spreads(signals, date, start_time, end_time, enforce_ITM=True, middle_ITM=False, enforce_OTM=False):
+def select_spread_strikes_from_chain(snapshot, timestamp, index_price, spread_type, spread_width=20, select_by_premium=False, target_premium=10):
+    """
+    Selects the strike prices of a spread from the listed strikes of a 'ChainSnapshot' instead of rounding
+    the index price.
+
+    Params:
+        snapshot: ChainSnapshot of the day
+        timestamp: time of the entry signal
+        index_price: current index price
+        spread_type: Either 'Bull Put' or 'Bear Call'
+        spread_width: Distance between the sold and the bought strike. The bought strike is the listed strike
+            closest to that distance.
+        select_by_premium: If True, the sold option is the one whose last price is closest to 'target_premium'.
+            If False, the sold option is the listed strike closest to the index price.
+        target_premium: Option price for 'select_by_premium', in the scale of the options data.
+
+    Returns:
+        A tuple (strike_sell, strike_buy) or None if the chain has no fitting strikes at that time.
+    """
+    if spread_type == 'Bull Put':
+        right, direction = "P", -1
+    elif spread_type == 'Bear Call':
+        right, direction = "C", 1
+    else:
+        raise ValueError("Invalid spread type. Use 'Bull Put' or 'Bear Call'.")
+
+    if select_by_premium:
+        sold = snapshot.by_target_price(timestamp, right, target_premium)
+    else:
+        sold = snapshot.nearest_strike(timestamp, right, index_price)
+    if sold is None:
+        return None
+
+    bought = snapshot.nearest_strike(timestamp, right, sold[0] + direction * spread_width)
+    if bought is None or bought[0] == sold[0]:
+        return None
+
+    return (sold[0], bought[0])
+
+
+def get_spreads(signals, date, start_time, end_time, enforce_ITM=True, middle_ITM=False, enforce_OTM=False,
+                select_by_premium=False, target_premium=10, select_nearest_listed=False, underlying="SPY", spread_width=20):
     """
     Get all necessary options data for the required spreads, based on the signals calculated by the strategy.
 
@@ -264,62 +398,121 @@ def get_spreads(signals, date, start_time, end_time, enforce_ITM=True, middle_IT
         df: All SPY options data for the desired day.
         signals: Bull put and Bear call entry signals calculated by strategy.
         date: Datetime object for desired date.
+        select_by_premium: If True, strikes are selected from the option chain at signal time by the price of
+            the sold option (see 'select_spread_strikes_from_chain'). Overrides the ITM / OTM options.
+        select_nearest_listed: If True, the sold strike is the listed strike closest to the index price.
+        underlying: root symbol of the options, e.g. 'SPY' or 'SPXW'
+        spread_width: Difference between the strike prices of the two options, in the scale of the data.
 
     Returns:
         Spreads dictionary if option data is available for the given date.
         None if not option data is available for the given date.
     """
-    spreads = {}
+    spreads = get_spreads_for_widths(signals, date, start_time, end_time, [spread_width], enforce_ITM=enforce_ITM,
+                                     middle_ITM=middle_ITM, enforce_OTM=enforce_OTM, select_by_premium=select_by_premium,
+                                     target_premium=target_premium, select_nearest_listed=select_nearest_listed,
+                                     underlying=underlying)
+    return None if spreads is None else spreads[spread_width]
+
+
+def get_spreads_for_widths(signals, date, start_time, end_time, spread_widths, enforce_ITM=True, middle_ITM=False,
+                           enforce_OTM=False, select_by_premium=False, target_premium=10, select_nearest_listed=False,
+                           underlying="SPY"):
+    """
+    Same as 'get_spreads' for several spread widths at once. The options data of the day is loaded and indexed
+    only once, and the OHLC data of every option is built only once, even if it is a leg of spreads of several
+    widths (e.g. the sold option, which usually does not depend on the width).
+
+    Params:
+        spread_widths: list of spread widths, in the scale of the data
+        (see 'get_spreads' for the other parameters)
+
+    Returns:
+        Dictionary, spread width -> spreads dictionary (as returned by 'get_spreads').
+        None if not option data is available for the given date.
+    """
     signals = signals[
         (signals['entry_bull_put']) |
         (signals['entry_bear_call']) |
         (signals['exit_bull_put']) | 
         (signals['exit_bear_call'])
     ]
-    df = load_options_from_file(date)
-    if df is None:
+    # imported here, data.sources depends on this module
+    from data.sources import get_data_source, time_window_ns
+    source = get_data_source()
+    # the availability index of the day (if built at ingest) tells which legs have bars in the time
+    # window, so spreads with missing legs are dropped before any option data is read
+    availability = source.load_availability(date, underlying)
+    if availability is None and not source.has_options(date, underlying):
         return None
-    
+    price_scale = UNDERLYING_PRICE_SCALE.get(underlying, 1)
+    window = time_window_ns(date, start_time, end_time)
+
+    def is_available(option_type, strike_price):
+        return availability is None or availability.available(option_type, strike_price, price_scale, *window)
+
+    snapshot = None
+    if select_by_premium or select_nearest_listed:
+        from utils.chain_snapshot import ChainSnapshot  # imported here, chain_snapshot depends on this module
+        # the day the source keeps for the legs of the spreads, not a second read of the file
+        snapshot = ChainSnapshot(date, source.load_day_options(date, underlying))
+
+    # option ohlc data by contract key, shared by the spreads of all widths. The data source
+    # only reads the bars of the contract within the time window.
+    option_ohlc = {}
+
+    def get_option_ohlc(option_type, strike_price):
+        contract = contract_key(date, option_type, strike_price, underlying, price_scale)
+        if contract not in option_ohlc:
+            ohlc = source.get_option(date, contract, start_time, end_time, underlying)
+            # fill missing OHLC data to align timestamps, None if the contract has no bars
+            option_ohlc[contract] = None if ohlc is None or ohlc.empty else fill_missing_minutes(ohlc)
+        return option_ohlc[contract]
+
+    spreads = {spread_width: {} for spread_width in spread_widths}
     for index, row in signals.iterrows():    
         timestamp = row["Datetime"]
 
         if row["entry_bull_put"]:
             spread_type="Bull Put"
-            spread = calculate_spread_strike_prices(row["Close"], spread_type, enforce_ITM=enforce_ITM, middle_ITM=middle_ITM, enforce_OTM=enforce_OTM)
-            sold_option_ticker = get_option_ticker(date, "P", spread[0])  # higher strike price
-            bought_option_ticker = get_option_ticker(date, "P", spread[1])  # lower strike price
-            
+            option_type="P"  # sold option has the higher strike price
         elif row["entry_bear_call"]:
             spread_type="Bear Call"
-            spread = calculate_spread_strike_prices(row["Close"], spread_type, enforce_ITM=enforce_ITM, middle_ITM=middle_ITM, enforce_OTM=enforce_OTM)
-            sold_option_ticker = get_option_ticker(date, "C", spread[0])  # lower strike price
-            bought_option_ticker = get_option_ticker(date, "C", spread[1])  # higher strike price
-        
+            option_type="C"  # sold option has the lower strike price
         else:
             continue
 
-        sold_option_ohlc = get_option(df, sold_option_ticker, start_time, end_time)
-        bought_option_ohlc = get_option(df, bought_option_ticker, start_time, end_time)
-
-        # skip if either of the option's data is not available
-        if sold_option_ohlc.empty or bought_option_ohlc.empty:
-            continue
-
-        # fill missing OHLC data to align timestamps
-        sold_option_ohlc = fill_missing_minutes(sold_option_ohlc)
-        bought_option_ohlc = fill_missing_minutes(bought_option_ohlc)
-
-        # calculate spread OHLC
-        spread_ohlc = calculate_spread_ohlc(bought_option_ohlc, sold_option_ohlc)
-        
-        # Store results in dictionary
-        spreads[timestamp] = {
-            "spread_type": spread_type,
-            "sold_option_price": spread[0],
-            "bought_option_price": spread[1],
-            "sold_option_ohlc": sold_option_ohlc,
-            "bought_option_ohlc": bought_option_ohlc,
-            "spread_ohlc": spread_ohlc
-        }
-
-    return spreads
\ No newline at end of file
+        for spread_width in spread_widths:
+            if snapshot is not None:
+                spread = select_spread_strikes_from_chain(snapshot, timestamp, row["Close"], spread_type, spread_width=spread_width,
+                                                          select_by_premium=select_by_premium, target_premium=target_premium)
+                if spread is None:
+                    continue
+            else:
+                spread = calculate_spread_strike_prices(row["Close"], spread_type, spread_width=spread_width, enforce_ITM=enforce_ITM,
+                                                        middle_ITM=middle_ITM, enforce_OTM=enforce_OTM)
+
+            if not (is_available(option_type, spread[0]) and is_available(option_type, spread[1])):
+                continue
+
+            sold_option_ohlc = get_option_ohlc(option_type, spread[0])
+            bought_option_ohlc = get_option_ohlc(option_type, spread[1])
+
+            # skip if either of the option's data is not available
+            if sold_option_ohlc is None or bought_option_ohlc is None:
+                continue
+
+            # calculate spread OHLC
+            spread_ohlc = calculate_spread_ohlc(bought_option_ohlc, sold_option_ohlc)
+
+            # Store results in dictionary
+            spreads[spread_width][timestamp] = {
+                "spread_type": spread_type,
+                "sold_option_price": spread[0],
+                "bought_option_price": spread[1],
+                "sold_option_ohlc": sold_option_ohlc,
+                "bought_option_ohlc": bought_option_ohlc,
+                "spread_ohlc": spread_ohlc
+            }
+
+    return spreads
@@ -70,6 +70,7 @@ def summarize_trades(trades_dict):
     - total profit
     - win rate
     - profite per trade
+    - profits per day and per trade in chronological order (e.g. for utils/robustness.py)
 
     Params:
         trades_dict: Ordered Dict, with dates as keys and dictionaries containing 
@@ -95,6 +96,7 @@ def summarize_trades(trades_dict):
     bc_trades_per_day = []
     spread_availability_per_day = []
     profit_per_day = []
+    trade_profits = []
     
     for date, trades in trades_dict.items():
         total_trades = len(trades["trades"])
@@ -112,6 +114,7 @@ def summarize_trades(trades_dict):
 
             individual_profit = trade['profit']
             total_profit += individual_profit
+            trade_profits.append((date, individual_profit))
 
         bp_trades_per_day.append((date, bp_trades))
         bc_trades_per_day.append((date, bc_trades))
@@ -153,7 +156,9 @@ def summarize_trades(trades_dict):
         "total_wins": total_wins,
         "total_losses": total_losses,
         "win_rate": win_rate,
-        "profit_per_trade": profit_per_trade
+        "profit_per_trade": profit_per_trade,
+        "profits_per_day": results_per_day["profit per day"].astype(float).tolist(),
+        "profits_per_trade": [float(entry[1]) for entry in sorted(trade_profits, key=lambda entry: entry[0])]
     }
 
     return results, results_per_day
@@ -0,0 +1,199 @@
+# Robustness of evaluation results: confidence intervals from block bootstrap resamples of the daily
+# profits and from random permutations of the trade order, each computed as one numpy array operation
+import multiprocessing
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+"""Trading days per year, to annualize the Sharpe ratio of daily profits."""
+TRADING_DAYS = 252
+
+"""Quantiles that are reported for every statistic: 90% confidence interval and median."""
+QUANTILES = (0.05, 0.5, 0.95)
+
+
+def max_drawdowns(profits):
+    """
+    Returns the maximum drawdown (largest drop of the cumulative profit from its running peak) of every
+    row of a 2d array of profits. The equity starts at zero, so a loss on the first day is a drawdown.
+    """
+    equity = np.cumsum(profits, axis=1)
+    drawdowns = np.maximum.accumulate(equity, axis=1)
+    np.maximum(drawdowns, 0, out=drawdowns)
+    drawdowns -= equity
+    return drawdowns.max(axis=1)
+
+
+def sharpe_ratios(profits, periods=TRADING_DAYS):
+    """Returns the annualized Sharpe ratio of every row of a 2d array of daily profits (0 without variance)."""
+    std = profits.std(axis=1, ddof=1)
+    mean = profits.mean(axis=1)
+    return np.divide(mean, std, out=np.zeros_like(mean), where=std > 0) * np.sqrt(periods)
+
+
+def block_bootstrap_indices(n, n_resamples, block_size, rng):
+    """
+    Returns an (n_resamples, n) array of indices of a circular block bootstrap: every resample is made of
+    random blocks of 'block_size' consecutive days, so losing streaks and volatility clusters are kept.
+    """
+    block_size = max(1, min(block_size, n))
+    n_blocks = -(-n // block_size)
+    starts = rng.integers(0, n, size=(n_resamples, n_blocks))
+    indices = (starts[:, :, None] + np.arange(block_size)) % n
+    return indices.reshape(n_resamples, n_blocks * block_size)[:, :n]
+
+
+def bootstrap_statistics(daily_profits, n_resamples, block_size=5, seed=None):
+    """
+    Resamples the daily profits with a block bootstrap and returns the statistics of every resample.
+
+    Returns:
+        Dictionary, statistic -> array of n_resamples values ('total_profit', 'avg_profit_per_day',
+        'win_rate_days' (share of days with a profit), 'max_drawdown', 'sharpe_ratio')
+    """
+    profits = np.asarray(daily_profits, dtype=np.float64)
+    rng = np.random.default_rng(seed)
+    samples = profits[block_bootstrap_indices(len(profits), n_resamples, block_size, rng)]
+    return {
+        "total_profit": samples.sum(axis=1),
+        "avg_profit_per_day": samples.mean(axis=1),
+        "win_rate_days": (samples > 0).mean(axis=1),
+        "max_drawdown": max_drawdowns(samples),
+        "sharpe_ratio": sharpe_ratios(samples)
+    }
+
+
+def permutation_statistics(trade_profits, n_resamples, seed=None):
+    """
+    Shuffles the order of the trades and returns the maximum drawdown of every permutation. The total
+    profit and the win rate do not depend on the order, the drawdown shows how much of the observed
+    drawdown was luck of the sequence.
+
+    Returns:
+        Dictionary, 'trade_max_drawdown' -> array of n_resamples values
+    """
+    profits = np.asarray(trade_profits, dtype=np.float64)
+    rng = np.random.default_rng(seed)
+    samples = rng.permuted(np.broadcast_to(profits, (n_resamples, len(profits))), axis=1)
+    return {"trade_max_drawdown": max_drawdowns(samples)}
+
+
+def trade_bootstrap_statistics(trade_profits, n_resamples, seed=None):
+    """
+    Resamples single trades (with replacement) and returns the win rate and profit per trade of every
+    resample.
+    """
+    profits = np.asarray(trade_profits, dtype=np.float64)
+    rng = np.random.default_rng(seed)
+    samples = profits[rng.integers(0, len(profits), size=(n_resamples, len(profits)))]
+    return {"win_rate": (samples > 0).mean(axis=1), "profit_per_trade": samples.mean(axis=1)}
+
+
+def _chunk_statistics(task):
+    daily_profits, trade_profits, n_resamples, block_size, seed = task  # seed: SeedSequence of the chunk
+    # independent streams for the three kinds of resamples of the chunk
+    seeds = seed.spawn(3)
+    statistics = {}
+    if len(daily_profits) > 0:
+        statistics.update(bootstrap_statistics(daily_profits, n_resamples, block_size, seeds[0]))
+    if len(trade_profits) > 0:
+        statistics.update(trade_bootstrap_statistics(trade_profits, n_resamples, seeds[1]))
+        statistics.update(permutation_statistics(trade_profits, n_resamples, seeds[2]))
+    return statistics
+
+
+def resample_statistics(daily_profits, trade_profits, n_resamples=10000, block_size=5, chunk_size=2000, processes=None, seed=None):
+    """
+    Computes the statistics of n_resamples block bootstrap resamples of the daily profits and of the
+    trades, and of n_resamples permutations of the trade order. The resamples are computed in chunks of
+    'chunk_size' (bounded memory), in parallel if 'processes' is given. The result only depends on the
+    seed and the chunk size, not on the number of processes.
+
+    Params:
+        daily_profits: profit of every trading day in chronological order
+        trade_profits: profit of every trade in chronological order
+        block_size: number of consecutive days of a bootstrap block
+
+    Returns:
+        Dictionary, statistic -> array of n_resamples values
+    """
+    chunks = [min(chunk_size, n_resamples - start) for start in range(0, n_resamples, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    daily_profits = np.asarray(daily_profits, dtype=np.float64)
+    trade_profits = np.asarray(trade_profits, dtype=np.float64)
+    tasks = [(daily_profits, trade_profits, size, block_size, chunk_seed) for size, chunk_seed in zip(chunks, seeds)]
+
+    if processes is None or len(tasks) == 1:
+        results = list(map(_chunk_statistics, tasks))
+    else:
+        with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("spawn")) as executor:
+            results = list(executor.map(_chunk_statistics, tasks))
+    return {key: np.concatenate([result[key] for result in results]) for key in (results[0] if results else {})}
+
+
+def observed_statistics(daily_profits, trade_profits):
+    """Returns the statistics of the actual results, in the same keys as 'resample_statistics'."""
+    daily = np.asarray(daily_profits, dtype=np.float64)[None, :]
+    trades = np.asarray(trade_profits, dtype=np.float64)[None, :]
+    statistics = {}
+    if daily.size > 0:
+        statistics.update({"total_profit": daily.sum(), "avg_profit_per_day": daily.mean(), "win_rate_days": (daily > 0).mean(),
+                           "max_drawdown": max_drawdowns(daily)[0], "sharpe_ratio": sharpe_ratios(daily)[0]})
+    if trades.size > 0:
+        statistics.update({"win_rate": (trades > 0).mean(), "profit_per_trade": trades.mean(),
+                           "trade_max_drawdown": max_drawdowns(trades)[0]})
+    return statistics
+
+
+def confidence_intervals(statistics, observed=None, quantiles=QUANTILES):
+    """
+    Returns a DataFrame with one row per statistic: the observed value, the quantiles of the resamples
+    (e.g. 'p5', 'p50', 'p95'), the mean and the share of resamples with a value of at most zero.
+    """
+    rows = []
+    for key, values in statistics.items():
+        row = {"statistic": key, "observed": (observed or {}).get(key, np.nan)}
+        row.update({f"p{q * 100:g}": value for q, value in zip(quantiles, np.quantile(values, quantiles))})
+        row.update({"mean": values.mean(), "p_le_zero": (values <= 0).mean()})
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def robustness_report(month_results, n_resamples=10000, block_size=5, processes=None, seed=None):
+    """
+    Computes the confidence intervals of the results of 'run_eval_months'.
+
+    Params:
+        month_results: list of (file_name, signal_stats, trade_stats), the trade stats contain the profits
+            per day and per trade (see 'summarize_trades')
+
+    Returns:
+        (metrics dictionary, e.g. 'robust/total_profit_p5', DataFrame of 'confidence_intervals')
+    """
+    daily_profits = [profit for _, _, trade_stats in month_results for profit in trade_stats.get("profits_per_day", [])]
+    trade_profits = [profit for _, _, trade_stats in month_results for profit in trade_stats.get("profits_per_trade", [])]
+    if not daily_profits:
+        return {}, pd.DataFrame()
+
+    statistics = resample_statistics(daily_profits, trade_profits, n_resamples, block_size, processes=processes, seed=seed)
+    intervals = confidence_intervals(statistics, observed_statistics(daily_profits, trade_profits))
+    metrics = {f"robust/{row['statistic']}_{column}": row[column]
+               for row in intervals.to_dict(orient="records") for column in intervals.columns if column.startswith("p")}
+    return metrics, intervals
+
+
+def log_robustness(run, month_results, n_resamples=10000, block_size=5, processes=None, seed=None):
+    """
+    Logs the confidence intervals of the results of 'run_eval_months' to a run: the quantiles as metrics
+    and the table of all statistics as the artifact 'robustness.json'.
+
+    Returns:
+        The logged metrics
+    """
+    metrics, intervals = robustness_report(month_results, n_resamples, block_size, processes, seed)
+    if metrics:
+        run.log_params({"robust/RESAMPLES": n_resamples, "robust/BLOCK_SIZE": block_size})
+        run.log_metrics(metrics)
+        run.log_table(data=intervals, artifact_file="robustness.json")
+        print(intervals)
+    return metrics